@@ -0,0 +1,242 @@
+const db = require('./index');
+
+// Registro de esquema: cada tabla que los repos crean "on demand" se declara
+// aquí una sola vez. ensure(name) ejecuta su DDL como mucho una vez por proceso
+// (la promesa queda memoizada) y, si las migraciones knex que la cubren ya
+// están aplicadas en knex_migrations, no ejecuta DDL alguno.
+const defs = new Map(); // name -> { migrations, run, promise, ready, source, error }
+let appliedPromise = null;
+
+function define(name, { migrations = [], run }) {
+  defs.set(name, { migrations, run, promise: null, ready: false, source: null, error: null });
+}
+
+async function appliedMigrations() {
+  if (!appliedPromise) {
+    appliedPromise = db.query('SELECT name FROM knex_migrations')
+      .then((r) => new Set((r.rows || []).map((x) => String(x.name))))
+      .catch(() => new Set());
+  }
+  return appliedPromise;
+}
+
+async function runDef(name, d) {
+  if (d.migrations.length) {
+    const applied = await appliedMigrations();
+    if (d.migrations.every((m) => applied.has(m))) { d.source = 'migrations'; return; }
+  }
+  await d.run(db);
+  d.source = 'ddl';
+}
+
+async function ensure(name) {
+  const d = defs.get(name);
+  if (!d) throw new Error('schema_unknown:' + name);
+  if (d.ready) return;
+  if (!d.promise) {
+    d.promise = runDef(name, d)
+      .then(() => { d.ready = true; d.error = null; })
+      // Si falla se olvida la promesa para reintentar en la siguiente llamada
+      .catch((err) => { d.promise = null; d.error = String(err && err.message || err); throw err; });
+  }
+  return d.promise;
+}
+
+// Arranque: prepara todas las tablas registradas; los fallos no detienen el servidor
+async function bootstrap() {
+  const out = {};
+  for (const name of defs.keys()) {
+    try { await ensure(name); out[name] = true; } catch (_) { out[name] = false; }
+  }
+  return out;
+}
+
+function status() {
+  const out = {};
+  for (const [name, d] of defs) out[name] = { ready: d.ready, source: d.source, error: d.error };
+  return out;
+}
+
+define('app_kv', {
+  run: async (q) => {
+    await q.query(`CREATE TABLE IF NOT EXISTS app_kv(
+      key TEXT PRIMARY KEY,
+      value JSONB,
+      updated_at TIMESTAMPTZ DEFAULT NOW()
+    )`);
+  }
+});
+
+define('fire_supply', {
+  run: async (q) => {
+    await q.query(`CREATE TABLE IF NOT EXISTS fire_supply(
+      id SMALLINT PRIMARY KEY DEFAULT 1,
+      total_max NUMERIC(24,2) NOT NULL DEFAULT 1000000000,
+      emitted NUMERIC(24,2) NOT NULL DEFAULT 0,
+      updated_at TIMESTAMPTZ DEFAULT NOW()
+    )`);
+    await q.query('INSERT INTO fire_supply(id,total_max,emitted,updated_at) VALUES (1,1000000000,0,NOW()) ON CONFLICT (id) DO NOTHING');
+  }
+});
+
+// Contador de circulante repartido en filas para no serializar todas las
+// transacciones de wallet sobre una sola fila; se siembra con la suma actual.
+// supplyRepo.shardOf reparte con este mismo número de filas.
+const CIRC_SHARDS = 16;
+define('fire_supply_shards', {
+  run: async (q) => {
+    await q.query(`CREATE TABLE IF NOT EXISTS fire_supply_shards(
+      shard SMALLINT PRIMARY KEY,
+      circulating NUMERIC(24,2) NOT NULL DEFAULT 0,
+      updated_at TIMESTAMPTZ DEFAULT NOW()
+    )`);
+    await q.query(`INSERT INTO fire_supply_shards(shard, circulating, updated_at)
+      SELECT g, CASE WHEN g = 0 THEN (SELECT COALESCE(SUM(fires_balance),0) FROM wallets) ELSE 0 END, NOW()
+      FROM generate_series(0, ${CIRC_SHARDS - 1}) AS g
+      WHERE NOT EXISTS (SELECT 1 FROM fire_supply_shards)`);
+  }
+});
+
+define('welcome_claims', {
+  run: async (q) => {
+    await q.query(`CREATE TABLE IF NOT EXISTS welcome_claims(
+      user_ext TEXT PRIMARY KEY,
+      claimed_at TIMESTAMPTZ DEFAULT NOW()
+    )`);
+  }
+});
+
+define('welcome_events', {
+  migrations: ['20251020_0005_welcome_events.js'],
+  run: async (q) => {
+    await q.query(`CREATE TABLE IF NOT EXISTS welcome_events(
+      id SERIAL PRIMARY KEY,
+      name TEXT NOT NULL,
+      message TEXT NOT NULL,
+      coins INTEGER NOT NULL DEFAULT 0,
+      fires INTEGER NOT NULL DEFAULT 0,
+      duration_hours INTEGER NOT NULL DEFAULT 24,
+      starts_at TIMESTAMPTZ,
+      ends_at TIMESTAMPTZ,
+      active BOOLEAN NOT NULL DEFAULT FALSE,
+      created_by TEXT NOT NULL,
+      created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+      updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    )`);
+    await q.query(`CREATE TABLE IF NOT EXISTS welcome_event_history(
+      id SERIAL PRIMARY KEY,
+      event_id INTEGER NOT NULL REFERENCES welcome_events(id) ON DELETE CASCADE,
+      action TEXT NOT NULL,
+      actor TEXT NOT NULL,
+      payload JSONB,
+      created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    )`);
+    await q.query(`CREATE TABLE IF NOT EXISTS welcome_event_claims(
+      event_id INTEGER NOT NULL REFERENCES welcome_events(id) ON DELETE CASCADE,
+      user_ext TEXT NOT NULL,
+      claimed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+      PRIMARY KEY(event_id, user_ext)
+    )`);
+  }
+});
+
+define('supply_txs', {
+  migrations: ['20251020_0006_supply_txs.js', '20251021_0007_supply_txs_user_uuid.js', '20251022_0008_supply_txs_keyset_idx.js'],
+  run: async (q) => {
+    await ensure('welcome_events');
+    await q.query(`CREATE TABLE IF NOT EXISTS supply_txs(
+      id BIGSERIAL PRIMARY KEY,
+      ts TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+      type TEXT NOT NULL,
+      amount NUMERIC(24,2) NOT NULL DEFAULT 0,
+      user_ext TEXT,
+      user_id UUID,
+      event_id INTEGER REFERENCES welcome_events(id) ON DELETE SET NULL,
+      reference TEXT,
+      meta JSONB,
+      actor TEXT
+    )`);
+    // Corregir tipo de columna si fue creada previamente como INTEGER
+    const col = await q.query("SELECT data_type FROM information_schema.columns WHERE table_name='supply_txs' AND column_name='user_id'");
+    if (col.rows && col.rows[0] && col.rows[0].data_type !== 'uuid') {
+      try { await q.query('ALTER TABLE supply_txs ALTER COLUMN user_id TYPE uuid USING NULLIF(user_id::text, \'\')::uuid'); } catch(_) {}
+    }
+    await q.query('CREATE INDEX IF NOT EXISTS supply_txs_ts_idx ON supply_txs(ts)');
+    await q.query('CREATE INDEX IF NOT EXISTS supply_txs_type_idx ON supply_txs(type)');
+    await q.query('CREATE INDEX IF NOT EXISTS supply_txs_event_idx ON supply_txs(event_id)');
+    await q.query('CREATE INDEX IF NOT EXISTS supply_txs_userext_idx ON supply_txs(user_ext)');
+    // Índices compuestos para paginación keyset (ts,id) con y sin filtro
+    await q.query('CREATE INDEX IF NOT EXISTS supply_txs_ts_id_idx ON supply_txs(ts, id)');
+    await q.query('CREATE INDEX IF NOT EXISTS supply_txs_type_ts_id_idx ON supply_txs(type, ts, id)');
+    await q.query('CREATE INDEX IF NOT EXISTS supply_txs_userext_ts_id_idx ON supply_txs(user_ext, ts, id)');
+    await q.query('CREATE INDEX IF NOT EXISTS supply_txs_event_ts_id_idx ON supply_txs(event_id, ts, id)');
+  }
+});
+
+define('welcome_backfill', {
+  migrations: ['20251023_0009_welcome_backfill_idx.js'],
+  run: async (q) => {
+    await ensure('supply_txs');
+    await q.query("CREATE INDEX IF NOT EXISTS supply_txs_wallet_tx_idx ON supply_txs ((meta->>'wallet_tx_id'))");
+    await q.query("CREATE INDEX IF NOT EXISTS wallet_tx_welcome_bonus_idx ON wallet_transactions(created_at, id) WHERE type = 'welcome_bonus'");
+  }
+});
+
+define('market_redeems', {
+  run: async (q) => {
+    await q.query(`CREATE TABLE IF NOT EXISTS market_redeems(
+      id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+      user_ext TEXT NOT NULL,
+      amount NUMERIC(18,2) NOT NULL,
+      cedula TEXT,
+      telefono TEXT,
+      bank_code TEXT,
+      bank_name TEXT,
+      status TEXT NOT NULL DEFAULT 'pending', -- pending|accepted|rejected
+      created_at TIMESTAMPTZ DEFAULT NOW(),
+      processed_by TEXT,
+      processed_at TIMESTAMPTZ,
+      meta JSONB
+    )`);
+  }
+});
+
+define('fire_requests', {
+  run: async (q) => {
+    await q.query(`CREATE TABLE IF NOT EXISTS fire_requests(
+      id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+      user_ext TEXT NOT NULL,
+      amount NUMERIC(18,2) NOT NULL,
+      reference TEXT,
+      status TEXT NOT NULL DEFAULT 'pending', -- pending|accepted|rejected
+      created_at TIMESTAMPTZ DEFAULT NOW(),
+      processed_by TEXT,
+      processed_at TIMESTAMPTZ,
+      meta JSONB
+    )`);
+    // Cola de admin (pending) e historial por usuario paginados por keyset
+    await q.query('CREATE INDEX IF NOT EXISTS fire_requests_status_created_idx ON fire_requests(status, created_at, id)');
+    await q.query('CREATE INDEX IF NOT EXISTS fire_requests_user_created_idx ON fire_requests(user_ext, created_at, id)');
+  }
+});
+
+define('game_room_archive', {
+  run: async (q) => {
+    await q.query(`CREATE TABLE IF NOT EXISTS game_room_archive(
+      game TEXT NOT NULL, -- tictactoe|bingo
+      room_id TEXT NOT NULL,
+      code TEXT,
+      host_ext TEXT,
+      status TEXT NOT NULL,
+      reason TEXT NOT NULL, -- finished|idle
+      created_at TIMESTAMPTZ,
+      updated_at TIMESTAMPTZ,
+      archived_at TIMESTAMPTZ DEFAULT NOW(),
+      data JSONB,
+      PRIMARY KEY (game, room_id)
+    )`);
+    await q.query('CREATE INDEX IF NOT EXISTS game_room_archive_host_idx ON game_room_archive(host_ext, archived_at)');
+  }
+});
+
+module.exports = { define, ensure, bootstrap, status, CIRC_SHARDS };
@@ -0,0 +1,13 @@
+/**
+ * supply_txs.user_id se creó como integer; los repos guardan users.id (uuid)
+ */
+
+/** @param {import('knex').Knex} knex */
+exports.up = async function up(knex){
+  await knex.raw('ALTER TABLE supply_txs ALTER COLUMN user_id TYPE uuid USING NULLIF(user_id::text, \'\')::uuid');
+};
+
+/** @param {import('knex').Knex} knex */
+exports.down = async function down(knex){
+  await knex.raw('ALTER TABLE supply_txs ALTER COLUMN user_id TYPE integer USING NULL');
+};
@@ -0,0 +1,23 @@
+/**
+ * Índices compuestos (filtro, ts, id) para la paginación keyset de supply_txs
+ */
+
+/** @param {import('knex').Knex} knex */
+exports.up = async function up(knex){
+  await knex.schema.alterTable('supply_txs', (t)=>{
+    t.index(['ts', 'id'], 'supply_txs_ts_id_idx');
+    t.index(['type', 'ts', 'id'], 'supply_txs_type_ts_id_idx');
+    t.index(['user_ext', 'ts', 'id'], 'supply_txs_userext_ts_id_idx');
+    t.index(['event_id', 'ts', 'id'], 'supply_txs_event_ts_id_idx');
+  });
+};
+
+/** @param {import('knex').Knex} knex */
+exports.down = async function down(knex){
+  await knex.schema.alterTable('supply_txs', (t)=>{
+    t.dropIndex(['ts', 'id'], 'supply_txs_ts_id_idx');
+    t.dropIndex(['type', 'ts', 'id'], 'supply_txs_type_ts_id_idx');
+    t.dropIndex(['user_ext', 'ts', 'id'], 'supply_txs_userext_ts_id_idx');
+    t.dropIndex(['event_id', 'ts', 'id'], 'supply_txs_event_ts_id_idx');
+  });
+};
@@ -0,0 +1,16 @@
+/**
+ * Índices para el backfill de welcome_bonus: dedupe por meta->>'wallet_tx_id'
+ * y recorrido keyset (created_at, id) de wallet_transactions
+ */
+
+/** @param {import('knex').Knex} knex */
+exports.up = async function up(knex){
+  await knex.raw("CREATE INDEX IF NOT EXISTS supply_txs_wallet_tx_idx ON supply_txs ((meta->>'wallet_tx_id'))");
+  await knex.raw("CREATE INDEX IF NOT EXISTS wallet_tx_welcome_bonus_idx ON wallet_transactions(created_at, id) WHERE type = 'welcome_bonus'");
+};
+
+/** @param {import('knex').Knex} knex */
+exports.down = async function down(knex){
+  await knex.raw('DROP INDEX IF EXISTS wallet_tx_welcome_bonus_idx');
+  await knex.raw('DROP INDEX IF EXISTS supply_txs_wallet_tx_idx');
+};
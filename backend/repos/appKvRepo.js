@@ -1,11 +1,8 @@
 const db = require('../db');
+const schema = require('../db/schema');
 
 async function ensureTable(){
-  await db.query(`CREATE TABLE IF NOT EXISTS app_kv(
-    key TEXT PRIMARY KEY,
-    value JSONB,
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-  )`);
+  await schema.ensure('app_kv');
 }
 
 async function getJson(key){
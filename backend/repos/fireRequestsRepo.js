@@ -1,17 +1,11 @@
 const db = require('../db');
+const userResolver = require('../services/userResolver');
+const schema = require('../db/schema');
+const supplyHub = require('../services/supplyHub');
+const supplyRepo = require('./supplyRepo');
 
 async function ensureTables(){
-  await db.query(`CREATE TABLE IF NOT EXISTS fire_requests(
-    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-    user_ext TEXT NOT NULL,
-    amount NUMERIC(18,2) NOT NULL,
-    reference TEXT,
-    status TEXT NOT NULL DEFAULT 'pending', -- pending|accepted|rejected
-    created_at TIMESTAMPTZ DEFAULT NOW(),
-    processed_by TEXT,
-    processed_at TIMESTAMPTZ,
-    meta JSONB
-  )`);
+  await schema.ensure('fire_requests');
 }
 
 async function createRequest({ userExt, amount, reference, meta }){
@@ -21,35 +15,69 @@ async function createRequest({ userExt, amount, reference, meta }){
   return rs.rows && rs.rows[0];
 }
 
-async function listByUser(userExt, { limit=50, offset=0, status }={}){
-  await ensureTables();
+// Cursor opaco (created_at,id): created_at viaja como texto de Postgres para conservar microsegundos
+function encodeCursor(row){
+  return Buffer.from(JSON.stringify({ t: row.created_key, i: String(row.id) })).toString('base64url');
+}
+function decodeCursor(cursor){
+  try{
+    const c = JSON.parse(Buffer.from(String(cursor), 'base64url').toString('utf8'));
+    if (!c || typeof c.t !== 'string' || typeof c.i !== 'string' || !/^[0-9a-f-]{36}$/i.test(c.i)) return null;
+    return { t: c.t, id: c.i };
+  }catch(_){ return null; }
+}
+
+// Con cursor (aunque sea '' = primera página) se pagina por keyset sobre
+// (created_at,id) y se devuelve nextCursor; sin cursor, OFFSET clásico
+async function listPage(cond, args, { limit, offset, cursor }){
   const l = Math.max(1, Math.min(200, Number(limit)||50));
+  if (cursor !== undefined && cursor !== null){
+    if (cursor !== ''){
+      const c = decodeCursor(cursor); if (!c) throw new Error('invalid_cursor');
+      args.push(c.t, c.id); cond.push(`(created_at, id) < ($${args.length-1}::timestamptz, $${args.length}::uuid)`);
+    }
+    const where = cond.length ? `WHERE ${cond.join(' AND ')}` : '';
+    const rs = await db.query(`SELECT *, created_at::text AS created_key FROM fire_requests ${where} ORDER BY created_at DESC, id DESC LIMIT ${l + 1}`, args);
+    const rows = rs.rows || [];
+    const hasMore = rows.length > l;
+    const page = hasMore ? rows.slice(0, l) : rows;
+    const nextCursor = (hasMore && page.length) ? encodeCursor(page[page.length-1]) : null;
+    return { items: page.map(({ created_key, ...r }) => r), limit:l, nextCursor };
+  }
   const o = Math.max(0, Number(offset)||0);
-  const params = [String(userExt||''), l, o];
-  let where = 'WHERE user_ext=$1';
-  if (status){ params.unshift(String(status)); where = 'WHERE status=$1 AND user_ext=$2'; }
-  const rs = await db.query(`SELECT * FROM fire_requests ${where} ORDER BY created_at DESC LIMIT $${params.length-1} OFFSET $${params.length}`, params);
+  const where = cond.length ? `WHERE ${cond.join(' AND ')}` : '';
+  const rs = await db.query(`SELECT * FROM fire_requests ${where} ORDER BY created_at DESC, id DESC LIMIT ${l} OFFSET ${o}`, args);
   return { items: rs.rows||[], limit:l, offset:o };
 }
 
-async function listAll({ status, limit=50, offset=0 }={}){
+async function listByUser(userExt, { limit=50, offset=0, status, cursor }={}){
   await ensureTables();
-  const l = Math.max(1, Math.min(200, Number(limit)||50));
-  const o = Math.max(0, Number(offset)||0);
-  const params = [l, o];
-  let where = '';
-  if (status){ params.unshift(String(status)); where = 'WHERE status=$1'; }
-  const rs = await db.query(`SELECT * FROM fire_requests ${where} ORDER BY created_at DESC LIMIT $${params.length-1} OFFSET $${params.length}`, params);
-  return { items: rs.rows||[], limit:l, offset:o };
+  const cond = ['user_ext=$1']; const args = [String(userExt||'')];
+  if (status){ args.push(String(status)); cond.push(`status=$${args.length}`); }
+  return listPage(cond, args, { limit, offset, cursor });
+}
+
+async function listAll({ status, limit=50, offset=0, cursor }={}){
+  await ensureTables();
+  const cond = []; const args = [];
+  if (status){ args.push(String(status)); cond.push(`status=$${args.length}`); }
+  return listPage(cond, args, { limit, offset, cursor });
 }
 
 async function accept({ id, adminUserName }){
   await ensureTables();
+  // Resolver el usuario antes de tomar una conexión del pool: resolve() usa el pool y,
+  // con el cliente de la transacción retenido, podría esperar por una conexión libre
+  const pre = await db.query('SELECT user_ext FROM fire_requests WHERE id=$1', [id]);
+  if (!pre.rows || !pre.rows[0]) throw new Error('request_not_found');
+  const ext = String(pre.rows[0].user_ext||'');
+  const dbUserId = await userResolver.resolve(ext);
   const client = await db.pool.connect();
   try{
     await client.query('BEGIN');
     const rq = await client.query('SELECT * FROM fire_requests WHERE id=$1 FOR UPDATE', [id]);
     const rec = rq.rows && rq.rows[0]; if (!rec) throw new Error('request_not_found');
+    if (String(rec.user_ext||'') !== ext) throw new Error('user_changed');
     if (rec.status !== 'pending') throw new Error('request_not_pending');
     // supply check/update
     const sup = await client.query('SELECT total_max, emitted FROM fire_supply WHERE id=1 FOR UPDATE');
@@ -61,9 +89,6 @@ async function accept({ id, adminUserName }){
     const amt = Number(rec.amount||0);
     if (emitted + amt > totalMax) throw new Error('supply_exceeded');
     // map user ext -> db user
-    const ext = String(rec.user_ext||'');
-    let dbUserId = null;
-    if (ext.startsWith('db:')) dbUserId = ext.slice(3); else if (ext.startsWith('tg:')) { const tg = ext.slice(3); const r = await client.query('SELECT id FROM users WHERE tg_id=$1 LIMIT 1', [tg]); dbUserId = r.rows?.[0]?.id||null; }
     if (!dbUserId) throw new Error('user_not_mapped');
     // ensure wallet
     await client.query('INSERT INTO wallets(user_id, fires_balance, coins_balance, updated_at) VALUES ($1,0,0,NOW()) ON CONFLICT (user_id) DO NOTHING',[dbUserId]);
@@ -71,12 +96,14 @@ async function accept({ id, adminUserName }){
     const wid = w.rows?.[0]?.id; if (!wid) throw new Error('wallet_missing');
     // credit
     await client.query('UPDATE wallets SET fires_balance = fires_balance + $2, updated_at=NOW() WHERE id=$1', [wid, amt]);
+    await supplyRepo.adjustCirculating(client, wid, amt);
     await client.query('INSERT INTO wallet_transactions(wallet_id, type, amount_fire, reference, meta, created_at) VALUES ($1,$2,$3,$4,$5,NOW())', [wid, 'fire_request_accept', amt, String(rec.reference||''), { requestId: String(rec.id) }]);
     // update supply
     await client.query('UPDATE fire_supply SET emitted = emitted + $1, updated_at=NOW() WHERE id=1', [amt]);
     // update request
     await client.query('UPDATE fire_requests SET status=\'accepted\', processed_by=$2, processed_at=NOW() WHERE id=$1', [id, String(adminUserName||'admin')]);
     await client.query('COMMIT');
+    supplyHub.notify();
     return { ok:true };
   }catch(err){ try{ await client.query('ROLLBACK'); }catch(_){} throw err; }
   finally{ client.release(); }
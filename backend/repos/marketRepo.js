@@ -1,20 +1,11 @@
 const db = require('../db');
+const userResolver = require('../services/userResolver');
+const schema = require('../db/schema');
+const supplyHub = require('../services/supplyHub');
+const supplyRepo = require('./supplyRepo');
 
 async function ensureTables(){
-  await db.query(`CREATE TABLE IF NOT EXISTS market_redeems(
-    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-    user_ext TEXT NOT NULL,
-    amount NUMERIC(18,2) NOT NULL,
-    cedula TEXT,
-    telefono TEXT,
-    bank_code TEXT,
-    bank_name TEXT,
-    status TEXT NOT NULL DEFAULT 'pending', -- pending|accepted|rejected
-    created_at TIMESTAMPTZ DEFAULT NOW(),
-    processed_by TEXT,
-    processed_at TIMESTAMPTZ,
-    meta JSONB
-  )`);
+  await schema.ensure('market_redeems');
 }
 
 async function createRedeem({ userExt, amount, cedula, telefono, bankCode, bankName, meta }){
@@ -48,16 +39,21 @@ async function listAll({ status, limit=50, offset=0 }={}){
 
 async function accept({ id, adminUserName }){
   await ensureTables();
+  try { await schema.ensure('supply_txs'); } catch(_) {}
+  // Resolver el usuario antes de tomar una conexión del pool: resolve() usa el pool y,
+  // con el cliente de la transacción retenido, podría esperar por una conexión libre
+  const pre = await db.query('SELECT user_ext FROM market_redeems WHERE id=$1', [id]);
+  if (!pre.rows || !pre.rows[0]) throw new Error('redeem_not_found');
+  const ext = String(pre.rows[0].user_ext||'');
+  const dbUserId = await userResolver.resolve(ext);
   const client = await db.pool.connect();
   try{
     await client.query('BEGIN');
     const rq = await client.query('SELECT * FROM market_redeems WHERE id=$1 FOR UPDATE', [id]);
     const rec = rq.rows && rq.rows[0]; if (!rec) throw new Error('redeem_not_found');
+    if (String(rec.user_ext||'') !== ext) throw new Error('user_changed');
     if (rec.status !== 'pending') throw new Error('redeem_not_pending');
     const amt = Number(rec.amount||0);
-    const ext = String(rec.user_ext||'');
-    let dbUserId = null;
-    if (ext.startsWith('db:')) dbUserId = ext.slice(3); else if (ext.startsWith('tg:')) { const tg = ext.slice(3); const r = await client.query('SELECT id FROM users WHERE tg_id=$1 LIMIT 1', [tg]); dbUserId = r.rows?.[0]?.id||null; }
     if (!dbUserId) throw new Error('user_not_mapped');
     // ensure wallet and debit
     await client.query('INSERT INTO wallets(user_id, fires_balance, coins_balance, updated_at) VALUES ($1,0,0,NOW()) ON CONFLICT (user_id) DO NOTHING',[dbUserId]);
@@ -65,28 +61,16 @@ async function accept({ id, adminUserName }){
     const row = w.rows && w.rows[0]; if (!row) throw new Error('wallet_missing');
     const bal = Number(row.fires_balance||0); if (bal < amt) throw new Error('insufficient_fires');
     await client.query('UPDATE wallets SET fires_balance = fires_balance - $2, updated_at=NOW() WHERE id=$1', [row.id, amt]);
+    await supplyRepo.adjustCirculating(client, row.id, -amt);
     await client.query('INSERT INTO wallet_transactions(wallet_id, type, amount_fire, reference, meta, created_at) VALUES ($1,$2,$3,$4,$5,NOW())', [row.id, 'market_redeem', -amt, String(id), { marketRedeemId: String(id) }]);
     // Auditoría supply: registrar burn por canje de mercado
-    try {
-      await client.query(`CREATE TABLE IF NOT EXISTS supply_txs(
-        id BIGSERIAL PRIMARY KEY,
-        ts TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-        type TEXT NOT NULL,
-        amount NUMERIC(24,2) NOT NULL DEFAULT 0,
-        user_ext TEXT,
-        user_id UUID,
-        event_id INTEGER,
-        reference TEXT,
-        meta JSONB,
-        actor TEXT
-      )`);
-    } catch(_) {}
     try {
       await client.query('INSERT INTO supply_txs(ts,type,amount,user_ext,user_id,reference,meta,actor) VALUES (NOW(),$1,$2,$3,$4,$5,$6,$7)',
         ['burn_market_redeem', amt, String(rec.user_ext||''), dbUserId, String(id), { marketRedeemId: String(id) }, String(adminUserName||'admin')]);
     } catch(_) {}
     await client.query('UPDATE market_redeems SET status=\'accepted\', processed_by=$2, processed_at=NOW() WHERE id=$1', [id, String(adminUserName||'admin')]);
     await client.query('COMMIT');
+    supplyHub.notify();
     return { ok:true };
   }catch(err){ try{ await client.query('ROLLBACK'); }catch(_){} throw err; }
   finally{ client.release(); }
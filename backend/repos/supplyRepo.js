@@ -1,16 +1,9 @@
 const db = require('../db');
+const schema = require('../db/schema');
+const supplyHub = require('../services/supplyHub');
 
 async function ensureTable(){
-  await db.query(`CREATE TABLE IF NOT EXISTS fire_supply(
-    id SMALLINT PRIMARY KEY DEFAULT 1,
-    total_max NUMERIC(24,2) NOT NULL DEFAULT 1000000000,
-    emitted NUMERIC(24,2) NOT NULL DEFAULT 0,
-    updated_at TIMESTAMPTZ DEFAULT NOW()
-  )`);
-  const rs = await db.query('SELECT 1 FROM fire_supply WHERE id=1');
-  if (!rs.rows || !rs.rows[0]){
-    await db.query('INSERT INTO fire_supply(id,total_max,emitted,updated_at) VALUES (1,1000000000,0,NOW())');
-  }
+  await schema.ensure('fire_supply');
 }
 
 async function getStatus(){
@@ -23,6 +16,7 @@ async function getStatus(){
 async function setMax(total){
   await ensureTable();
   await db.query('UPDATE fire_supply SET total_max=$1, updated_at=NOW() WHERE id=1',[Number(total||0)]);
+  supplyHub.notify();
   return getStatus();
 }
 
@@ -44,16 +38,65 @@ async function emit(amount){
     await db.query('UPDATE fire_supply SET emitted = emitted - $1, updated_at=NOW() WHERE id=1',[a]);
     return { ok:false, error:'supply_exceeded' };
   }
+  supplyHub.notify();
   return { ok:true };
 }
 
+// -------- Circulante incremental --------
+// fire_supply_shards guarda SUM(wallets.fires_balance) repartido en CIRC_SHARDS filas
+// (definido junto a su DDL en db/schema). Toda mutación de fires_balance llama a
+// adjustCirculating dentro de su misma transacción.
+const { CIRC_SHARDS } = schema;
+
+function shardOf(key){
+  const s = String(key||''); let h = 0;
+  for (let i=0;i<s.length;i++){ h = ((h*31) + s.charCodeAt(i)) | 0; }
+  return Math.abs(h) % CIRC_SHARDS;
+}
+
+async function circulatingReady(){
+  try{ await schema.ensure('fire_supply_shards'); return true; }catch(_){ return false; }
+}
+
+// client: conexión de la transacción en curso (o db); key: id de wallet
+async function adjustCirculating(client, key, delta){
+  const d = Number(delta||0); if (!d) return;
+  if (!(await circulatingReady())) return;
+  await (client||db).query('UPDATE fire_supply_shards SET circulating = circulating + $2, updated_at=NOW() WHERE shard=$1', [shardOf(key), d]);
+}
+
+async function getCirculating(){
+  if (await circulatingReady()){
+    const r = await db.query('SELECT COALESCE(SUM(circulating),0) AS s FROM fire_supply_shards');
+    return Number(r.rows && r.rows[0] && r.rows[0].s || 0);
+  }
+  const r = await db.query('SELECT COALESCE(SUM(fires_balance),0) AS s FROM wallets');
+  return Number(r.rows && r.rows[0] && r.rows[0].s || 0);
+}
+
+let lastDriftCheck = null;
+
+// Recuento completo (job en segundo plano). Ambas sumas salen de la misma
+// instantánea; la corrección se aplica como delta para no pisar mutaciones concurrentes.
+async function rederiveCirculating({ fix=true }={}){
+  if (!(await circulatingReady())) return null;
+  const r = await db.query('SELECT (SELECT COALESCE(SUM(circulating),0) FROM fire_supply_shards) AS counted, (SELECT COALESCE(SUM(fires_balance),0) FROM wallets) AS actual');
+  const counted = Number(r.rows?.[0]?.counted||0); const actual = Number(r.rows?.[0]?.actual||0);
+  const drift = counted - actual;
+  if (fix && drift !== 0){
+    await db.query('UPDATE fire_supply_shards SET circulating = circulating + $1, updated_at=NOW() WHERE shard=0', [-drift]);
+    supplyHub.notify();
+  }
+  lastDriftCheck = { at: Date.now(), counted, actual, drift, fixed: !!(fix && drift !== 0) };
+  return lastDriftCheck;
+}
+
+function getLastDriftCheck(){ return lastDriftCheck; }
+
 async function getDashboardSnapshot(){
   const st = await getStatus();
   let sum = 0;
-  try {
-    const r = await db.query('SELECT COALESCE(SUM(fires_balance),0) AS s FROM wallets');
-    sum = Number(r.rows && r.rows[0] && r.rows[0].s || 0);
-  } catch (_) { sum = 0; }
+  try { sum = await getCirculating(); } catch (_) { sum = 0; }
   const total = Number(st.totalMax||0);
   const emitted = Number(st.emitted||0);
   const circulating = Math.max(0, sum);
@@ -65,41 +108,57 @@ async function getDashboardSnapshot(){
 function parseDate(d){ if(!d) return null; const n=Number(d); if(!Number.isNaN(n) && n>0) return new Date(n); try{ const dt=new Date(String(d)); return isNaN(dt.getTime())? null : dt; }catch(_){ return null; } }
 
 async function ensureSupplyTxsTable(){
+  try{ await schema.ensure('supply_txs'); }catch(_){ }
+}
+
+// Cursor opaco (ts,id): ts viaja como texto de Postgres para conservar microsegundos
+function encodeTxCursor(row){
+  return Buffer.from(JSON.stringify({ t: row.ts_key, i: String(row.id) })).toString('base64url');
+}
+function decodeTxCursor(cursor){
   try{
-    await db.query(`CREATE TABLE IF NOT EXISTS supply_txs(
-      id BIGSERIAL PRIMARY KEY,
-      ts TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-      type TEXT NOT NULL,
-      amount NUMERIC(24,2) NOT NULL DEFAULT 0,
-      user_ext TEXT,
-      user_id UUID,
-      event_id INTEGER REFERENCES welcome_events(id) ON DELETE SET NULL,
-      reference TEXT,
-      meta JSONB,
-      actor TEXT
-    )`);
-  // Intentar corregir tipo de columna si fue creada previamente como INTEGER
-  try{ await db.query('ALTER TABLE supply_txs ALTER COLUMN user_id TYPE uuid USING NULLIF(user_id::text, \'\')::uuid'); }catch(_){ }
-    await db.query(`CREATE INDEX IF NOT EXISTS supply_txs_ts_idx ON supply_txs(ts)`);
-    await db.query(`CREATE INDEX IF NOT EXISTS supply_txs_type_idx ON supply_txs(type)`);
-    await db.query(`CREATE INDEX IF NOT EXISTS supply_txs_event_idx ON supply_txs(event_id)`);
-    await db.query(`CREATE INDEX IF NOT EXISTS supply_txs_userext_idx ON supply_txs(user_ext)`);
-  }catch(_){ }
-}
-
-async function listSupplyTxs({ type, user_ext, event_id, from, to, limit=50, offset=0, order='desc' }={}){
-  await ensureSupplyTxsTable();
+    const c = JSON.parse(Buffer.from(String(cursor), 'base64url').toString('utf8'));
+    if (!c || typeof c.t !== 'string' || !/^\d+$/.test(String(c.i))) return null;
+    // t vuelve a Postgres como ::timestamptz; uno inválido daría 500 en vez de invalid_cursor
+    if (!/^\d{4}-\d{2}-\d{2}[ T]/.test(c.t) || !Number.isFinite(Date.parse(c.t))) return null;
+    return { ts: c.t, id: String(c.i) };
+  }catch(_){ return null; }
+}
+
+function buildTxFilters({ type, user_ext, event_id, from, to }={}){
   const cond=[]; const args=[]; let i=1;
   if (type){ cond.push(`type=$${i++}`); args.push(String(type)); }
   if (user_ext){ cond.push(`user_ext=$${i++}`); args.push(String(user_ext)); }
   if (event_id){ cond.push(`event_id=$${i++}`); args.push(Number(event_id)); }
   const dtFrom = parseDate(from); if (dtFrom){ cond.push(`ts >= $${i++}`); args.push(dtFrom); }
   const dtTo = parseDate(to); if (dtTo){ cond.push(`ts <= $${i++}`); args.push(dtTo); }
-  const where = cond.length? `WHERE ${cond.join(' AND ')}` : '';
+  return { cond, args };
+}
+
+// cursor === undefined: paginación clásica por OFFSET; cualquier otro valor ('' = primera página) usa keyset
+async function listSupplyTxs({ type, user_ext, event_id, from, to, limit=50, offset=0, order='desc', cursor }={}){
+  await ensureSupplyTxsTable();
+  const { cond, args } = buildTxFilters({ type, user_ext, event_id, from, to }); let i = args.length + 1;
   const lim = Math.max(1, Math.min(1000, Number(limit)||50));
-  const off = Math.max(0, Number(offset)||0);
   const ord = String(order||'desc').toLowerCase()==='asc' ? 'ASC' : 'DESC';
-  const q = `SELECT id, ts, type, amount, user_ext, user_id, event_id, reference, meta, actor FROM supply_txs ${where} ORDER BY ts ${ord}, id ${ord} LIMIT ${lim} OFFSET ${off}`;
+  const cols = 'id, ts, type, amount, user_ext, user_id, event_id, reference, meta, actor';
+  if (cursor !== undefined && cursor !== null){
+    if (cursor !== ''){
+      const c = decodeTxCursor(cursor); if (!c) throw new Error('invalid_cursor');
+      cond.push(`(ts, id) ${ord==='ASC' ? '>' : '<'} ($${i++}::timestamptz, $${i++}::bigint)`); args.push(c.ts, c.id);
+    }
+    const where = cond.length? `WHERE ${cond.join(' AND ')}` : '';
+    const rs = await db.query(`SELECT ${cols}, ts::text AS ts_key FROM supply_txs ${where} ORDER BY ts ${ord}, id ${ord} LIMIT ${lim + 1}`, args);
+    const rows = rs.rows || [];
+    const hasMore = rows.length > lim;
+    const page = hasMore ? rows.slice(0, lim) : rows;
+    const nextCursor = (hasMore && page.length) ? encodeTxCursor(page[page.length-1]) : null;
+    const items = page.map(({ ts_key, ...r }) => r);
+    return { items, limit: lim, nextCursor };
+  }
+  const where = cond.length? `WHERE ${cond.join(' AND ')}` : '';
+  const off = Math.max(0, Number(offset)||0);
+  const q = `SELECT ${cols} FROM supply_txs ${where} ORDER BY ts ${ord}, id ${ord} LIMIT ${lim} OFFSET ${off}`;
   const rs = await db.query(q, args);
   return { items: rs.rows||[], limit: lim, offset: off };
 }
@@ -112,63 +171,157 @@ async function getSupplyTx(id){
 
 function toCsvValue(v){ if (v===null||v===undefined) return ''; const s = typeof v==='object'? JSON.stringify(v) : String(v); return '"'+ s.replace(/"/g,'""') +'"'; }
 
+const CSV_HEADER = ['id','ts','type','amount','user_ext','user_id','event_id','reference','actor','meta'];
+
+function csvLine(r){
+  const row = [r.id, r.ts instanceof Date? r.ts.toISOString() : (r.ts || ''), r.type, Number(r.amount||0), r.user_ext||'', r.user_id||'', r.event_id||'', r.reference||'', r.actor||'', r.meta||null];
+  return row.map(toCsvValue).join(',');
+}
+
 async function exportSupplyTxsCsv(filters={}){
   await ensureSupplyTxsTable();
   const { items } = await listSupplyTxs({ ...filters, limit: Math.min(5000, Number(filters.limit)||5000), offset: Number(filters.offset)||0 });
-  const header = ['id','ts','type','amount','user_ext','user_id','event_id','reference','actor','meta'];
-  const lines = [header.join(',')];
-  for (const r of items){
-    const row = [r.id, r.ts instanceof Date? r.ts.toISOString() : (r.ts || ''), r.type, Number(r.amount||0), r.user_ext||'', r.user_id||'', r.event_id||'', r.reference||'', r.actor||'', r.meta||null];
-    lines.push(row.map(toCsvValue).join(','));
-  }
+  const lines = [CSV_HEADER.join(',')];
+  for (const r of items) lines.push(csvLine(r));
   return lines.join('\n');
 }
 
-async function backfillWelcomeBonus({ from, to, limit=1000, dryRun=false }={}){
+function writeChunk(out, chunk){
+  return new Promise((resolve, reject) => {
+    if (out.destroyed || out.writableEnded) return reject(new Error('stream_closed'));
+    if (out.write(chunk)) return resolve();
+    const done = (err) => { out.off('drain', done); out.off('close', closed); out.off('error', done); err ? reject(err) : resolve(); };
+    const closed = () => done(new Error('stream_closed'));
+    out.on('drain', done); out.on('close', closed); out.on('error', done);
+  });
+}
+
+// Exportación completa por cursor de servidor (DECLARE/FETCH): memoria constante,
+// respeta backpressure del destino y cede el event loop entre lotes.
+async function streamSupplyTxsCsv(filters={}, out, { batchSize=1000 }={}){
   await ensureSupplyTxsTable();
-  const dtFrom = parseDate(from);
-  const dtTo = parseDate(to);
-  const lim = Math.max(1, Math.min(5000, Number(limit)||1000));
-  const q = `
-    SELECT wt.id AS wallet_tx_id,
-           wt.created_at AS ts,
-           COALESCE(wt.amount_fire,0) AS amount_fire,
-           w.user_id AS user_id,
-           u.tg_id AS tg_id,
-           we.id AS event_id
-    FROM wallet_transactions wt
-    JOIN wallets w ON w.id = wt.wallet_id
-    LEFT JOIN users u ON u.id = w.user_id
-    LEFT JOIN welcome_events we ON we.starts_at IS NOT NULL AND we.ends_at IS NOT NULL AND wt.created_at BETWEEN we.starts_at AND we.ends_at
-    WHERE wt.type = 'welcome_bonus'
-      AND COALESCE(wt.amount_fire,0) <> 0
+  const { cond, args } = buildTxFilters(filters);
+  const where = cond.length? `WHERE ${cond.join(' AND ')}` : '';
+  const ord = String(filters.order||'desc').toLowerCase()==='asc' ? 'ASC' : 'DESC';
+  const max = Math.max(0, Number(filters.limit)||0); // 0 = sin límite
+  const fetchN = Math.max(100, Math.min(10000, Number(batchSize)||1000));
+  const client = await db.pool.connect();
+  let rows = 0;
+  try{
+    await client.query('BEGIN READ ONLY');
+    await client.query(`DECLARE supply_export NO SCROLL CURSOR FOR SELECT id, ts, type, amount, user_ext, user_id, event_id, reference, meta, actor FROM supply_txs ${where} ORDER BY ts ${ord}, id ${ord}`, args);
+    await writeChunk(out, CSV_HEADER.join(',') + '\n');
+    for(;;){
+      const n = max ? Math.min(fetchN, max - rows) : fetchN;
+      if (n <= 0) break;
+      const rs = await client.query(`FETCH ${n} FROM supply_export`);
+      const batch = rs.rows || [];
+      if (!batch.length) break;
+      let chunk = '';
+      for (const r of batch) chunk += csvLine(r) + '\n';
+      rows += batch.length;
+      await writeChunk(out, chunk);
+      await new Promise((resolve) => setImmediate(resolve));
+      if (batch.length < n) break;
+    }
+    await client.query('CLOSE supply_export');
+    await client.query('COMMIT');
+    return { rows };
+  }catch(err){ try{ await client.query('ROLLBACK'); }catch(_){} throw err; }
+  finally{ client.release(); }
+}
+
+// -------- Backfill welcome_bonus por lotes --------
+// Cada lote recorre wallet_transactions por keyset (created_at, id), inserta en un
+// solo INSERT ... SELECT los que aún no tienen supply_tx (dedupe por índice de
+// expresión) y guarda el checkpoint en app_kv dentro de la misma transacción.
+const BACKFILL_LOCK = 720011; // pg_advisory_xact_lock: un solo lote a la vez entre procesos
+
+function backfillFilters(from, to){
+  return { dtFrom: parseDate(from), dtTo: parseDate(to) };
+}
+
+async function countWelcomeBonusCandidates({ from, to }={}){
+  await ensureSupplyTxsTable();
+  try{ await schema.ensure('welcome_backfill'); }catch(_){ }
+  const { dtFrom, dtTo } = backfillFilters(from, to);
+  const rs = await db.query(`SELECT COUNT(*)::bigint AS n FROM wallet_transactions wt
+    WHERE wt.type = 'welcome_bonus' AND COALESCE(wt.amount_fire,0) <> 0 AND wt.created_at IS NOT NULL
       AND ($1::timestamptz IS NULL OR wt.created_at >= $1)
       AND ($2::timestamptz IS NULL OR wt.created_at <= $2)
-      AND NOT EXISTS (
-        SELECT 1 FROM supply_txs st WHERE st.meta->>'wallet_tx_id' = wt.id::text
-      )
-    ORDER BY wt.created_at ASC
-    LIMIT $3`;
-  const rs = await db.query(q, [dtFrom, dtTo, lim]);
-  const rows = rs.rows || [];
-  if (dryRun) return { dryRun:true, candidates: rows.length };
+      AND NOT EXISTS (SELECT 1 FROM supply_txs st WHERE st.meta->>'wallet_tx_id' = wt.id::text)`, [dtFrom, dtTo]);
+  return Number(rs.rows?.[0]?.n || 0);
+}
+
+// after: { ts, id } del último wallet_transaction recorrido (null = desde el principio)
+async function backfillWelcomeBonusChunk({ from, to, after=null, chunkSize=1000, checkpointKey=null }={}){
+  await ensureSupplyTxsTable();
+  try{ await schema.ensure('welcome_backfill'); }catch(_){ }
+  if (checkpointKey) await schema.ensure('app_kv');
+  const { dtFrom, dtTo } = backfillFilters(from, to);
+  const n = Math.max(1, Math.min(10000, Number(chunkSize)||1000));
   const client = await db.pool.connect();
-  let inserted = 0;
   try{
     await client.query('BEGIN');
-    for (const r of rows){
-      const userExt = (r.tg_id) ? ('tg:' + r.tg_id) : (r.user_id ? ('db:' + r.user_id) : null);
-      const amt = Math.abs(Number(r.amount_fire||0));
-      await client.query(
-        'INSERT INTO supply_txs(ts,type,amount,user_ext,user_id,event_id,reference,meta,actor) VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9)',
-        [r.ts, 'welcome_bonus', amt, userExt, r.user_id || null, r.event_id || null, 'backfill', { wallet_tx_id: r.wallet_tx_id }, 'backfill']
-      );
-      inserted += 1;
+    await client.query('SELECT pg_advisory_xact_lock($1)', [BACKFILL_LOCK]);
+    const rs = await client.query(`
+      WITH scan AS (
+        SELECT wt.id, wt.created_at
+        FROM wallet_transactions wt
+        WHERE wt.type = 'welcome_bonus'
+          AND wt.created_at IS NOT NULL
+          AND ($1::timestamptz IS NULL OR wt.created_at >= $1)
+          AND ($2::timestamptz IS NULL OR wt.created_at <= $2)
+          AND ($3::timestamptz IS NULL OR (wt.created_at, wt.id) > ($3::timestamptz, $4::uuid))
+        ORDER BY wt.created_at ASC, wt.id ASC
+        LIMIT $5
+      ), ins AS (
+        INSERT INTO supply_txs(ts,type,amount,user_ext,user_id,event_id,reference,meta,actor)
+        SELECT DISTINCT ON (wt.id) wt.created_at, 'welcome_bonus', ABS(COALESCE(wt.amount_fire,0)),
+               CASE WHEN u.tg_id IS NOT NULL THEN 'tg:' || u.tg_id::text WHEN w.user_id IS NOT NULL THEN 'db:' || w.user_id::text ELSE NULL END,
+               w.user_id, we.id, 'backfill', jsonb_build_object('wallet_tx_id', wt.id), 'backfill'
+        FROM scan s
+        JOIN wallet_transactions wt ON wt.id = s.id
+        JOIN wallets w ON w.id = wt.wallet_id
+        LEFT JOIN users u ON u.id = w.user_id
+        LEFT JOIN welcome_events we ON we.starts_at IS NOT NULL AND we.ends_at IS NOT NULL AND wt.created_at BETWEEN we.starts_at AND we.ends_at
+        WHERE COALESCE(wt.amount_fire,0) <> 0
+          AND NOT EXISTS (SELECT 1 FROM supply_txs st WHERE st.meta->>'wallet_tx_id' = wt.id::text)
+        ORDER BY wt.id, we.id
+        RETURNING 1
+      ), last AS (
+        SELECT created_at::text AS ts, id::text AS id FROM scan ORDER BY created_at DESC, id DESC LIMIT 1
+      )
+      SELECT (SELECT COUNT(*) FROM scan)::int AS scanned, (SELECT COUNT(*) FROM ins)::int AS inserted, last.ts, last.id
+      FROM (SELECT 1) one LEFT JOIN last ON TRUE`,
+      [dtFrom, dtTo, after ? after.ts : null, after ? after.id : null, n]);
+    const row = rs.rows?.[0] || {};
+    const scanned = Number(row.scanned||0); const inserted = Number(row.inserted||0);
+    const last = row.ts ? { ts: row.ts, id: row.id } : after;
+    const done = scanned < n;
+    if (checkpointKey){
+      await client.query('INSERT INTO app_kv(key,value,updated_at) VALUES($1,$2,NOW()) ON CONFLICT(key) DO UPDATE SET value=EXCLUDED.value, updated_at=NOW()',
+        [checkpointKey, { from: from || null, to: to || null, after: last, done, at: Date.now() }]);
     }
     await client.query('COMMIT');
+    return { scanned, inserted, after: last, done };
   }catch(err){ try{ await client.query('ROLLBACK'); }catch(_){} throw err; }
   finally{ client.release(); }
-  return { inserted };
 }
 
-module.exports = { getStatus, setMax, canEmit, emit, getDashboardSnapshot, listSupplyTxs, getSupplyTx, exportSupplyTxsCsv, backfillWelcomeBonus };
+// Versión síncrona (compatibilidad con la ruta original): procesa lotes hasta insertar `limit`
+async function backfillWelcomeBonus({ from, to, limit=1000, dryRun=false, chunkSize=1000 }={}){
+  if (dryRun) return { dryRun:true, candidates: await countWelcomeBonusCandidates({ from, to }) };
+  const max = Math.max(1, Number(limit)||1000);
+  let after = null; let inserted = 0; let scanned = 0;
+  for(;;){
+    const n = Math.min(Number(chunkSize)||1000, max - inserted);
+    if (n <= 0) break;
+    const r = await backfillWelcomeBonusChunk({ from, to, after, chunkSize: n });
+    inserted += r.inserted; scanned += r.scanned; after = r.after;
+    if (r.done) break;
+  }
+  return { inserted, scanned };
+}
+
+module.exports = { getStatus, setMax, canEmit, emit, getDashboardSnapshot, adjustCirculating, circulatingReady, shardOf, rederiveCirculating, getLastDriftCheck, listSupplyTxs, getSupplyTx, exportSupplyTxsCsv, streamSupplyTxsCsv, backfillWelcomeBonus, backfillWelcomeBonusChunk, countWelcomeBonusCandidates };
@@ -1,5 +1,6 @@
 const crypto = require('crypto');
 const db = require('../db');
+const userResolver = require('../services/userResolver');
 
 function hashPassword(password) {
   const salt = crypto.randomBytes(8).toString('hex');
@@ -65,6 +66,7 @@ async function createUserWithPassword({ username, password, email, phone, displa
     }
 
     await client.query('COMMIT');
+    if (em) userResolver.prime('em:' + em, userId);
     return { userId };
   } catch (err) {
     try { await client.query('ROLLBACK'); } catch (_) {}
@@ -96,6 +98,7 @@ async function upsertTelegramUser({ tgId, username, displayName }){
     const roleId = await ensureRole(client, 'client');
     if (roleId){ await client.query('INSERT INTO user_roles(user_id, role_id) VALUES ($1,$2) ON CONFLICT DO NOTHING', [userId, roleId]); }
     await client.query('COMMIT');
+    userResolver.prime('tg:' + tg, userId);
     return { userId };
   }catch(err){ try{ await client.query('ROLLBACK'); }catch(_){} throw err; }
   finally{ client.release(); }
@@ -148,6 +151,7 @@ async function updateUserContact({ userId, email, phone, username, displayName }
   params.push(userId);
   const sql = `UPDATE users SET ${fields.join(', ')}, updated_at = NOW() WHERE id = $${params.length} RETURNING id`;
   const rs = await db.query(sql, params);
+  if (typeof email !== 'undefined') { userResolver.invalidateDbId(userId); userResolver.invalidate('em:' + String(email || '')); }
   return { updated: !!(rs.rows && rs.rows[0]) };
 }
 
@@ -1,11 +1,10 @@
 const db = require('../db');
+const userResolver = require('../services/userResolver');
+const supplyHub = require('../services/supplyHub');
+const supplyRepo = require('./supplyRepo');
 
 async function mapExtToDbUserId(userExt){
-  const v = String(userExt||'').trim(); if (!v) return null;
-  if (v.startsWith('db:')) return v.slice(3);
-  if (v.startsWith('tg:')){ const tg=v.slice(3); const r=await db.query('SELECT id FROM users WHERE tg_id=$1 LIMIT 1',[tg]); return (r.rows&&r.rows[0]&&r.rows[0].id)||null; }
-  if (v.startsWith('em:')){ const em=v.slice(3).toLowerCase(); const r=await db.query('SELECT id FROM users WHERE LOWER(email)=$1 LIMIT 1',[em]); return (r.rows&&r.rows[0]&&r.rows[0].id)||null; }
-  return null;
+  return userResolver.resolve(userExt);
 }
 
 async function ensureWallet(userId){
@@ -19,72 +18,134 @@ async function getBalancesByExt(userExt){
   return { walletId: row? row.id : null, userId: dbUserId, fires: Number(row?.fires_balance||0), coins: Number(row?.coins_balance||0) };
 }
 
+// Mutación de saldo en una sola sentencia: UPDATE/upsert condicional del wallet,
+// fila de ledger en wallet_transactions y (para fires) ajuste del circulante,
+// todo en un CTE atómico sin BEGIN/SELECT FOR UPDATE/COMMIT.
+const BALANCE_COLS = {
+  fires: { balance: 'fires_balance', ledger: 'amount_fire', insufficient: 'insufficient_fires' },
+  coins: { balance: 'coins_balance', ledger: 'amount_coin', insufficient: 'insufficient_coins' }
+};
+
+async function mutateBalance(dbUserId, currency, delta, { type, reference, meta }){
+  const c = BALANCE_COLS[currency];
+  const circ = (currency === 'fires') && await supplyRepo.circulatingReady();
+  const args = [dbUserId, Math.abs(delta), String(type), String(reference||''), meta||{}];
+  const walletCte = delta > 0
+    ? `INSERT INTO wallets(user_id, fires_balance, coins_balance, updated_at) VALUES ($1, ${c.balance==='fires_balance' ? '$2::numeric' : '0'}, ${c.balance==='coins_balance' ? '$2::numeric' : '0'}, NOW())
+       ON CONFLICT (user_id) DO UPDATE SET ${c.balance} = wallets.${c.balance} + $2::numeric, updated_at = NOW()
+       RETURNING id`
+    : `UPDATE wallets SET ${c.balance} = ${c.balance} - $2::numeric, updated_at = NOW()
+       WHERE user_id = $1 AND ${c.balance} >= $2::numeric
+       RETURNING id`;
+  let circCte = '';
+  if (circ){
+    args.push(supplyRepo.shardOf(dbUserId));
+    circCte = `, circ AS (
+      UPDATE fire_supply_shards SET circulating = circulating ${delta > 0 ? '+' : '-'} $2::numeric, updated_at = NOW()
+      WHERE shard = $6 AND EXISTS (SELECT 1 FROM w)
+    )`;
+  }
+  const rs = await db.query(`WITH w AS (${walletCte}), tx AS (
+      INSERT INTO wallet_transactions(wallet_id, type, ${c.ledger}, reference, meta, created_at)
+      SELECT id, $3::text, ${delta > 0 ? '' : '-'}$2::numeric, $4::text, $5::jsonb, NOW() FROM w
+    )${circCte}
+    SELECT (SELECT id FROM w) AS wallet_id, EXISTS (SELECT 1 FROM wallets WHERE user_id = $1) AS has_wallet`, args);
+  const row = rs.rows && rs.rows[0];
+  if (!row || !row.wallet_id) throw new Error(row && row.has_wallet ? c.insufficient : 'wallet_missing');
+  if (currency === 'fires') supplyHub.notify();
+  return row.wallet_id;
+}
+
 async function creditFiresByExt(userExt, amount, { type='manual_credit', reference='', meta={} }={}){
   const amt = Math.max(0, Number(amount||0)); if (!amt) return { ok:false };
   const dbUserId = await mapExtToDbUserId(userExt); if (!dbUserId) return { ok:false };
-  const client = await db.pool.connect();
-  try{
-    await client.query('BEGIN');
-    await client.query('INSERT INTO wallets(user_id, fires_balance, coins_balance, updated_at) VALUES ($1,0,0,NOW()) ON CONFLICT (user_id) DO NOTHING',[dbUserId]);
-    const w = await client.query('SELECT id FROM wallets WHERE user_id=$1 FOR UPDATE',[dbUserId]);
-    const wid = w.rows?.[0]?.id; if (!wid) throw new Error('wallet_missing');
-    await client.query('UPDATE wallets SET fires_balance = fires_balance + $2, updated_at=NOW() WHERE id=$1',[wid, amt]);
-    await client.query('INSERT INTO wallet_transactions(wallet_id,type,amount_fire,reference,meta,created_at) VALUES ($1,$2,$3,$4,$5,NOW())',[wid, type, amt, String(reference||''), meta||{}]);
-    await client.query('COMMIT');
-    return { ok:true };
-  }catch(err){ try{ await client.query('ROLLBACK'); }catch(_){} return { ok:false, error: err.message||'credit_error' }; }
-  finally{ client.release(); }
+  try{ await mutateBalance(dbUserId, 'fires', amt, { type, reference, meta }); return { ok:true }; }
+  catch(err){ return { ok:false, error: err.message||'credit_error' }; }
 }
 
 async function debitFiresByExt(userExt, amount, { type='manual_debit', reference='', meta={} }={}){
   const amt = Math.max(0, Number(amount||0)); if (!amt) return { ok:false };
   const dbUserId = await mapExtToDbUserId(userExt); if (!dbUserId) return { ok:false };
-  const client = await db.pool.connect();
-  try{
-    await client.query('BEGIN');
-    const w = await client.query('SELECT id, fires_balance FROM wallets WHERE user_id=$1 FOR UPDATE',[dbUserId]);
-    const row = w.rows?.[0]; if (!row) throw new Error('wallet_missing');
-    const bal = Number(row.fires_balance||0); if (bal < amt) throw new Error('insufficient_fires');
-    await client.query('UPDATE wallets SET fires_balance = fires_balance - $2, updated_at=NOW() WHERE id=$1',[row.id, amt]);
-    await client.query('INSERT INTO wallet_transactions(wallet_id,type,amount_fire,reference,meta,created_at) VALUES ($1,$2,$3,$4,$5,NOW())',[row.id, type, -amt, String(reference||''), meta||{}]);
-    await client.query('COMMIT');
-    return { ok:true };
-  }catch(err){ try{ await client.query('ROLLBACK'); }catch(_){} return { ok:false, error: err.message||'debit_error' }; }
-  finally{ client.release(); }
+  try{ await mutateBalance(dbUserId, 'fires', -amt, { type, reference, meta }); return { ok:true }; }
+  catch(err){ return { ok:false, error: err.message||'debit_error' }; }
 }
 
 async function creditCoinsByExt(userExt, amount, { type='manual_credit', reference='', meta={} }={}){
   const amt = Math.max(0, Number(amount||0)); if (!amt) return { ok:false };
   const dbUserId = await mapExtToDbUserId(userExt); if (!dbUserId) return { ok:false };
-  const client = await db.pool.connect();
-  try{
-    await client.query('BEGIN');
-    await client.query('INSERT INTO wallets(user_id, fires_balance, coins_balance, updated_at) VALUES ($1,0,0,NOW()) ON CONFLICT (user_id) DO NOTHING',[dbUserId]);
-    const w = await client.query('SELECT id FROM wallets WHERE user_id=$1 FOR UPDATE',[dbUserId]);
-    const wid = w.rows?.[0]?.id; if (!wid) throw new Error('wallet_missing');
-    await client.query('UPDATE wallets SET coins_balance = coins_balance + $2, updated_at=NOW() WHERE id=$1',[wid, amt]);
-    await client.query('INSERT INTO wallet_transactions(wallet_id,type,amount_coin,reference,meta,created_at) VALUES ($1,$2,$3,$4,$5,NOW())',[wid, type, amt, String(reference||''), meta||{}]);
-    await client.query('COMMIT');
-    return { ok:true };
-  }catch(err){ try{ await client.query('ROLLBACK'); }catch(_){} return { ok:false, error: err.message||'credit_error' }; }
-  finally{ client.release(); }
+  try{ await mutateBalance(dbUserId, 'coins', amt, { type, reference, meta }); return { ok:true }; }
+  catch(err){ return { ok:false, error: err.message||'credit_error' }; }
 }
 
 async function debitCoinsByExt(userExt, amount, { type='manual_debit', reference='', meta={} }={}){
   const amt = Math.max(0, Number(amount||0)); if (!amt) return { ok:false };
   const dbUserId = await mapExtToDbUserId(userExt); if (!dbUserId) return { ok:false };
-  const client = await db.pool.connect();
+  try{ await mutateBalance(dbUserId, 'coins', -amt, { type, reference, meta }); return { ok:true }; }
+  catch(err){ return { ok:false, error: err.message||'debit_error' }; }
+}
+
+// Asiento de varias patas desde un pozo que vive fuera de wallets (pot_fires de
+// la sala/rifa, o el pot de TTT): todas las patas en una sola sentencia
+// (upsert agregado de wallets + filas de ledger + ajuste de circulante).
+// legs: [{ userId, amount, type, reference?, meta? }]; total (opcional) debe
+// cuadrar con la suma de las patas. Las patas pueden ser de varias salas
+// (reference/meta por pata) para liquidar lotes en un solo viaje.
+// client: conexión de la transacción en curso (o db).
+async function postLedger(client, { currency='fires', legs=[], total=null, reference='', meta={} }={}){
+  const c = BALANCE_COLS[currency]; if (!c) throw new Error('invalid_currency');
+  const clean = [];
+  for (const l of (legs||[])){
+    const amt = Math.max(0, Number(l && l.amount || 0));
+    if (!amt) continue;
+    if (!l.userId) throw new Error('invalid_leg');
+    clean.push({ userId: String(l.userId), amount: amt, type: String(l.type||'ledger_posting'), reference: String(l.reference!=null ? l.reference : (reference||'')), meta: JSON.stringify(l.meta||meta||{}) });
+  }
+  const sum = clean.reduce((s, l) => s + l.amount, 0);
+  if (total != null && Math.abs(sum - Number(total)) > 1e-9) throw new Error('unbalanced_posting');
+  if (!clean.length) return { ok:true, legs:0, amount:0 };
+  const circ = (currency === 'fires') && await supplyRepo.circulatingReady();
+  const args = [clean.map(l=>l.userId), clean.map(l=>l.amount), clean.map(l=>l.type), clean.map(l=>l.reference), clean.map(l=>l.meta)];
+  let circCte = '';
+  if (circ){
+    args.push(clean.map(l=>supplyRepo.shardOf(l.userId)));
+    circCte = `, circ AS (
+      UPDATE fire_supply_shards s SET circulating = s.circulating + d.amt, updated_at = NOW()
+      FROM (SELECT shard, SUM(amount) AS amt FROM legs GROUP BY shard) d
+      WHERE s.shard = d.shard
+    )`;
+  }
+  const rs = await (client||db).query(`WITH legs AS (
+      SELECT * FROM UNNEST($1::uuid[], $2::numeric[], $3::text[], $4::text[], $5::text[]${circ ? ', $6::smallint[]' : ''})
+        AS l(user_id, amount, type, reference, meta${circ ? ', shard' : ''})
+    ), w AS (
+      INSERT INTO wallets(user_id, fires_balance, coins_balance, updated_at)
+      SELECT user_id, ${c.balance==='fires_balance' ? 'SUM(amount)' : '0'}, ${c.balance==='coins_balance' ? 'SUM(amount)' : '0'}, NOW() FROM legs GROUP BY user_id
+      ON CONFLICT (user_id) DO UPDATE SET ${c.balance} = wallets.${c.balance} + EXCLUDED.${c.balance}, updated_at = NOW()
+      RETURNING id, user_id
+    ), tx AS (
+      INSERT INTO wallet_transactions(wallet_id, type, ${c.ledger}, reference, meta, created_at)
+      SELECT w.id, l.type, l.amount, l.reference, l.meta::jsonb, NOW() FROM legs l JOIN w ON w.user_id = l.user_id
+      RETURNING 1
+    )${circCte}
+    SELECT (SELECT COUNT(*) FROM tx) AS n`, args);
+  if (currency === 'fires') supplyHub.notify();
+  return { ok:true, legs: Number(rs.rows && rs.rows[0] && rs.rows[0].n || 0), amount: sum };
+}
+
+// Variante por userExt: resuelve todas las patas en lote; una pata sin usuario
+// resoluble invalida el asiento completo (no hay pagos parciales)
+async function postLedgerByExt({ currency='fires', legs=[], total=null, reference='', meta={} }={}){
   try{
-    await client.query('BEGIN');
-    const w = await client.query('SELECT id, coins_balance FROM wallets WHERE user_id=$1 FOR UPDATE',[dbUserId]);
-    const row = w.rows?.[0]; if (!row) throw new Error('wallet_missing');
-    const bal = Number(row.coins_balance||0); if (bal < amt) throw new Error('insufficient_coins');
-    await client.query('UPDATE wallets SET coins_balance = coins_balance - $2, updated_at=NOW() WHERE id=$1',[row.id, amt]);
-    await client.query('INSERT INTO wallet_transactions(wallet_id,type,amount_coin,reference,meta,created_at) VALUES ($1,$2,$3,$4,$5,NOW())',[row.id, type, -amt, String(reference||''), meta||{}]);
-    await client.query('COMMIT');
-    return { ok:true };
-  }catch(err){ try{ await client.query('ROLLBACK'); }catch(_){} return { ok:false, error: err.message||'debit_error' }; }
-  finally{ client.release(); }
+    const ids = await userResolver.resolveMany(legs.map(l=>l && l.userExt));
+    const mapped = [];
+    for (const l of legs){
+      if (!l || !(Number(l.amount||0) > 0)) continue;
+      const userId = ids.get(String(l.userExt||'').trim());
+      if (!userId) return { ok:false, error:'user_not_found' };
+      mapped.push({ ...l, userId });
+    }
+    return await postLedger(db, { currency, legs: mapped, total, reference, meta });
+  }catch(err){ return { ok:false, error: err.message||'posting_error' }; }
 }
 
-module.exports = { mapExtToDbUserId, ensureWallet, getBalancesByExt, creditFiresByExt, debitFiresByExt, creditCoinsByExt, debitCoinsByExt };
+module.exports = { mapExtToDbUserId, ensureWallet, getBalancesByExt, creditFiresByExt, debitFiresByExt, creditCoinsByExt, debitCoinsByExt, postLedger, postLedgerByExt };
@@ -1,22 +1,14 @@
 const db = require('../db');
+const userResolver = require('../services/userResolver');
+const schema = require('../db/schema');
+const supplyHub = require('../services/supplyHub');
 
 // ---------- Utilidades (legacy kv/claims) ----------
 async function ensureKv(){
-  try{
-    await db.query(`CREATE TABLE IF NOT EXISTS app_kv(
-      key TEXT PRIMARY KEY,
-      value JSONB,
-      updated_at TIMESTAMPTZ DEFAULT NOW()
-    )`);
-  }catch(_){ }
+  try{ await schema.ensure('app_kv'); }catch(_){ }
 }
 async function ensureLegacyClaims(){
-  try{
-    await db.query(`CREATE TABLE IF NOT EXISTS welcome_claims(
-      user_ext TEXT PRIMARY KEY,
-      claimed_at TIMESTAMPTZ DEFAULT NOW()
-    )`);
-  }catch(_){ }
+  try{ await schema.ensure('welcome_claims'); }catch(_){ }
 }
 
 async function isEligibleForWelcome(userExt){
@@ -32,36 +24,7 @@ async function isEligibleForWelcome(userExt){
 }
 // ---------- Modelo nuevo en Postgres ----------
 async function ensureTables(){
-  try{
-    await db.query(`CREATE TABLE IF NOT EXISTS welcome_events(
-      id SERIAL PRIMARY KEY,
-      name TEXT NOT NULL,
-      message TEXT NOT NULL,
-      coins INTEGER NOT NULL DEFAULT 0,
-      fires INTEGER NOT NULL DEFAULT 0,
-      duration_hours INTEGER NOT NULL DEFAULT 24,
-      starts_at TIMESTAMPTZ,
-      ends_at TIMESTAMPTZ,
-      active BOOLEAN NOT NULL DEFAULT FALSE,
-      created_by TEXT NOT NULL,
-      created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-      updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-    )`);
-    await db.query(`CREATE TABLE IF NOT EXISTS welcome_event_history(
-      id SERIAL PRIMARY KEY,
-      event_id INTEGER NOT NULL REFERENCES welcome_events(id) ON DELETE CASCADE,
-      action TEXT NOT NULL,
-      actor TEXT NOT NULL,
-      payload JSONB,
-      created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-    )`);
-    await db.query(`CREATE TABLE IF NOT EXISTS welcome_event_claims(
-      event_id INTEGER NOT NULL REFERENCES welcome_events(id) ON DELETE CASCADE,
-      user_ext TEXT NOT NULL,
-      claimed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-      PRIMARY KEY(event_id, user_ext)
-    )`);
-  }catch(_){ }
+  try{ await schema.ensure('welcome_events'); }catch(_){ }
 }
 async function getCurrentEvent(){
   try{
@@ -185,28 +148,15 @@ async function setClaimForEvent(eventId, userExt){
 }
 
 async function mapExtToDbUserId(userExt){
-  const v = String(userExt||'').trim(); if (!v) return null;
-  if (v.startsWith('db:')) return v.slice(3);
-  if (v.startsWith('tg:')){ const tg=v.slice(3); const r = await db.query('SELECT id FROM users WHERE tg_id=$1 LIMIT 1',[tg]); return (r.rows&&r.rows[0]&&r.rows[0].id)||null; }
-  if (v.startsWith('em:')){ const em=v.slice(3).toLowerCase(); const r = await db.query('SELECT id FROM users WHERE LOWER(email)=$1 LIMIT 1',[em]); return (r.rows&&r.rows[0]&&r.rows[0].id)||null; }
-  return null;
+  return userResolver.resolve(userExt);
 }
 
 async function ensureWallet(dbUserId){
   await db.query('INSERT INTO wallets(user_id, fires_balance, coins_balance, updated_at) VALUES ($1,0,0,NOW()) ON CONFLICT (user_id) DO NOTHING', [dbUserId]);
 }
 
-async function ensureFireSupply(client){
-  await client.query(`CREATE TABLE IF NOT EXISTS fire_supply(
-    id SMALLINT PRIMARY KEY DEFAULT 1,
-    total_max NUMERIC(24,2) NOT NULL DEFAULT 1000000000,
-    emitted NUMERIC(24,2) NOT NULL DEFAULT 0,
-    updated_at TIMESTAMPTZ DEFAULT NOW()
-  )`);
-  const chk = await client.query('SELECT 1 FROM fire_supply WHERE id=1');
-  if (!chk.rows || !chk.rows[0]){
-    await client.query('INSERT INTO fire_supply(id,total_max,emitted,updated_at) VALUES (1,1000000000,0,NOW())');
-  }
+async function ensureFireSupply(){
+  await schema.ensure('fire_supply');
 }
 
 async function getWalletExtBalances(userExt){
@@ -231,10 +181,10 @@ async function awardIfEligible(userExt){
   await ensureWallet(dbUserId);
   const coins = Math.max(0, Number(ev.coins||0));
   const fires = Math.max(0, Number(ev.fires||0));
+  await ensureFireSupply();
   const client = await db.pool.connect();
   try{
     await client.query('BEGIN');
-    await ensureFireSupply(client);
     if (fires>0){
       const upd = await client.query('UPDATE fire_supply SET emitted = emitted + $1, updated_at=NOW() WHERE id=1 AND emitted + $1 <= total_max RETURNING emitted,total_max',[fires]);
       if (!upd.rows || !upd.rows[0]){ await client.query('ROLLBACK'); return { awarded:false }; }
@@ -250,6 +200,7 @@ async function awardIfEligible(userExt){
       const w2 = await client.query('SELECT id FROM wallets WHERE user_id=$1 FOR UPDATE',[dbUserId]);
       const wid2 = w2.rows?.[0]?.id; if (wid2){
         await client.query('UPDATE wallets SET fires_balance = fires_balance + $2, updated_at=NOW() WHERE id=$1',[wid2, fires]);
+        if (supplyRepo) await supplyRepo.adjustCirculating(client, wid2, fires);
         await client.query('INSERT INTO wallet_transactions(wallet_id,type,amount_fire,reference,meta,created_at) VALUES ($1,$2,$3,$4,$5,NOW())',[wid2,'welcome_bonus', fires, 'welcome', { userExt: ext }]);
       }
     }
@@ -260,6 +211,7 @@ async function awardIfEligible(userExt){
     await client.query('COMMIT');
   }catch(e){ try{ await client.query('ROLLBACK'); }catch(_){} throw e; }
   finally{ client.release(); }
+  if (fires>0) supplyHub.notify();
   if (ev.id) await setClaimForEvent(ev.id, ext); else { try{ await ensureLegacyClaims(); await db.query('INSERT INTO welcome_claims(user_ext,claimed_at) VALUES($1,NOW()) ON CONFLICT DO NOTHING',[ext]); }catch(_){ } }
   return { awarded:true, coinsAwarded: coins, firesAwarded: fires, until: ev.endsAt };
 }
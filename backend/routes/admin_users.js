@@ -5,19 +5,25 @@ let rolesSvc = null; try { rolesSvc = require('../services/roles'); } catch(_) {
 let adminAuth = null; try { adminAuth = require('../middleware/adminAuth'); } catch(_) { adminAuth = (req,res,next)=>next(); }
 let userRepo = null; try { userRepo = require('../repos/userRepo'); } catch(_) { userRepo = null; }
 
-// GET /api/admin/users/list?search=&limit=&cursor=&onlineOnly=true
+// GET /api/admin/users/list?search=&limit=&cursor=&onlineOnly=true&game=
 router.get('/list', (req, res) => {
   try {
     const search = String(req.query.search || '');
     const limit = Math.max(1, Math.min(200, parseInt(req.query.limit || '50', 10) || 50));
-    const cursor = Math.max(0, parseInt(req.query.cursor || '0', 10) || 0);
+    // Cursor opaco devuelto en nextCursor (un número se acepta como offset heredado)
+    const cursor = String(req.query.cursor || '');
     const onlineOnly = String(req.query.onlineOnly || '').toLowerCase() === 'true';
+    const game = String(req.query.game || '').trim() || null;
     const now = Date.now();
-    const ONLINE_WINDOW_MS = Math.max(15_000, Math.min(10 * 60_000, parseInt(process.env.ONLINE_WINDOW_MS || '120000', 10) || 120_000)); // 2m por defecto
+    const ONLINE_WINDOW_MS = store.presence.windowMs; // 2m por defecto (ONLINE_WINDOW_MS)
 
-    let { items, nextCursor, total } = store.listUsersDetailed({ search, limit, cursor });
-    if (onlineOnly) {
-      items = items.filter(u => Number(u.lastSeenAt || 0) > now - ONLINE_WINDOW_MS);
+    let items, nextCursor, total;
+    if (onlineOnly && !search) {
+      // Solo online: se pagina directamente el índice de presencia
+      ({ items, nextCursor, total } = store.listOnlineUsers({ game, limit, cursor }));
+    } else {
+      ({ items, nextCursor, total } = store.listUsersDetailed({ search, limit, cursor }));
+      if (onlineOnly) items = items.filter(u => Number(u.lastSeenAt || 0) > now - ONLINE_WINDOW_MS);
     }
     const mapped = items.map(u => {
       const expectedId = u.telegramId ? ('tg:' + String(u.telegramId)) : (u.email ? ('em:' + String(u.email).toLowerCase()) : null);
@@ -33,6 +39,7 @@ router.get('/list', (req, res) => {
     });
     res.json({ success: true, items: mapped, nextCursor, total, now, onlineWindowMs: ONLINE_WINDOW_MS });
   } catch (err) {
+    if (err && err.message === 'invalid_cursor') return res.status(400).json({ success: false, error: 'invalid_cursor' });
     res.status(500).json({ success: false, error: 'list_error' });
   }
 });
@@ -49,14 +56,12 @@ router.post('/set-contact', (req, res) => {
   }
 });
 
-// GET /api/admin/users/stats
+// GET /api/admin/users/stats (O(1): tamaño del mapa + índice de presencia)
 router.get('/stats', (req, res) => {
   try {
     const now = Date.now();
-    const ONLINE_WINDOW_MS = Math.max(15_000, Math.min(10 * 60_000, parseInt(process.env.ONLINE_WINDOW_MS || '120000', 10) || 120_000));
-    const { items, total } = store.listUsersDetailed({ limit: 200, cursor: 0 });
-    const online = items.filter(u => Number(u.lastSeenAt || 0) > now - ONLINE_WINDOW_MS).length;
-    res.json({ success: true, total, online, now, onlineWindowMs: ONLINE_WINDOW_MS });
+    const p = store.getPresenceStats();
+    res.json({ success: true, total: store.users.size, online: p.online, onlineByGame: p.byGame, now, onlineWindowMs: p.windowMs, presenceBucketMs: p.bucketMs });
   } catch (err) {
     res.status(500).json({ success: false, error: 'stats_error' });
   }
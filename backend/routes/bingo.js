@@ -3,6 +3,10 @@ const router = express.Router();
 const useSql = String(process.env.BINGO_BACKEND||'').toLowerCase()==='sql';
 const store = useSql ? require('../services/bingoStoreSql') : require('../services/bingoStore');
 const { preferSessionUserId } = require('../middleware/sessionUser');
+const { sseFrame, lastEventIdOf } = require('../services/roomFeed');
+
+// Igual que el SSE: cada respuesta REST solo lleva los cartones de quien la pide
+const viewOf = (state, userId) => (state && typeof store.viewFor === 'function') ? store.viewFor(state, userId) : state;
 
 router.get('/health', async (req, res) => {
   res.json({ success: true, service: 'bingo', status: 'ok' });
@@ -19,7 +23,7 @@ router.post('/rooms', async (req, res) => {
     const ballSet = (req.body && req.body.ballSet) || undefined;
     if (!userId) return res.status(400).json({ success: false, error: 'invalid_user' });
     const state = await store.createRoom({ userId, visibility, costType, costValue, mode, ballSet });
-    res.json({ success: true, state });
+    res.json({ success: true, state: viewOf(state, userId) });
   } catch (e) {
     res.status(500).json({ success: false, error: 'create_error' });
   }
@@ -31,7 +35,7 @@ router.get('/my-rooms', async (req, res) => {
     const userId = preferSessionUserId(req, req.query && req.query.userId);
     if (!userId) return res.status(400).json({ success: false, error: 'invalid_user' });
     const rooms = await store.listRoomsByUser(userId);
-    res.json({ success: true, rooms });
+    res.json({ success: true, rooms: rooms.map(s => viewOf(s, userId)) });
   } catch (e) {
     res.status(500).json({ success: false, error: 'list_error' });
   }
@@ -40,8 +44,9 @@ router.get('/my-rooms', async (req, res) => {
 // Salas públicas
 router.get('/public-rooms', async (req, res) => {
   try {
+    const viewer = preferSessionUserId(req, req.query && req.query.userId);
     const rooms = await store.listPublicRooms();
-    res.json({ success: true, rooms });
+    res.json({ success: true, rooms: rooms.map(s => viewOf(s, viewer)) });
   } catch (e) {
     res.status(500).json({ success: false, error: 'public_list_error' });
   }
@@ -51,9 +56,10 @@ router.get('/public-rooms', async (req, res) => {
 router.get('/code/:code', async (req, res) => {
   try {
     const code = String(req.params.code || '').trim();
+    const userId = preferSessionUserId(req, req.query && req.query.userId);
     const state = await store.findByCode(code);
     if (!state) return res.status(404).json({ success: false, error: 'room_not_found' });
-    res.json({ success: true, state });
+    res.json({ success: true, state: viewOf(state, userId) });
   } catch (e) {
     res.status(500).json({ success: false, error: 'code_lookup_error' });
   }
@@ -68,7 +74,7 @@ router.post('/join-code', async (req, res) => {
     const meta = await store.findByCode(code);
     if (!meta) return res.status(404).json({ success: false, error: 'room_not_found' });
     const state = await store.joinRoom(meta.id, userId);
-    res.json({ success: true, state });
+    res.json({ success: true, state: viewOf(state, userId) });
   } catch (e) {
     const msg = e && e.message || 'join_code_error';
     const code = (msg === 'room_not_found') ? 404 : 400;
@@ -83,7 +89,7 @@ router.post('/rooms/:id/join', async (req, res) => {
     const userId = preferSessionUserId(req, req.body && req.body.userId);
     if (!roomId || !userId) return res.status(400).json({ success: false, error: 'invalid_params' });
     const state = await store.joinRoom(roomId, userId);
-    res.json({ success: true, state });
+    res.json({ success: true, state: viewOf(state, userId) });
   } catch (e) {
     const msg = e && e.message || 'join_error';
     const code = (msg === 'room_not_found') ? 404 : 400;
@@ -102,7 +108,7 @@ router.patch('/rooms/:id/options', async (req, res) => {
     const mode = (req.body && req.body.mode);
     const ballSet = (req.body && req.body.ballSet);
     const state = await store.setOptions(roomId, userId, { visibility, costType, costValue, mode, ballSet });
-    res.json({ success: true, state });
+    res.json({ success: true, state: viewOf(state, userId) });
   } catch (e) {
     const msg = e && e.message || 'options_error';
     const code = (msg === 'room_not_found') ? 404 : 400;
@@ -118,7 +124,7 @@ router.patch('/rooms/:id/ready', async (req, res) => {
     const ready = (req.body && req.body.ready);
     const cardsCount = (req.body && req.body.cardsCount);
     const state = await store.setReady(roomId, userId, { ready, cardsCount });
-    res.json({ success: true, state });
+    res.json({ success: true, state: viewOf(state, userId) });
   } catch (e) {
     const msg = e && e.message || 'ready_error';
     const code = (msg === 'room_not_found') ? 404 : 400;
@@ -132,7 +138,7 @@ router.post('/rooms/:id/start', async (req, res) => {
     const roomId = String(req.params.id || '').trim();
     const userId = preferSessionUserId(req, req.body && req.body.userId);
     const state = await store.start({ roomId, userId });
-    res.json({ success: true, state });
+    res.json({ success: true, state: viewOf(state, userId) });
   } catch (e) {
     const msg = e && e.message || 'start_error';
     const code = (msg === 'room_not_found') ? 404 : 400;
@@ -146,7 +152,7 @@ router.post('/rooms/:id/draw', async (req, res) => {
     const roomId = String(req.params.id || '').trim();
     const userId = preferSessionUserId(req, req.body && req.body.userId);
     const state = await store.draw({ roomId, userId });
-    res.json({ success: true, state });
+    res.json({ success: true, state: viewOf(state, userId) });
   } catch (e) {
     const msg = e && e.message || 'draw_error';
     const code = (msg === 'room_not_found') ? 404 : 400;
@@ -161,7 +167,7 @@ router.post('/rooms/:id/claim', async (req, res) => {
     const userId = preferSessionUserId(req, req.body && req.body.userId);
     const cardIndex = (req.body && req.body.cardIndex);
     const state = await store.claim(roomId, userId, { cardIndex });
-    res.json({ success: true, state });
+    res.json({ success: true, state: viewOf(state, userId) });
   } catch (e) {
     const msg = e && e.message || 'claim_error';
     const code = (msg === 'room_not_found') ? 404 : 400;
@@ -175,7 +181,7 @@ router.post('/rooms/:id/rematch', async (req, res) => {
     const roomId = String(req.params.id || '').trim();
     const userId = preferSessionUserId(req, req.body && req.body.userId);
     const state = await store.rematch(roomId, userId);
-    res.json({ success: true, state });
+    res.json({ success: true, state: viewOf(state, userId) });
   } catch (e) {
     const msg = e && e.message || 'rematch_error';
     const code = (msg === 'room_not_found') ? 404 : 400;
@@ -186,9 +192,10 @@ router.post('/rooms/:id/rematch', async (req, res) => {
 // Estado actual de la sala
 router.get('/rooms/:id/state', async (req, res) => {
   try {
+    const userId = preferSessionUserId(req, req.query && req.query.userId);
     const state = await store.getState(String(req.params.id || ''));
     if (!state) return res.status(404).json({ success: false, error: 'room_not_found' });
-    res.json({ success: true, state });
+    res.json({ success: true, state: viewOf(state, userId) });
   } catch (e) {
     res.status(500).json({ success: false, error: 'state_error' });
   }
@@ -197,17 +204,36 @@ router.get('/rooms/:id/state', async (req, res) => {
 // SSE de sala
 router.get('/rooms/:id/stream', async (req, res) => {
   const roomId = String(req.params.id || '');
-  const state = await store.getState(roomId);
-  if (!state) return res.status(404).end();
+  // Reconexión con Last-Event-ID (store en memoria): solo los mensajes perdidos si siguen en el anillo
+  const lastId = lastEventIdOf(req);
+  const missed = (lastId !== null && store.replay && store.rooms.has(roomId)) ? store.replay.since(roomId, lastId) : null;
+  const state = missed ? null : await store.getState(roomId);
+  if (!missed && !state) return res.status(404).end();
 
   res.set({ 'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache', Connection: 'keep-alive' });
   res.flushHeaders && res.flushHeaders();
 
-  const send = (name, payload) => {
-    try { res.write(`event: ${name}\n`); res.write(`data: ${JSON.stringify(payload)}\n\n`); } catch (_) {}
-  };
-  send('state', state);
-  const off = store.onRoom(roomId, (s) => send('state', s));
+  const write = (frame) => { try { res.write(frame); } catch (_) {} };
+  // Store en memoria: tramas compartidas sin cartones + evento 'cards' propio cuando cambian
+  const viewer = preferSessionUserId(req, req.query && req.query.userId);
+  const personal = typeof store.viewFor === 'function';
+  let v;
+  let cardsRef = personal ? store.cardsOf(roomId, viewer) : null;
+  if (missed) {
+    v = Number(lastId);
+    for (const m of missed) { write(m.frameFor(v)); v = m.v; }
+    // Los cartones pudieron cambiar en el hueco: se reenvían los actuales
+    if (personal) write(sseFrame('cards', { v, cards: cardsRef || [] }));
+  } else {
+    v = Number(state.v || 0);
+    write(sseFrame('state', personal ? store.viewFor(state, viewer) : state, v));
+  }
+  const off = store.onRoom(roomId, (s, msg) => {
+    if (!msg) return write(sseFrame('state', s));
+    write(msg.frameFor(v)); v = msg.v;
+    const cards = store.cardsOf(roomId, viewer);
+    if (cards !== cardsRef) { cardsRef = cards; write(sseFrame('cards', { v, cards: cards || [] })); }
+  });
   const hb = setInterval(() => { try { res.write(': ping\n\n'); } catch (_) {} }, 15000);
 
   req.on('close', () => { clearInterval(hb); off(); });
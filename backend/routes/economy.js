@@ -1,21 +1,53 @@
 const express = require('express');
+const zlib = require('zlib');
 const router = express.Router();
 const store = require('../services/memoryStore');
 const adminAuth = require('../middleware/adminAuth');
 const supplyRepo = require('../repos/supplyRepo');
+const supplyHub = require('../services/supplyHub');
+const welcomeBackfillJob = require('../services/welcomeBackfillJob');
 
 // -------- Auditoría supply (DB) --------
 // GET /api/economy/supply/txs-db
 router.get('/supply/txs-db', async (req, res) => {
   try {
-    const { type, user_ext, event_id, from, to, limit, offset, order } = req.query || {};
-    const out = await supplyRepo.listSupplyTxs({ type, user_ext, event_id, from, to, limit, offset, order });
+    const { type, user_ext, event_id, from, to, limit, offset, order, cursor } = req.query || {};
+    const out = await supplyRepo.listSupplyTxs({ type, user_ext, event_id, from, to, limit, offset, order, cursor });
     res.json({ success: true, ...out });
   } catch (err) {
+    if (err && err.message === 'invalid_cursor') return res.status(400).json({ success: false, error: 'invalid_cursor' });
     res.status(500).json({ success: false, error: 'supply_txs_list_error' });
   }
 });
 
+// GET /api/economy/supply/txs-db/export.csv (streaming; gzip si el cliente lo acepta)
+// Registrada antes de /:id, que si no la capturaría con id='export.csv'
+router.get('/supply/txs-db/export.csv', async (req, res) => {
+  const { type, user_ext, event_id, from, to, limit, order } = req.query || {};
+  const gzip = /\bgzip\b/i.test(String(req.headers['accept-encoding'] || ''));
+  res.setHeader('Content-Type', 'text/csv; charset=utf-8');
+  res.setHeader('Content-Disposition', 'attachment; filename="supply_txs_export.csv"');
+  res.setHeader('Vary', 'Accept-Encoding');
+  if (gzip) res.setHeader('Content-Encoding', 'gzip');
+  let out = res;
+  if (gzip) { out = zlib.createGzip({ level: 6 }); out.pipe(res); }
+  // si el cliente corta, se destruye el destino y el cursor se cierra
+  const abort = () => { if (!res.writableFinished) { try { if (out !== res) out.destroy(); } catch (_) {} } };
+  res.on('close', abort);
+  try {
+    await supplyRepo.streamSupplyTxsCsv({ type, user_ext, event_id, from, to, limit, order }, out);
+    out.end();
+  } catch (err) {
+    if (!res.headersSent) {
+      try { if (out !== res) { out.unpipe(res); out.destroy(); } } catch (_) {}
+      res.removeHeader('Content-Encoding');
+      res.removeHeader('Content-Disposition');
+      return res.status(500).json({ success: false, error: 'supply_txs_export_error' });
+    }
+    try { out.destroy(err); res.destroy(err); } catch (_) {}
+  }
+});
+
 // GET /api/economy/supply/txs-db/:id
 router.get('/supply/txs-db/:id', async (req, res) => {
   try {
@@ -27,19 +59,6 @@ router.get('/supply/txs-db/:id', async (req, res) => {
   }
 });
 
-// GET /api/economy/supply/txs-db/export.csv
-router.get('/supply/txs-db/export.csv', async (req, res) => {
-  try {
-    const { type, user_ext, event_id, from, to, limit, offset, order } = req.query || {};
-    const csv = await supplyRepo.exportSupplyTxsCsv({ type, user_ext, event_id, from, to, limit, offset, order });
-    res.setHeader('Content-Type', 'text/csv; charset=utf-8');
-    res.setHeader('Content-Disposition', 'attachment; filename="supply_txs_export.csv"');
-    res.send(csv);
-  } catch (err) {
-    res.status(500).json({ success: false, error: 'supply_txs_export_error' });
-  }
-});
-
 // GET /api/economy/supply
 router.get('/supply', async (req, res) => {
   try {
@@ -53,15 +72,32 @@ router.get('/supply', async (req, res) => {
 // GET /api/economy/reconcile
 router.get('/reconcile', (req, res) => {
   try {
+    // O(1) con el contador: diff es la deriva del último recuento periódico (0 si aún
+    // no hubo ninguno); ?full=1 fuerza el recuento completo ahora (sin corregir)
     const snap = store.getSupplySummary();
-    const sumBalances = Array.from(store.users.values()).reduce((acc, u) => acc + Math.max(0, Number(u.fires || 0)), 0);
-    const diff = Number(snap.circulating || 0) - sumBalances;
-    res.json({ success: true, total: snap.total, burned: snap.burned, circulating: snap.circulating, sumBalances, reserve: snap.reserve, diff });
+    const full = String(req.query.full || '') === '1';
+    const check = full ? store.rederiveCirculation({ fix: false }) : store.lastCirculationCheck;
+    const sumBalances = full ? check.actual : Number(snap.circulating || 0);
+    const diff = check ? Number(check.drift || 0) : 0;
+    res.json({ success: true, total: snap.total, burned: snap.burned, circulating: snap.circulating, sumBalances, reserve: snap.reserve, diff, lastCheck: check || null });
   } catch (err) {
     res.status(500).json({ success: false, error: 'reconcile_error' });
   }
 });
 
+// GET /api/economy/supply/drift (admin) — recuento completo del circulante en memoria y DB
+router.get('/supply/drift', adminAuth, async (req, res) => {
+  try {
+    const fix = String(req.query.fix || '') === '1';
+    const memory = store.rederiveCirculation({ fix });
+    let database = null;
+    try { database = await supplyRepo.rederiveCirculating({ fix }); } catch (_) { database = supplyRepo.getLastDriftCheck(); }
+    res.json({ success: true, memory, database });
+  } catch (err) {
+    res.status(500).json({ success: false, error: 'supply_drift_error' });
+  }
+});
+
 // GET /api/economy/circulation/status
 router.get('/circulation/status', (req, res) => {
   try {
@@ -88,13 +124,15 @@ router.post('/circulation/assign-initial', adminAuth, (req, res) => {
   }
 });
 
-// GET /api/economy/supply/txs?limit=&offset=
+// GET /api/economy/supply/txs?limit=&offset=&cursor=
 router.get('/supply/txs', (req, res) => {
   try {
     const limit = Math.max(1, Math.min(100, parseInt(req.query.limit || '20', 10) || 20));
     const offset = Math.max(0, parseInt(req.query.offset || '0', 10) || 0);
-    const items = store.txs.slice(offset, offset + limit);
-    res.json({ success: true, items, limit, offset });
+    const cursor = req.query.cursor ? String(req.query.cursor) : null;
+    if (cursor !== null && !/^\d+$/.test(cursor)) return res.status(400).json({ success: false, error: 'invalid_cursor' });
+    const { items, nextCursor } = store.listTxs({ limit, offset, cursor });
+    res.json({ success: true, items, limit, offset, nextCursor });
   } catch (err) {
     res.status(500).json({ success: false, error: 'tx_list_error' });
   }
@@ -109,26 +147,18 @@ router.get('/supply/stream', async (req, res) => {
   });
   res.flushHeaders && res.flushHeaders();
 
-  const sendEvent = (name, payload) => {
-    try {
-      res.write(`event: ${name}\n`);
-      res.write(`data: ${JSON.stringify(payload)}\n\n`);
-    } catch (_) {}
-  };
-
-  // initial snapshot desde DB
-  try { const snap = await supplyRepo.getDashboardSnapshot(); sendEvent('supply', { value: snap, ts: Date.now() }); } catch(_){}
-
-  // heartbeat + polling
+  const write = (frame) => { try { res.write(frame); } catch (_) {} };
+  let unsubscribe = null;
+  let closed = false;
   const hb = setInterval(() => { try { res.write(': ping\n\n'); } catch (_) {} }, 15000);
-  const poll = setInterval(async () => {
-    try { const snap = await supplyRepo.getDashboardSnapshot(); sendEvent('supply', { value: snap, ts: Date.now() }); } catch(_){}
-  }, 5000);
-
   req.on('close', () => {
+    closed = true;
     clearInterval(hb);
-    clearInterval(poll);
+    if (unsubscribe) unsubscribe(); else supplyHub.unsubscribe(write);
   });
+  // snapshot inicial + actualizaciones desde el difusor compartido
+  unsubscribe = await supplyHub.subscribe(write);
+  if (closed) unsubscribe();
 });
 
 // POST /api/economy/supply/burn { amount }
@@ -148,12 +178,29 @@ router.post('/supply/burn', adminAuth, (req, res) => {
 // POST /api/economy/supply/backfill/welcome-bonus (admin)
 router.post('/supply/backfill/welcome-bonus', adminAuth, async (req, res) => {
   try {
-    const { from, to, limit, dryRun } = req.body || {};
-    const out = await supplyRepo.backfillWelcomeBonus({ from, to, limit, dryRun });
+    const { from, to, limit, dryRun, background, chunkSize, restart } = req.body || {};
+    // background=true: job por lotes reanudable; consultar progreso en /status
+    if (background && !dryRun) {
+      const job = await welcomeBackfillJob.start({ from, to, chunkSize, restart: !!restart });
+      return res.status(202).json({ success: true, job });
+    }
+    const out = await supplyRepo.backfillWelcomeBonus({ from, to, limit, dryRun, chunkSize });
     res.json({ success: true, result: out });
   } catch (err) {
+    if (err && err.message === 'backfill_running') return res.status(409).json({ success: false, error: 'backfill_running', job: welcomeBackfillJob.getStatus() });
     res.status(500).json({ success: false, error: 'backfill_error' });
   }
 });
 
+// GET /api/economy/supply/backfill/welcome-bonus/status (admin)
+router.get('/supply/backfill/welcome-bonus/status', adminAuth, (req, res) => {
+  res.json({ success: true, job: welcomeBackfillJob.getStatus() });
+});
+
+// POST /api/economy/supply/backfill/welcome-bonus/cancel (admin) — el checkpoint permite reanudar
+router.post('/supply/backfill/welcome-bonus/cancel', adminAuth, (req, res) => {
+  const cancelled = welcomeBackfillJob.cancel();
+  res.json({ success: true, cancelled, job: welcomeBackfillJob.getStatus() });
+});
+
 module.exports = router;
@@ -18,12 +18,14 @@ router.get('/users', (req, res) => {
   }
 });
 
-// GET /api/economy/history/:userId?limit=&offset=
+// GET /api/economy/history/:userId?limit=&offset=&cursor=
 router.get('/history/:userId', (req, res) => {
   try {
     const { userId } = req.params;
     const { limit, offset } = req.query;
-    const out = store.getUserHistory(userId, { limit, offset });
+    const cursor = req.query.cursor ? String(req.query.cursor) : null;
+    if (cursor !== null && !/^\d+$/.test(cursor)) return res.status(400).json({ success: false, error: 'invalid_cursor' });
+    const out = store.getUserHistory(userId, { limit, offset, cursor });
     res.json({ success: true, ...out });
   } catch (err) {
     res.status(500).json({ success: false, error: 'user_history_error' });
@@ -98,31 +98,37 @@ router.post('/fire-requests/create', async (req, res) => {
   }
 });
 
-// GET /api/economy/fire-requests/my/:userId
+// GET /api/economy/fire-requests/my/:userId?limit=&offset=&status=&cursor=
 router.get('/fire-requests/my/:userId', async (req, res) => {
   try {
-    if (!fireRepo) return res.status(503).json({ success:false, error:'repo_unavailable' });
     const realUserId = preferSessionUserId(req, req.params && req.params.userId);
-    const { limit, offset, status } = req.query || {};
-    const out = await fireRepo.listByUser(realUserId, { limit, offset, status });
-    res.json({ success: true, ...out });
+    const { limit, offset, status, cursor } = req.query || {};
+    if (fireRepo) {
+      const out = await fireRepo.listByUser(realUserId, { limit, offset, status, cursor });
+      res.json({ success: true, ...out });
+    } else {
+      const out = mem.listFireRequestsByUser(realUserId, { limit, offset, status, cursor });
+      res.json({ success: true, ...out });
+    }
   } catch (err) {
+    if (err && err.message === 'invalid_cursor') return res.status(400).json({ success: false, error: 'invalid_cursor' });
     res.status(500).json({ success: false, error: 'list_my_error' });
   }
 });
 
-// GET /api/economy/fire-requests/pending (admin)
+// GET /api/economy/fire-requests/pending?limit=&offset=&cursor= (admin)
 router.get('/fire-requests/pending', toteOrAdmin, async (req, res) => {
   try {
-    const { limit, offset } = req.query || {};
+    const { limit, offset, cursor } = req.query || {};
     if (fireRepo) {
-      const out = await fireRepo.listAll({ status: 'pending', limit, offset });
+      const out = await fireRepo.listAll({ status: 'pending', limit, offset, cursor });
       res.json({ success: true, ...out });
     } else {
-      const out = mem.listFireRequests({ status: 'pending', limit, offset });
+      const out = mem.listFireRequests({ status: 'pending', limit, offset, cursor });
       res.json({ success: true, ...out });
     }
   } catch (err) {
+    if (err && err.message === 'invalid_cursor') return res.status(400).json({ success: false, error: 'invalid_cursor' });
     res.status(500).json({ success: false, error: 'list_pending_error' });
   }
 });
@@ -130,15 +136,16 @@ router.get('/fire-requests/pending', toteOrAdmin, async (req, res) => {
 // GET /api/economy/fire-requests/list?status=(accepted|rejected|pending) (admin)
 router.get('/fire-requests/list', toteOrAdmin, async (req, res) => {
   try {
-    const { status, limit, offset } = req.query || {};
+    const { status, limit, offset, cursor } = req.query || {};
     if (fireRepo) {
-      const out = await fireRepo.listAll({ status, limit, offset });
+      const out = await fireRepo.listAll({ status, limit, offset, cursor });
       res.json({ success: true, ...out });
     } else {
-      const out = mem.listFireRequests({ status, limit, offset });
+      const out = mem.listFireRequests({ status, limit, offset, cursor });
       res.json({ success: true, ...out });
     }
   } catch (err) {
+    if (err && err.message === 'invalid_cursor') return res.status(400).json({ success: false, error: 'invalid_cursor' });
     res.status(500).json({ success: false, error: 'list_error' });
   }
 });
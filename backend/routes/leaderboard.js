@@ -0,0 +1,57 @@
+const express = require('express');
+const router = express.Router();
+const store = require('../services/memoryStore');
+const Leaderboards = require('../services/leaderboards');
+const { preferSessionUserId } = require('../middleware/sessionUser');
+
+// Respuestas del top serializadas una vez por versión de tabla; el TTL solo
+// refresca los userName. Express añade ETag y responde 304 si el cliente ya la tiene.
+const CACHE_MS = Math.max(0, parseInt(process.env.LEADERBOARD_CACHE_MS || '10000', 10) || 0);
+const cache = new Map(); // game|window|limit|offset -> { version, at, body }
+
+function parseQuery(req) {
+  const game = String(req.params.game || 'overall').toLowerCase();
+  const window = String((req.query && req.query.window) || 'all').toLowerCase();
+  if (!Leaderboards.isGame(game)) return { error: 'invalid_game' };
+  if (!Leaderboards.isWindow(window)) return { error: 'invalid_window' };
+  return { game, window };
+}
+
+// GET /api/leaderboard/:game(overall|tictactoe|bingo)?window=all|daily|weekly&limit=&offset=
+router.get('/:game', (req, res) => {
+  try {
+    const q = parseQuery(req);
+    if (q.error) return res.status(400).json({ success: false, error: q.error });
+    const limit = Math.max(1, Math.min(100, Number(req.query.limit) || 10));
+    const offset = Math.max(0, Number(req.query.offset) || 0);
+    const key = [q.game, q.window, limit, offset].join('|');
+    const version = store.leaderboards.versionOf(q);
+    let hit = cache.get(key);
+    if (!hit || hit.version !== version || Date.now() - hit.at > CACHE_MS) {
+      const out = store.getLeaderboard({ ...q, limit, offset });
+      hit = { version, at: Date.now(), body: JSON.stringify({ success: true, ...out }) };
+      if (cache.size > 500) cache.clear();
+      cache.set(key, hit);
+    }
+    res.set('Cache-Control', `public, max-age=${Math.floor(CACHE_MS / 1000)}`);
+    res.type('json').send(hit.body);
+  } catch (err) {
+    res.status(500).json({ success: false, error: 'leaderboard_error' });
+  }
+});
+
+// GET /api/leaderboard/:game/me/:userId?window=&k=  (posición propia ± k)
+router.get('/:game/me/:userId', (req, res) => {
+  try {
+    const q = parseQuery(req);
+    if (q.error) return res.status(400).json({ success: false, error: q.error });
+    const userId = preferSessionUserId(req, req.params.userId);
+    const out = store.getLeaderboardAround({ ...q, userId, k: req.query.k });
+    res.set('Cache-Control', 'private, no-cache');
+    res.json({ success: true, ...out });
+  } catch (err) {
+    res.status(500).json({ success: false, error: 'leaderboard_error' });
+  }
+});
+
+module.exports = router;
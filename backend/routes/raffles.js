@@ -9,6 +9,51 @@ const { preferSessionUserId, requireSessionUser, UserIdError } = require('../mid
 const messages = require('../services/messageStore');
 const https = require('https');
 const { URL } = require('url');
+const { ReplayBuffer, sseFrame, lastEventIdOf } = require('../services/roomFeed');
+
+// Stream de rifas: cada 'raffle_updated' recibe un id monotónico por rifa; la trama
+// 'update' se construye y serializa una sola vez para todos los suscriptores y se
+// guarda en un anillo para las reconexiones con Last-Event-ID. Tras irse el último
+// suscriptor el anillo sigue recibiendo mensajes durante RAFFLE_REPLAY_GRACE_MS (la
+// trama solo se construye si alguien la pide), así un único espectador que reconecta
+// no cae en snapshot; pasado ese margen se olvidan anillo e id de la rifa.
+const RAFFLE_REPLAY_GRACE_MS = Math.max(0, parseInt(process.env.RAFFLE_REPLAY_GRACE_MS || '60000', 10) || 0);
+const raffleSeq = new Map(); // raffleId -> último id de evento
+const raffleSubs = new Map(); // raffleId -> Set(write)
+const raffleIdle = new Map(); // raffleId -> instante en que se fue el último suscriptor
+const raffleReplay = new ReplayBuffer(Math.max(1, parseInt(process.env.SSE_REPLAY_SIZE || '32', 10) || 32));
+
+function raffleMessage(id, v, ev) {
+  const ts = Date.now(); let frame = null;
+  return { v, get frame() {
+    if (frame === null) frame = sseFrame('update', { delta: { idx: ev.idx, action: ev.action }, raffle: raffles.details(id), ts }, v);
+    return frame;
+  } };
+}
+
+function forgetRaffle(id) { raffleReplay.drop(id); raffleSeq.delete(id); raffleIdle.delete(id); }
+
+raffles.on('raffle_updated', (ev) => {
+  if (!ev || !ev.id) return;
+  const id = String(ev.id);
+  const subs = raffleSubs.get(id);
+  const live = !!(subs && subs.size);
+  if (!live) {
+    const left = raffleIdle.get(id);
+    if (left === undefined || Date.now() - left > RAFFLE_REPLAY_GRACE_MS) { forgetRaffle(id); return; }
+  }
+  const v = (raffleSeq.get(id) || 0) + 1; raffleSeq.set(id, v);
+  const msg = raffleMessage(id, v, ev);
+  raffleReplay.push(id, msg);
+  if (live) { const frame = msg.frame; for (const w of subs) w(frame); }
+});
+
+// Rifas sin suscriptores ni actualizaciones: liberar anillo e id pasado el margen
+const raffleIdleGc = setInterval(() => {
+  const now = Date.now();
+  for (const [id, left] of raffleIdle) { if (now - left > RAFFLE_REPLAY_GRACE_MS) forgetRaffle(id); }
+}, Math.max(1000, RAFFLE_REPLAY_GRACE_MS));
+try { raffleIdleGc.unref(); } catch(_) {}
 
 function postJSON(urlStr, data) {
   return new Promise((resolve) => {
@@ -198,18 +243,25 @@ router.get('/:id/stream', (req, res) => {
     res.set({ 'Content-Type':'text/event-stream', 'Cache-Control':'no-cache', Connection:'keep-alive' });
     res.flushHeaders && res.flushHeaders();
 
-    const send = (name, payload)=>{ try{ res.write(`event: ${name}\n`); res.write(`data: ${JSON.stringify(payload)}\n\n`); }catch(_){ } };
+    const write = (frame)=>{ try{ res.write(frame); }catch(_){ } };
 
-    // snapshot inicial
-    send('snapshot', { raffle: raffles.details(id), ts: Date.now() });
+    // Reconexión: cada 'update' lleva la rifa completa, basta la última perdida;
+    // sin hueco no se envía nada y si el hueco salió del anillo, snapshot
+    const lastId = lastEventIdOf(req);
+    const missed = lastId !== null ? raffleReplay.since(id, lastId) : null;
+    if (missed) { if (missed.length) write(missed[missed.length - 1].frame); }
+    else write(sseFrame('snapshot', { raffle: raffles.details(id), ts: Date.now() }, raffleSeq.get(id) || 0));
 
     // heartbeat
     const hb = setInterval(()=>{ try{ res.write(': ping\n\n'); }catch(_){ } }, 15000);
 
-    const onUpd = (ev)=>{ if (!ev || ev.id!==id) return; send('update', { delta: { idx: ev.idx, action: ev.action }, raffle: raffles.details(id), ts: Date.now() }); };
-    raffles.on('raffle_updated', onUpd);
+    let subs = raffleSubs.get(id); if (!subs) { subs = new Set(); raffleSubs.set(id, subs); }
+    subs.add(write); raffleIdle.delete(id);
 
-    req.on('close', ()=>{ clearInterval(hb); raffles.off('raffle_updated', onUpd); });
+    req.on('close', ()=>{
+      clearInterval(hb); subs.delete(write);
+      if (!subs.size && raffleSubs.get(id) === subs) { raffleSubs.delete(id); raffleIdle.set(id, Date.now()); }
+    });
   }catch(_){ try{ res.status(500).end(); }catch(__){} }
 });
 
@@ -2,6 +2,7 @@ const express = require('express');
 const router = express.Router();
 let store = null; try { store = (String(process.env.TTT_V2||'false').toLowerCase()==='true') ? require('../services/ttt2/roomService') : require('../services/tictactoeStore'); } catch(_) { store = require('../services/tictactoeStore'); }
 const { preferSessionUserId } = require('../middleware/sessionUser');
+const { sseFrame, lastEventIdOf } = require('../services/roomFeed');
 
 router.post('/rooms', (req, res) => {
   try {
@@ -111,17 +112,24 @@ router.get('/rooms/:id/state', (req, res) => {
 
 router.get('/rooms/:id/stream', (req, res) => {
   const roomId = String(req.params.id || '');
-  const state = store.getState(roomId);
-  if (!state) return res.status(404).end();
+  // Reconexión con Last-Event-ID: solo los mensajes perdidos si siguen en el anillo
+  const lastId = lastEventIdOf(req);
+  const missed = (lastId !== null && store.rooms.has(roomId)) ? store.replay.since(roomId, lastId) : null;
+  const state = missed ? null : store.getState(roomId);
+  if (!missed && !state) return res.status(404).end();
 
   res.set({ 'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache', Connection: 'keep-alive' });
   res.flushHeaders && res.flushHeaders();
 
-  const send = (name, payload) => {
-    try { res.write(`event: ${name}\n`); res.write(`data: ${JSON.stringify(payload)}\n\n`); } catch (_) {}
-  };
-  send('state', state);
-  const off = store.onRoom(roomId, (s) => send('state', s));
+  const write = (frame) => { try { res.write(frame); } catch (_) {} };
+  // Cada suscriptor recuerda la versión enviada: delta si la tiene, estado completo si no
+  let v;
+  if (missed) { v = Number(lastId); for (const m of missed) { write(m.frameFor(v)); v = m.v; } }
+  else { v = Number(state.v || 0); write(sseFrame('state', state, v)); }
+  const off = store.onRoom(roomId, (s, msg) => {
+    if (!msg) return write(sseFrame('state', s));
+    write(msg.frameFor(v)); v = msg.v;
+  });
   const hb = setInterval(() => { try { res.write(': ping\n\n'); } catch (_) {} }, 15000);
 
   req.on('close', () => { clearInterval(hb); off(); });
@@ -158,12 +166,14 @@ router.patch('/rooms/:id/options', (req, res) => {
   }
 });
 
-// GET /api/games/tictactoe/public-rooms
+// GET /api/games/tictactoe/public-rooms?limit=&cursor=
 router.get('/public-rooms', (req, res) => {
   try {
-    const rooms = store.listPublicRooms();
-    res.json({ success: true, rooms });
+    const { limit, cursor } = req.query || {};
+    const { rooms, nextCursor, total } = store.pagePublicRooms({ limit, cursor });
+    res.json({ success: true, rooms, nextCursor, total });
   } catch (e) {
+    if (e && e.message === 'invalid_cursor') return res.status(400).json({ success: false, error: 'invalid_cursor' });
     res.status(500).json({ success: false, error: 'public_list_error' });
   }
 });
@@ -23,10 +23,26 @@ let marketRoutes = null; try { marketRoutes = require('./routes/market'); } catc
 let gamesLobbyRoutes = null; try { gamesLobbyRoutes = require('./routes/games_lobby'); } catch(_) { gamesLobbyRoutes = null; }
 const musicRoutes = require('./routes/music');
 const store = require('./services/memoryStore');
+const PresenceTracker = require('./services/presenceTracker');
 const auth = require('./services/authStore');
 let db = null; try { db = require('./db'); } catch(_) { db = null; }
+const connLog = require('./services/connectionLogWriter');
+const userResolver = require('./services/userResolver');
+const memoryPersistence = require('./services/memoryPersistence');
+const adminAuth = require('./middleware/adminAuth');
 const welcomeRoutes = require('./routes/welcome');
 const adminWelcomeRoutes = require('./routes/admin_welcome');
+const leaderboardRoutes = require('./routes/leaderboard');
+const RoomLifecycle = require('./services/roomLifecycle');
+const roomArchive = require('./services/roomArchive');
+
+// GC de salas en memoria: TTL de salas terminadas y de salas sin actividad
+const roomTtl = {
+  finishedTtlMs: Math.max(1000, parseInt(process.env.ROOM_FINISHED_TTL_MS || '600000', 10) || 600000),
+  idleTtlMs: Math.max(1000, parseInt(process.env.ROOM_IDLE_TTL_MS || '3600000', 10) || 3600000)
+};
+const roomGc = [new RoomLifecycle({ game: 'tictactoe', store: tttStore, ...roomTtl })];
+if (String(process.env.BINGO_BACKEND || '').toLowerCase() !== 'sql') roomGc.push(new RoomLifecycle({ game: 'bingo', store: require('./services/bingoStore'), ...roomTtl }));
 
 const app = express();
 // Sentry init (si DSN disponible)
@@ -117,34 +133,18 @@ app.use((req, res, next) => {
       ]);
     }
     const ua = String(req.headers['user-agent'] || '');
+    const game = PresenceTracker.gameOfPath(req.path);
     if (req.sessionUserId) {
-      try { store.touchUser(req.sessionUserId, { ua }); } catch (_) {}
+      try { store.touchUser(req.sessionUserId, { ua, game }); } catch (_) {}
     } else {
-      try { store.touchUser('anon:' + uid, { ua }); } catch (_) {}
+      try { store.touchUser('anon:' + uid, { ua, game }); } catch (_) {}
     }
-    // Log a Postgres (connection_logs) y actualizar last_seen_at cuando aplique
+    // Log a Postgres (connection_logs) y last_seen_at: se encola y se escribe por lotes
     try {
-      if (db && db.query) {
+      if (connLog.enabled()) {
         const ip = (req.headers['x-forwarded-for'] || req.ip || '').toString().split(',')[0].trim();
         const platform = String(req.headers['sec-ch-ua-platform'] || '').replace(/\"/g,'') || (/(Android|iPhone|iPad|Windows|Mac|Linux)/i.exec(ua)?.[1] || 'unknown');
-        const sess = String(req.sessionUserId || '');
-        const run = async () => {
-          let pgUserId = null;
-          if (sess.startsWith('db:')) { pgUserId = sess.slice(3); }
-          else if (sess.startsWith('tg:')) {
-            const tg = sess.slice(3);
-            const r = await db.query('SELECT id FROM users WHERE tg_id = $1 LIMIT 1', [tg]);
-            if (r.rows && r.rows[0]) pgUserId = r.rows[0].id;
-          }
-          if (pgUserId) {
-            try { await db.query('UPDATE users SET last_seen_at = NOW(), updated_at = NOW() WHERE id = $1', [pgUserId]); } catch(_){}
-            try { await db.query('INSERT INTO connection_logs (user_id, ua, platform, ip) VALUES ($1,$2,$3,$4)', [pgUserId, ua, platform, ip]); } catch(_){}
-          } else {
-            try { await db.query('INSERT INTO connection_logs (ua, platform, ip) VALUES ($1,$2,$3)', [ua, platform, ip]); } catch(_){}
-          }
-        };
-        // no bloquear request
-        Promise.resolve(run()).catch(()=>{});
+        connLog.record({ sess: String(req.sessionUserId || ''), ua, platform, ip });
       }
     } catch (_) {}
   } catch (_) {}
@@ -202,6 +202,7 @@ app.use('/api/welcome', welcomeRoutes);
 app.use('/api/admin/welcome', adminWelcomeRoutes);
 app.use('/telegram', telegramRoutes);
 app.use('/api/profile', profileRoutes);
+app.use('/api/leaderboard', leaderboardRoutes);
 app.use('/api/games/tictactoe', tttRoutes);
 app.use('/api/games/bingo', bingoRoutes);
 try { if (gamesLobbyRoutes) app.use('/api/games/lobby', gamesLobbyRoutes); } catch(_) {}
@@ -274,6 +275,16 @@ app.get('/api/db/health', async (req, res) => {
   }
 });
 
+// Métricas de la cola de connection_logs (admin)
+app.get('/api/db/ingest', adminAuth, (req, res) => {
+  res.json({ success: true, connectionLogs: connLog.getStats(), userResolver: userResolver.getStats(), memoryPersistence: memoryPersistence.getStats(), schema: (()=>{ try { return require('./db/schema').status(); } catch(_) { return null; } })() });
+});
+
+// Métricas de salas vivas/archivadas (admin)
+app.get('/api/rooms/stats', adminAuth, (req, res) => {
+  res.json({ success: true, rooms: roomGc.map((gc) => gc.getStats()), archive: roomArchive.getStats() });
+});
+
 // 404 handler
 app.use((req, res) => {
   res.status(404).json({ success: false, error: 'not_found' });
@@ -287,13 +298,14 @@ app.use((err, req, res, next) => {
   res.status(500).json({ success: false, error: 'server_error' });
 });
 
-app.listen(PORT, () => {
+const startServer = () => app.listen(PORT, () => {
   logger.info(`Server listening on port ${PORT}`);
   // Verificar conexión a DB (si está configurada)
   try {
     if (db && db.query) {
       db.query('select version()').then(()=>{
         logger.info('PostgreSQL conectado correctamente');
+        return require('./db/schema').bootstrap().then((st)=>{ logger.info('Esquema verificado', st); });
       }).catch((err)=>{
         logger.warn('PostgreSQL no disponible', { error: String(err && err.message || err) });
       });
@@ -313,8 +325,26 @@ app.listen(PORT, () => {
       logger.info('Welcome auto-start disabled');
     }
   } catch (_) {}
+  // Re-derivación periódica del circulante incremental (memoria y DB): corrige y reporta deriva
+  try {
+    const driftMs = Math.max(10000, parseInt(process.env.SUPPLY_DRIFT_CHECK_MS || '300000', 10) || 300000);
+    const driftTimer = setInterval(async () => {
+      try {
+        const m = store.rederiveCirculation();
+        if (m.drift !== 0) logger.warn('Circulación en memoria con deriva', m);
+      } catch (_) {}
+      try {
+        if (db && db.query) {
+          const r = await require('./repos/supplyRepo').rederiveCirculating();
+          if (r && r.drift !== 0) logger.warn('Circulación DB con deriva', r);
+        }
+      } catch (err) { logger.warn('Supply drift check failed', { error: String(err && err.message || err) }); }
+    }, driftMs);
+    try { driftTimer.unref(); } catch (_) {}
+  } catch (_) {}
   try {
-    const interval = Math.max(500, parseInt(process.env.TTT_TICK_INTERVAL_MS || '1000', 10) || 1000);
+    // Único ticker de TicTacToe: solo procesa salas con vencimiento cumplido (heap de deadlines)
+    const interval = Math.max(500, parseInt(process.env.TTT_TICK_INTERVAL_MS || process.env.TTT_TICK_MS || '1000', 10) || 1000);
     setInterval(() => {
       try { tttStore.tick(); } catch (err) { logger.error('TTT tick error', err); }
     }, interval);
@@ -322,6 +352,16 @@ app.listen(PORT, () => {
   } catch (err) {
     logger.error('Failed to start TTT tick loop', err);
   }
+  try {
+    const gcMs = Math.max(5000, parseInt(process.env.ROOM_GC_INTERVAL_MS || '60000', 10) || 60000);
+    const gcTimer = setInterval(() => {
+      for (const gc of roomGc) { try { gc.sweep(); } catch (err) { logger.error('Room GC error', err); } }
+    }, gcMs);
+    try { gcTimer.unref(); } catch (_) {}
+    logger.info(`Room GC started (interval ${gcMs} ms)`);
+  } catch (err) {
+    logger.error('Failed to start room GC', err);
+  }
   try {
     if (auth && typeof auth.getUserByEmail === 'function' && typeof auth.createEmailUser === 'function') {
       const email = 'pruebatote@example.com';
@@ -348,7 +388,9 @@ app.listen(PORT, () => {
   } catch(_) {}
 });
 
-// Ticker para TicTacToe: rota turno por timeout y emite SSE
-setInterval(() => {
-  try { tttStore.tick(); } catch (_) {}
-}, Math.max(500, Math.min(2000, parseInt(process.env.TTT_TICK_MS || '1000', 10) || 1000)));
+// Restaurar MemoryStore (snapshot + cola del log) antes de aceptar tráfico
+// Si la recuperación falla no se arranca: sin persistencia enganchada las mutaciones
+// se perderían y un snapshot posterior podría pisar el estado bueno en disco
+memoryPersistence.recover(store)
+  .then((r) => { logger.info('MemoryStore restaurado', r); startServer(); })
+  .catch((err) => { logger.error('MemoryStore recovery failed, not starting', err); process.exit(1); });
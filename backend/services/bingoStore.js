@@ -1,13 +1,20 @@
 const EventEmitter = require('events');
 const mem = require('./memoryStore');
+const { RoomMessage, ReplayBuffer } = require('./roomFeed');
 
 const SPONSOR_ID = 'tg:1417856820';
 
+// Estado visible para cualquier espectador: jugadores sin cartones
+function publicView(s) {
+  return { ...s, players: s.players.map(p => ({ userId: p.userId, ready: p.ready, cardsCount: p.cardsCount })) };
+}
+
 class BingoStore extends EventEmitter {
   constructor() {
     super();
     this.rooms = new Map();
     this.codeIndex = new Map();
+    this.replay = new ReplayBuffer(Math.max(1, parseInt(process.env.SSE_REPLAY_SIZE || '32', 10) || 32)); // últimos mensajes por sala (reconexión SSE)
     this.sponsorId = SPONSOR_ID;
   }
   potUserId(id){ return 'pot:' + String(id); }
@@ -61,6 +68,7 @@ class BingoStore extends EventEmitter {
       id,
       code: this.makeCode(),
       createdAt: Date.now(),
+      updatedAt: Date.now(), // última modificación (GC de salas)
       hostId: String(userId),
       visibility: (visibility === 'public' ? 'public' : 'private'),
       costType: ct,
@@ -94,6 +102,7 @@ class BingoStore extends EventEmitter {
     const players = Array.from(r.players.values()).map(p => ({ userId: p.userId, ready: p.ready, cardsCount: p.cardsCount, cards: p.cards && p.cards.length ? p.cards : undefined }));
     return {
       id: r.id,
+      v: r.v || 0,
       code: r.code,
       createdAt: r.createdAt,
       hostId: r.hostId,
@@ -145,7 +154,7 @@ class BingoStore extends EventEmitter {
       if (r.players.size >= 30) throw new Error('max_players');
       r.players.set(uid, { userId: uid, ready: false, cardsCount: 1, cards: [] });
     }
-    const s = this.getState(roomId); this.emit('room_update_' + r.id, s); return s;
+    const s = this.getState(roomId); this._publish(r, s); return s;
   }
   setOptions(roomId, userId, opts = {}) {
     const r = this.rooms.get(String(roomId));
@@ -157,7 +166,7 @@ class BingoStore extends EventEmitter {
     if (typeof opts.costValue !== 'undefined') { r.costValue = 1; }
     if (typeof opts.mode !== 'undefined') r.mode = (['linea','4c','carton'].includes(opts.mode) ? opts.mode : r.mode);
     if (typeof opts.ballSet !== 'undefined') r.ballSet = (['75','90'].includes(opts.ballSet) ? Number(opts.ballSet) : r.ballSet);
-    const s = this.getState(roomId); this.emit('room_update_' + r.id, s); return s;
+    const s = this.getState(roomId); this._publish(r, s); return s;
   }
   setReady(roomId, userId, { ready, cardsCount }) {
     const r = this.rooms.get(String(roomId));
@@ -167,7 +176,7 @@ class BingoStore extends EventEmitter {
     const p = r.players.get(uid); if (!p) throw new Error('not_in_room');
     if (typeof cardsCount !== 'undefined') p.cardsCount = Math.max(1, Math.min(10, Number(cardsCount) || 1));
     if (typeof ready !== 'undefined') p.ready = !!ready;
-    const s = this.getState(roomId); this.emit('room_update_' + r.id, s); return s;
+    const s = this.getState(roomId); this._publish(r, s); return s;
   }
   start({ roomId, userId }) {
     const r = this.rooms.get(String(roomId)); if (!r) throw new Error('room_not_found');
@@ -189,24 +198,28 @@ class BingoStore extends EventEmitter {
         if (isHost) {
           const dep = mem.transferFires({ fromUserId: p.userId, toUserId: potId, amount: 10, reason: 'bingo_host_open_fire' });
           if (!dep || !dep.ok) { p.ready=false; p.cards=[]; continue; }
+          p.paid = (p.paid||0) + 10;
           paidCount++;
         }
         const total = Math.max(0, Number(p.cardsCount||0)) * 1;
         if (total>0){
           const tr = mem.transferFires({ fromUserId: p.userId, toUserId: potId, amount: total, reason: 'bingo_entry_fire' });
           if (!tr || !tr.ok) { p.ready=false; p.cards=[]; continue; }
+          p.paid = (p.paid||0) + total;
           paidCount++;
         }
       } else if (r.costType === 'coins') {
         if (isHost) {
           const dep = mem.transferCoins({ fromUserId: p.userId, toUserId: potId, amount: 10, reason: 'bingo_host_open_coin' });
           if (!dep || !dep.ok) { p.ready=false; p.cards=[]; continue; }
+          p.paid = (p.paid||0) + 10;
           paidCount++;
         }
         const total = Math.max(0, Number(p.cardsCount||0)) * 1;
         if (total>0){
           const tr = mem.transferCoins({ fromUserId: p.userId, toUserId: potId, amount: total, reason: 'bingo_entry_coin' });
           if (!tr || !tr.ok) { p.ready=false; p.cards=[]; continue; }
+          p.paid = (p.paid||0) + total;
           paidCount++;
         }
       }
@@ -215,7 +228,7 @@ class BingoStore extends EventEmitter {
     r.drawQueue = this.makeBag(r.ballSet);
     r.called = []; r.lastCall = null; r.winners = [];
     r.status = 'playing';
-    const s = this.getState(roomId); this.emit('room_update_' + r.id, s); return s;
+    const s = this.getState(roomId); this._publish(r, s); return s;
   }
 
   makeBag(ballSet = 90) {
@@ -264,7 +277,8 @@ class BingoStore extends EventEmitter {
     if (r.drawQueue.length === 0) throw new Error('empty_bag');
     const n = r.drawQueue.shift();
     r.called.push(n); r.lastCall = n;
-    const s = this.getState(roomId); this.emit('room_update_' + r.id, s); return s;
+    // Bola nueva: los streams reciben solo { v, call }
+    const s = this.getState(roomId); this._publish(r, s, { call: n }); return s;
   }
 
   claim(roomId, userId, { cardIndex = 0 } = {}) {
@@ -296,15 +310,23 @@ class BingoStore extends EventEmitter {
     let wFires=0,hFires=0,sFires=0,wCoins=0,hCoins=0,sCoins=0;
     if (r.costType === 'fuego' && curF>0){
       wFires = Math.floor(curF*0.70); hFires = Math.floor(curF*0.20); sFires = Math.max(0, curF - wFires - hFires);
-      try{ if (wFires>0) mem.transferFires({ fromUserId: potId, toUserId: p.userId, amount: wFires, reason: 'bingo_win_70' }); }catch(_){ }
-      try{ if (hFires>0) mem.transferFires({ fromUserId: potId, toUserId: r.hostId, amount: hFires, reason: 'bingo_host_20' }); }catch(_){ }
-      try{ if (sFires>0) mem.transferFires({ fromUserId: potId, toUserId: this.sponsorId, amount: sFires, reason: 'bingo_sponsor_10' }); }catch(_){ }
+      const rp = mem.postLedger({ currency: 'fires', reason: 'bingo_payout', ref: r.id, legs: [
+        { fromUserId: potId, toUserId: p.userId, amount: wFires, reason: 'bingo_win_70' },
+        { fromUserId: potId, toUserId: r.hostId, amount: hFires, reason: 'bingo_host_20' },
+        { fromUserId: potId, toUserId: this.sponsorId, amount: sFires, reason: 'bingo_sponsor_10' }
+      ] });
+      if (!rp || !rp.ok) { wFires = 0; hFires = 0; sFires = 0; }
     } else if (r.costType === 'coins' && curC>0){
       wCoins = Math.floor(curC*0.70); hCoins = Math.floor(curC*0.20); sCoins = Math.max(0, curC - wCoins - hCoins);
-      try{ if (wCoins>0) mem.transferCoins({ fromUserId: potId, toUserId: p.userId, amount: wCoins, reason: 'bingo_win_coins_70' }); }catch(_){ }
-      try{ if (hCoins>0) mem.transferCoins({ fromUserId: potId, toUserId: r.hostId, amount: hCoins, reason: 'bingo_host_coins_20' }); }catch(_){ }
-      try{ if (sCoins>0) mem.transferCoins({ fromUserId: potId, toUserId: this.sponsorId, amount: sCoins, reason: 'bingo_sponsor_coins_10' }); }catch(_){ }
+      const rp = mem.postLedger({ currency: 'coins', reason: 'bingo_payout', ref: r.id, legs: [
+        { fromUserId: potId, toUserId: p.userId, amount: wCoins, reason: 'bingo_win_coins_70' },
+        { fromUserId: potId, toUserId: r.hostId, amount: hCoins, reason: 'bingo_host_coins_20' },
+        { fromUserId: potId, toUserId: this.sponsorId, amount: sCoins, reason: 'bingo_sponsor_coins_10' }
+      ] });
+      if (!rp || !rp.ok) { wCoins = 0; hCoins = 0; sCoins = 0; }
     }
+    // Pot repartido: ya no queda nada que reembolsar a nadie
+    if ((wFires + hFires + sFires + wCoins + hCoins + sCoins) > 0) { for (const q of r.players.values()) q.paid = 0; }
 
     try {
       mem.recordBingoWin({
@@ -334,7 +356,7 @@ class BingoStore extends EventEmitter {
     };
     r.potFires = 0;
     r.potCoins = 0;
-    const s = this.getState(roomId); this.emit('room_update_' + r.id, s); return s;
+    const s = this.getState(roomId); this._publish(r, s); return s;
   }
 
   rematch(roomId, userId) {
@@ -352,7 +374,67 @@ class BingoStore extends EventEmitter {
     r.lastPayout = null;
     // Limpiar cartas y marcar no ready para todos, mantener cardsCount elegido
     for (const p of r.players.values()) { p.ready = false; p.cards = []; }
-    const s = this.getState(roomId); this.emit('room_update_' + r.id, s); return s;
+    const s = this.getState(roomId); this._publish(r, s); return s;
+  }
+
+  // Publica un cambio de estado: nueva versión y un único mensaje para los streams.
+  // La trama compartida no lleva cartones: cada suscriptor recibe solo los suyos
+  _publish(r, s, patch = null) {
+    r.v = (r.v || 0) + 1;
+    r.updatedAt = Date.now();
+    if (s) s.v = r.v;
+    const msg = new RoomMessage(r.v, s, patch, publicView);
+    this.replay.push(r.id, msg);
+    this.emit('room_update_' + r.id, s, msg);
+  }
+  // Estado para un espectador concreto: solo sus cartones
+  viewFor(s, userId) {
+    const uid = String(userId || '');
+    return { ...s, players: s.players.map(p => p.userId === uid ? p : { userId: p.userId, ready: p.ready, cardsCount: p.cardsCount }) };
+  }
+  cardsOf(roomId, userId) {
+    const r = this.rooms.get(String(roomId));
+    const p = r && r.players.get(String(userId));
+    return (p && p.cards) || null;
+  }
+
+  // Reembolso previo al desalojo de una sala sin terminar (roomLifecycle): cada
+  // jugador recupera del pot lo que pagó (depósito del host + cartones), en un asiento
+  refundRoom(r) {
+    if (!r || r.status === 'finished') return false;
+    const potId = this.potUserId(r.id);
+    const legs = [];
+    for (const p of r.players.values()) {
+      const a = Math.max(0, Number(p.paid || 0));
+      if (a > 0) legs.push({ fromUserId: potId, toUserId: p.userId, amount: a, reason: 'bingo_refund' });
+    }
+    if (!legs.length) return false;
+    const out = mem.postLedger({ currency: r.costType === 'coins' ? 'coins' : 'fires', reason: 'bingo_refund', ref: r.id, legs });
+    if (!out || !out.ok) return false;
+    for (const p of r.players.values()) p.paid = 0;
+    return true;
+  }
+
+  // Desalojo por el GC de salas (roomLifecycle): devuelve la sala cruda para archivarla
+  evictRoom(roomId) {
+    const r = this.rooms.get(String(roomId));
+    if (!r) return null;
+    this.rooms.delete(r.id);
+    if (this.codeIndex.get(r.code) === r.id) this.codeIndex.delete(r.code);
+    this.replay.drop(r.id);
+    return r;
+  }
+  archiveRecord(r) {
+    return {
+      players: Array.from(r.players.values()).map(p => ({ userId: p.userId, cardsCount: p.cardsCount })),
+      visibility: r.visibility,
+      costType: r.costType,
+      mode: r.mode,
+      ballSet: r.ballSet,
+      calledCount: r.called.length,
+      winners: [...r.winners],
+      lastPayout: r.lastPayout || null
+    };
   }
 
   onRoom(roomId, fn) { const ev = 'room_update_' + String(roomId); this.on(ev, fn); return () => this.off(ev, fn); }
@@ -1,5 +1,8 @@
 const EventEmitter = require('events');
 const db = require('../db');
+const userResolver = require('./userResolver');
+const supplyRepo = require('../repos/supplyRepo');
+const walletRepo = require('../repos/walletRepo');
 
 const SPONSOR_TG = 'tg:1417856820';
 
@@ -37,13 +40,7 @@ class BingoStoreSql extends EventEmitter {
   }
 
   async mapExtToDbUserId(userExt){
-    try{
-      const v = String(userExt||'').trim(); if(!v) return null;
-      if (v.startsWith('db:')) return v.slice(3);
-      if (v.startsWith('tg:')){ const tg=v.slice(3); const r=await db.query('SELECT id FROM users WHERE tg_id=$1 LIMIT 1',[tg]); return r.rows?.[0]?.id||null; }
-      if (v.startsWith('em:')){ const em=v.slice(3).toLowerCase(); const r=await db.query('SELECT id FROM users WHERE LOWER(email)=$1 LIMIT 1',[em]); return r.rows?.[0]?.id||null; }
-      return null;
-    }catch(_){ return null; }
+    try{ return await userResolver.resolve(userExt); }catch(_){ return null; }
   }
 
   async getState(roomId){
@@ -164,6 +161,7 @@ class BingoStoreSql extends EventEmitter {
         const cost = Number(p.cards_count||0) * 1;
         if (cost>0){ if (bal < cost) { throw new Error('insufficient_fires'); }
           await db.query('UPDATE wallets SET fires_balance=fires_balance-$2, updated_at=NOW() WHERE id=$1',[wid, cost]);
+          await supplyRepo.adjustCirculating(db, wid, -cost);
           await db.query('INSERT INTO wallet_transactions(wallet_id,type,amount_fire,reference,meta,created_at) VALUES ($1,$2,$3,$4,$5,NOW())',[wid,'bingo_entry', -cost, String(id), { cards:p.cards_count }]);
           await db.query('UPDATE bingo_rooms SET pot_fires=COALESCE(pot_fires,0)+$2 WHERE id=$1',[id, cost]);
         }
@@ -203,29 +201,29 @@ class BingoStoreSql extends EventEmitter {
     const mode = row.rules_meta?.winMode || 'linea';
     const win = this.checkCardWin(card, calledSet, mode);
     if (!win) throw new Error('no_bingo');
-    // mark room finished
-    await db.query("UPDATE bingo_rooms SET status='closed' WHERE id=$1",[id]);
-    // payout 70/20/10 if fire
-    if (row.mode==='fire'){
-      const pot = Number(row.pot_fires||0);
-      if (pot>0){
+    const winnerDb = row.mode==='fire' ? await this.mapExtToDbUserId(ext) : null;
+    const sponsorDb = row.mode==='fire' ? await this.mapExtToDbUserId(SPONSOR_TG) : null;
+    // Cierre y reparto 70/20/10 en una transacción: un solo asiento para las tres patas
+    const client = await db.pool.connect();
+    try{
+      await client.query('BEGIN');
+      const lk = await client.query('SELECT status, pot_fires FROM bingo_rooms WHERE id=$1 FOR UPDATE',[id]); const cur = lk.rows?.[0];
+      if (!cur || cur.status !== 'running') throw new Error('not_playing');
+      await client.query("UPDATE bingo_rooms SET status='closed' WHERE id=$1",[id]);
+      const pot = Number(cur.pot_fires||0);
+      if (row.mode==='fire' && pot>0){
         const g = Math.floor(pot*0.70), h=Math.floor(pot*0.20), s=Math.max(0, pot-g-h);
-        const winnerDb = await this.mapExtToDbUserId(ext);
         const hostDb = row.host_id || null;
-        const sponsorDb = await this.mapExtToDbUserId(SPONSOR_TG);
-        const credit = async (userId, amount, type) => {
-          if (!userId || amount<=0) return;
-          await db.query('INSERT INTO wallets(user_id,fires_balance,coins_balance,updated_at) VALUES ($1,0,0,NOW()) ON CONFLICT (user_id) DO NOTHING',[userId]);
-          const w = await db.query('SELECT id FROM wallets WHERE user_id=$1 FOR UPDATE',[userId]); const wid = w.rows?.[0]?.id; if (!wid) return;
-          await db.query('UPDATE wallets SET fires_balance=fires_balance+$2, updated_at=NOW() WHERE id=$1',[wid, amount]);
-          await db.query('INSERT INTO wallet_transactions(wallet_id,type,amount_fire,reference,meta,created_at) VALUES ($1,$2,$3,$4,$5,NOW())',[wid, type, amount, String(id), { bingoRoom: id }]);
-        };
-        await credit(winnerDb, g, 'bingo_payout_winner');
-        await credit(hostDb, h, 'bingo_payout_host');
-        await credit(sponsorDb, s, 'bingo_payout_sponsor');
-        await db.query('UPDATE bingo_rooms SET pot_fires=0 WHERE id=$1',[id]);
+        await walletRepo.postLedger(client, { currency:'fires', reference: String(id), meta: { bingoRoom: id }, legs: [
+          { userId: winnerDb, amount: winnerDb ? g : 0, type: 'bingo_payout_winner' },
+          { userId: hostDb, amount: hostDb ? h : 0, type: 'bingo_payout_host' },
+          { userId: sponsorDb, amount: sponsorDb ? s : 0, type: 'bingo_payout_sponsor' }
+        ] });
+        await client.query('UPDATE bingo_rooms SET pot_fires=0 WHERE id=$1',[id]);
       }
-    }
+      await client.query('COMMIT');
+    }catch(err){ try{ await client.query('ROLLBACK'); }catch(_){} throw err; }
+    finally{ client.release(); }
     const s = await this.getState(id); this.emitRoom(id); return s;
   }
 
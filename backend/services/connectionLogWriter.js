@@ -0,0 +1,115 @@
+let db = null; try { db = require('../db'); } catch(_) { db = null; }
+const userResolver = require('./userResolver');
+let logger = null; try { logger = require('../config/logger'); } catch(_) { logger = console; }
+
+// Escritura diferida de connection_logs y users.last_seen_at.
+// La petición HTTP solo encola (O(1)); un flush periódico o por tamaño hace
+// un INSERT multi-fila y un UPDATE colapsado por usuario.
+class ConnectionLogWriter {
+  constructor() {
+    this.maxQueue = Math.max(100, parseInt(process.env.CONNLOG_QUEUE_MAX || '5000', 10) || 5000);
+    this.batchSize = Math.max(10, parseInt(process.env.CONNLOG_BATCH_SIZE || '500', 10) || 500);
+    this.flushMs = Math.max(100, parseInt(process.env.CONNLOG_FLUSH_MS || '2000', 10) || 2000);
+    // Por encima de highWater solo se conserva 1 de cada sampleEvery registros
+    this.highWater = Math.floor(this.maxQueue * 0.8);
+    this.sampleEvery = Math.max(1, parseInt(process.env.CONNLOG_SAMPLE_EVERY || '10', 10) || 10);
+    this.queue = []; // [{ sess, ua, platform, ip, ts }]
+    this.lastSeen = new Map(); // sess -> ts (último visto dentro de la ventana)
+    this.timer = null;
+    this.flushing = false;
+    this._sampleSeq = 0;
+    this.stats = { enqueued: 0, dropped: 0, sampledOut: 0, written: 0, lastSeenWritten: 0, flushes: 0, flushErrors: 0, lastSeenDropped: 0, lastFlushAt: 0, lastFlushMs: 0 };
+  }
+
+  enabled() { return !!(db && db.query); }
+
+  record({ sess, ua, platform, ip } = {}) {
+    if (!this.enabled()) return false;
+    const now = Date.now();
+    const s = String(sess || '');
+    if (s && (s.startsWith('db:') || s.startsWith('tg:'))) {
+      if (this.lastSeen.has(s) || this.lastSeen.size < this.maxQueue) this.lastSeen.set(s, now);
+    }
+    const depth = this.queue.length;
+    if (depth >= this.maxQueue) { this.stats.dropped += 1; this._schedule(0); return false; }
+    if (depth >= this.highWater) {
+      this._sampleSeq += 1;
+      if (this._sampleSeq % this.sampleEvery !== 0) { this.stats.sampledOut += 1; this._schedule(0); return false; }
+    }
+    // platform/ip son varchar(64): un valor más largo haría fallar el INSERT de todo el lote
+    this.queue.push({ sess: s, ua: String(ua || ''), platform: String(platform || '').slice(0, 64), ip: String(ip || '').slice(0, 64), ts: now });
+    this.stats.enqueued += 1;
+    this._schedule(this.queue.length >= this.batchSize ? 0 : this.flushMs);
+    return true;
+  }
+
+  _schedule(delay) {
+    if (this.timer && delay > 0) return;
+    if (this.timer) { clearTimeout(this.timer); this.timer = null; }
+    this.timer = setTimeout(() => { this.timer = null; this.flush().catch(() => {}); }, delay);
+    try { this.timer.unref(); } catch(_) {}
+  }
+
+  async _resolve(sessions) {
+    return userResolver.resolveMany(sessions);
+  }
+
+  async flush() {
+    if (!this.enabled() || this.flushing) return;
+    if (!this.queue.length && !this.lastSeen.size) return;
+    this.flushing = true;
+    const t0 = Date.now();
+    const rows = this.queue.splice(0, this.batchSize);
+    const seen = this.lastSeen; this.lastSeen = new Map();
+    let seenDone = false;
+    try {
+      const sessions = new Set(seen.keys());
+      for (const r of rows) if (r.sess) sessions.add(r.sess);
+      const ids = await this._resolve(sessions);
+      if (seen.size) {
+        const uids = []; const tss = [];
+        for (const [s, ts] of seen) { const id = ids.get(s); if (id) { uids.push(id); tss.push(new Date(ts)); } }
+        if (uids.length) {
+          await db.query('UPDATE users u SET last_seen_at = v.ts, updated_at = NOW() FROM UNNEST($1::uuid[], $2::timestamptz[]) AS v(id, ts) WHERE u.id = v.id', [uids, tss]);
+          this.stats.lastSeenWritten += uids.length;
+        }
+      }
+      seenDone = true;
+      if (rows.length) {
+        const cols = [[], [], [], [], []];
+        for (const r of rows) {
+          cols[0].push(ids.get(r.sess) || null);
+          cols[1].push(r.ua); cols[2].push(r.platform); cols[3].push(r.ip); cols[4].push(new Date(r.ts));
+        }
+        await db.query('INSERT INTO connection_logs (user_id, ua, platform, ip, ts) SELECT * FROM UNNEST($1::uuid[], $2::text[], $3::text[], $4::text[], $5::timestamptz[])', cols);
+        this.stats.written += rows.length;
+      }
+      this.stats.flushes += 1;
+    } catch (err) {
+      this.stats.flushErrors += 1;
+      this.stats.dropped += rows.length;
+      // last_seen_at pendientes: vuelven al mapa (gana el ts más reciente) para el
+      // siguiente flush; solo se pierden los que ya no caben bajo maxQueue
+      if (!seenDone) {
+        for (const [s, ts] of seen) {
+          const cur = this.lastSeen.get(s);
+          if (cur !== undefined) { if (ts > cur) this.lastSeen.set(s, ts); }
+          else if (this.lastSeen.size < this.maxQueue) this.lastSeen.set(s, ts);
+          else this.stats.lastSeenDropped += 1;
+        }
+      }
+      try { logger.warn && logger.warn('connection_logs flush failed', { error: String(err && err.message || err), rows: rows.length }); } catch(_) {}
+    } finally {
+      this.stats.lastFlushAt = Date.now();
+      this.stats.lastFlushMs = this.stats.lastFlushAt - t0;
+      this.flushing = false;
+    }
+    if (this.queue.length || this.lastSeen.size) this._schedule(this.queue.length >= this.batchSize ? 0 : this.flushMs);
+  }
+
+  getStats() {
+    return { ...this.stats, queueDepth: this.queue.length, pendingLastSeen: this.lastSeen.size, maxQueue: this.maxQueue, batchSize: this.batchSize, flushMs: this.flushMs, flushing: this.flushing };
+  }
+}
+
+module.exports = new ConnectionLogWriter();
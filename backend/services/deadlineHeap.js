@@ -0,0 +1,83 @@
+// Min-heap indexado de vencimientos (key -> at en ms). schedule() inserta o mueve
+// la clave en O(log n), cancel() la saca en O(log n) y popDue(now) devuelve solo
+// las claves vencidas, así el tick no recorre entradas que no tocan.
+class DeadlineHeap {
+  constructor() {
+    this.heap = []; // [{ key, at }]
+    this.pos = new Map(); // key -> índice en heap
+  }
+
+  get size() { return this.heap.length; }
+
+  has(key) { return this.pos.has(key); }
+
+  peek() { return this.heap.length ? this.heap[0] : null; }
+
+  schedule(key, at) {
+    const t = Number(at);
+    if (!Number.isFinite(t)) return this.cancel(key);
+    const i = this.pos.get(key);
+    if (i === undefined) {
+      this.heap.push({ key, at: t });
+      this.pos.set(key, this.heap.length - 1);
+      this._up(this.heap.length - 1);
+      return true;
+    }
+    const prev = this.heap[i].at;
+    this.heap[i].at = t;
+    if (t < prev) this._up(i); else if (t > prev) this._down(i);
+    return true;
+  }
+
+  cancel(key) {
+    const i = this.pos.get(key);
+    if (i === undefined) return false;
+    this._removeAt(i);
+    return true;
+  }
+
+  // Claves con at <= now, en orden de vencimiento (se retiran del heap)
+  popDue(now = Date.now()) {
+    const out = [];
+    while (this.heap.length && this.heap[0].at <= now) {
+      out.push(this.heap[0].key);
+      this._removeAt(0);
+    }
+    return out;
+  }
+
+  _removeAt(i) {
+    const removed = this.heap[i];
+    const last = this.heap.pop();
+    this.pos.delete(removed.key);
+    if (removed === last) return;
+    this.heap[i] = last; this.pos.set(last.key, i);
+    this._down(i); this._up(i);
+  }
+
+  _swap(a, b) {
+    const h = this.heap; const x = h[a]; h[a] = h[b]; h[b] = x;
+    this.pos.set(h[a].key, a); this.pos.set(h[b].key, b);
+  }
+
+  _up(i) {
+    while (i > 0) {
+      const p = (i - 1) >> 1;
+      if (this.heap[p].at <= this.heap[i].at) break;
+      this._swap(i, p); i = p;
+    }
+  }
+
+  _down(i) {
+    const n = this.heap.length;
+    for (;;) {
+      const l = 2 * i + 1; const r = l + 1; let m = i;
+      if (l < n && this.heap[l].at < this.heap[m].at) m = l;
+      if (r < n && this.heap[r].at < this.heap[m].at) m = r;
+      if (m === i) return;
+      this._swap(i, m); i = m;
+    }
+  }
+}
+
+module.exports = DeadlineHeap;
@@ -0,0 +1,158 @@
+// Cola indexada de solicitudes de fuegos para MemoryStore.
+// - byId: acceso directo por id.
+// - Una lista por estado y otra por usuario, cada una en orden de llegada; los
+//   listados se leen de la más reciente a la más antigua y paginan por cursor
+//   (n de la última entrada vista) con búsqueda binaria.
+// - Cambiar de estado es O(1): la entrada de la lista de origen se marca vacía y
+//   se añade una al final de la de destino (los listados de accepted/rejected
+//   quedan así por orden de procesamiento). Las listas se compactan cuando los
+//   huecos superan la mitad, de modo que el coste es O(1) amortizado.
+
+function newList() { return { slots: [], live: 0, dead: 0 }; }
+
+// Primera posición con n >= value (slots ordenados por n ascendente)
+function lowerBound(slots, value) {
+  let lo = 0; let hi = slots.length;
+  while (lo < hi) {
+    const mid = (lo + hi) >>> 1;
+    if (slots[mid].n < value) lo = mid + 1; else hi = mid;
+  }
+  return lo;
+}
+
+class FireRequestQueue {
+  constructor() { this.clear(); }
+
+  clear() {
+    this.byId = new Map(); // id -> rec
+    this.all = newList(); // todas por creación
+    this.statuses = new Map(); // status -> list
+    this.users = new Map(); // userId -> list (por creación)
+    this.slotOf = new Map(); // id -> slot en la lista de su estado
+    this.n = 0;
+  }
+
+  get size() { return this.byId.size; }
+
+  // De la más reciente a la más antigua (snapshot de persistencia)
+  *[Symbol.iterator]() {
+    const slots = this.all.slots;
+    for (let i = slots.length - 1; i >= 0; i--) if (slots[i].rec) yield slots[i].rec;
+  }
+
+  get(id) { return this.byId.get(String(id || '')) || null; }
+
+  count(status) {
+    if (!status) return this.all.live;
+    const l = this.statuses.get(status);
+    return l ? l.live : 0;
+  }
+
+  _push(list, rec) {
+    const slot = { n: ++this.n, rec, list };
+    list.slots.push(slot); list.live += 1;
+    return slot;
+  }
+
+  _kill(slot) {
+    const list = slot.list;
+    slot.rec = null; list.live -= 1; list.dead += 1;
+    if (list.dead > 64 && list.dead * 2 > list.slots.length) {
+      list.slots = list.slots.filter((s) => s.rec); list.dead = 0;
+    }
+  }
+
+  _listFor(map, key) {
+    let l = map.get(key);
+    if (!l) { l = newList(); map.set(key, l); }
+    return l;
+  }
+
+  _enterStatus(rec) {
+    this.slotOf.set(rec.id, this._push(this._listFor(this.statuses, rec.status), rec));
+  }
+
+  add(rec) {
+    this.byId.set(rec.id, rec);
+    this._push(this.all, rec);
+    this._push(this._listFor(this.users, rec.userId), rec);
+    this._enterStatus(rec);
+    return rec;
+  }
+
+  setStatus(rec, status) {
+    const slot = this.slotOf.get(rec.id);
+    if (slot) this._kill(slot);
+    rec.status = status;
+    rec.updatedAt = Date.now();
+    this._enterStatus(rec);
+    return rec;
+  }
+
+  // Reconstrucción tras recuperar el estado: pending por creación, el resto por
+  // fecha de procesamiento
+  load(records) {
+    this.clear();
+    const recs = Array.from(records || []).filter((r) => r && r.id);
+    recs.sort((a, b) => (Number(a.createdAt || 0) - Number(b.createdAt || 0)) || (a.id < b.id ? -1 : (a.id > b.id ? 1 : 0)));
+    const done = [];
+    for (const rec of recs) {
+      this.byId.set(rec.id, rec);
+      this._push(this.all, rec);
+      this._push(this._listFor(this.users, rec.userId), rec);
+      if (rec.status === 'pending') this._enterStatus(rec); else done.push(rec);
+    }
+    done.sort((a, b) => Number(a.updatedAt || 0) - Number(b.updatedAt || 0));
+    for (const rec of done) this._enterStatus(rec);
+  }
+
+  // Mueve las solicitudes de fromId a toId (fusión de cuentas); devuelve las movidas
+  reassignUser(fromId, toId) {
+    const src = this.users.get(fromId);
+    if (!src || fromId === toId) return [];
+    const moved = [];
+    for (const s of src.slots) if (s.rec) { s.rec.userId = toId; moved.push(s.rec); }
+    this.users.delete(fromId);
+    const dst = this._listFor(this.users, toId);
+    const slots = dst.slots.filter((s) => s.rec).concat(src.slots.filter((s) => s.rec)).sort((a, b) => a.n - b.n);
+    for (const s of slots) s.list = dst;
+    dst.slots = slots; dst.live = slots.length; dst.dead = 0;
+    return moved;
+  }
+
+  // page({ status, userId, limit, offset, cursor }) -> { items, nextCursor, total }
+  // Con userId y status se filtra la lista del usuario (acotada por usuario).
+  page({ status = null, userId = null, limit = 20, offset = 0, cursor = null } = {}) {
+    let list; let test = null;
+    if (userId !== null && userId !== undefined) {
+      list = this.users.get(String(userId));
+      if (status) test = (r) => r.status === status;
+    } else {
+      list = status ? this.statuses.get(status) : this.all;
+    }
+    if (!list) return { items: [], nextCursor: null, total: 0 };
+    const slots = list.slots;
+    const hasCursor = cursor !== null && cursor !== undefined && cursor !== '';
+    let i = hasCursor ? lowerBound(slots, Number(cursor)) - 1 : slots.length - 1;
+    let skip = hasCursor ? 0 : Math.max(0, Number(offset) || 0);
+    const items = []; let last = null; let more = false;
+    for (; i >= 0; i--) {
+      const s = slots[i];
+      if (!s.rec || (test && !test(s.rec))) continue;
+      if (skip > 0) { skip -= 1; continue; }
+      if (items.length >= limit) { more = true; break; }
+      items.push(s.rec); last = s;
+    }
+    let total = list.live;
+    if (test) { total = 0; for (const s of slots) if (s.rec && test(s.rec)) total += 1; }
+    return { items, nextCursor: (more && last) ? String(last.n) : null, total };
+  }
+
+  getStats() {
+    const byStatus = {};
+    for (const [k, l] of this.statuses) byStatus[k] = l.live;
+    return { total: this.all.live, users: this.users.size, byStatus };
+  }
+}
+
+module.exports = FireRequestQueue;
@@ -0,0 +1,150 @@
+const RankIndex = require('./rankIndex');
+
+// Rankings por juego ('overall' = todas las partidas) y ventana (all|daily|weekly).
+// Cada tabla es un RankIndex ordenado por puntos (victoria 3, empate 1), luego
+// victorias, menos partidas y userId. Las tablas se construyen bajo demanda desde
+// userStats (una vez por juego/ventana/periodo) y después se mantienen en cada
+// recordGameResult en O(log n); al cambiar el día o la semana (UTC) la tabla del
+// periodo anterior se descarta.
+const WINDOWS = ['all', 'daily', 'weekly'];
+// Solo juegos conocidos: cada clave distinta construye y conserva una tabla
+const GAMES = ['overall', 'tictactoe', 'bingo'];
+
+function isoWeekKey(d) {
+  const t = new Date(Date.UTC(d.getUTCFullYear(), d.getUTCMonth(), d.getUTCDate()));
+  const day = t.getUTCDay() || 7;
+  t.setUTCDate(t.getUTCDate() + 4 - day);
+  const week = Math.ceil(((t - Date.UTC(t.getUTCFullYear(), 0, 1)) / 86400000 + 1) / 7);
+  return t.getUTCFullYear() + '-W' + String(week).padStart(2, '0');
+}
+
+function periodKey(window, ts = Date.now()) {
+  const d = new Date(ts);
+  if (window === 'daily') return d.toISOString().slice(0, 10); // YYYY-MM-DD (UTC)
+  if (window === 'weekly') return isoWeekKey(d); // YYYY-Www (ISO, UTC)
+  return 'all';
+}
+
+function keyOf(s) {
+  const wins = Number(s.wins || 0); const draws = Number(s.draws || 0);
+  return { points: wins * 3 + draws, wins, losses: Number(s.losses || 0), draws, games: Number(s.games || 0) };
+}
+
+function compare(a, b) {
+  const x = a.key; const y = b.key;
+  if (x.points !== y.points) return y.points - x.points;
+  if (x.wins !== y.wins) return y.wins - x.wins;
+  if (x.games !== y.games) return x.games - y.games;
+  return a.id < b.id ? -1 : (a.id > b.id ? 1 : 0);
+}
+
+function emptyStat() { return { wins: 0, losses: 0, draws: 0, games: 0 }; }
+
+function bump(s, result) {
+  s.games += 1;
+  if (result === 'win') s.wins += 1; else if (result === 'loss') s.losses += 1; else if (result === 'draw') s.draws += 1;
+}
+
+// Contadores del usuario para (window, game) en el periodo; null si no jugó
+function statFor(st, window, game, period) {
+  let base = st;
+  if (window !== 'all') {
+    const p = st && st.periods && st.periods[window];
+    if (!p || p.key !== period) return null;
+    base = p;
+  }
+  const s = game === 'overall' ? base : (base && base.byGame && base.byGame[game]);
+  return (s && Number(s.games || 0) > 0) ? s : null;
+}
+
+class Leaderboards {
+  constructor(stats, users) {
+    this.stats = stats; // Map vivo userId -> userStats
+    this.users = users; // Map vivo userId -> user (para userName)
+    this.boards = new Map(); // 'window:game' -> { window, game, period, index, version }
+  }
+
+  static isWindow(w) { return WINDOWS.includes(w); }
+  static isGame(g) { return GAMES.includes(g); }
+
+  // Se invalida todo tras cargar userStats en bloque (recuperación)
+  reset() { this.boards.clear(); }
+
+  // Contadores diarios/semanales dentro de userStats (se persisten con 'st')
+  track(st, game, result, ts = Date.now()) {
+    if (!st.periods) st.periods = {};
+    for (const w of ['daily', 'weekly']) {
+      const key = periodKey(w, ts);
+      let p = st.periods[w];
+      if (!p || p.key !== key) { p = { key, ...emptyStat(), byGame: {} }; st.periods[w] = p; }
+      bump(p, result);
+      if (!p.byGame[game]) p.byGame[game] = emptyStat();
+      bump(p.byGame[game], result);
+    }
+  }
+
+  _board(window, game) {
+    if (!GAMES.includes(game)) throw new Error('invalid_game');
+    const period = periodKey(window);
+    const k = window + ':' + game;
+    let b = this.boards.get(k);
+    if (b && b.period === period) return b;
+    const pairs = [];
+    for (const [id, st] of this.stats) {
+      const s = statFor(st, window, game, period);
+      if (s) pairs.push([id, keyOf(s)]);
+    }
+    b = { window, game, period, index: new RankIndex(compare).load(pairs), version: 0 };
+    this.boards.set(k, b);
+    return b;
+  }
+
+  // Tras un resultado: reubica al usuario solo en las tablas ya construidas
+  update(userId, st, game) {
+    for (const [k, b] of this.boards) {
+      if (b.game !== 'overall' && b.game !== game) continue;
+      const period = periodKey(b.window);
+      if (b.period !== period) { this.boards.delete(k); continue; }
+      const s = statFor(st, b.window, b.game, period);
+      if (s) b.index.set(userId, keyOf(s)); else b.index.delete(userId);
+      b.version += 1;
+    }
+  }
+
+  // Identifica el contenido actual de una tabla (para cachés)
+  versionOf({ game = 'overall', window = 'all' } = {}) {
+    const b = this._board(window, game);
+    return b.period + ':' + b.version;
+  }
+
+  _row(node, pos) {
+    const u = this.users.get(node.id);
+    return { rank: pos + 1, userId: node.id, userName: (u && u.userName) || node.id, ...node.key };
+  }
+
+  top({ game = 'overall', window = 'all', limit = 10, offset = 0 } = {}) {
+    const b = this._board(window, game);
+    const o = Math.max(0, Number(offset) || 0);
+    const items = b.index.range(o, limit).map((n, i) => this._row(n, o + i));
+    return { game, window, period: b.period, total: b.index.size, items };
+  }
+
+  // Posición del usuario y k vecinos por encima y por debajo
+  around({ game = 'overall', window = 'all', userId, k = 5 } = {}) {
+    const b = this._board(window, game);
+    const id = String(userId || '');
+    const pos = b.index.rankOf(id);
+    if (pos < 0) return { game, window, period: b.period, total: b.index.size, me: null, items: [] };
+    const start = Math.max(0, pos - k);
+    const items = b.index.range(start, pos - start + k + 1).map((n, i) => this._row(n, start + i));
+    return { game, window, period: b.period, total: b.index.size, me: items[pos - start], items };
+  }
+
+  getStats() {
+    const boards = {};
+    for (const [k, b] of this.boards) boards[k] = { period: b.period, size: b.index.size, version: b.version };
+    return { boards };
+  }
+}
+
+module.exports = Leaderboards;
@@ -0,0 +1,348 @@
+const fs = require('fs');
+const path = require('path');
+const TxRing = require('./txRing');
+
+// Persistencia de MemoryStore: log de mutaciones append-only (NDJSON) con
+// group commit (una escritura + fdatasync por ventana) y snapshots compactos
+// periódicos. Arranque = último snapshot completo + reproducción de la cola del log.
+//
+// Ficheros (dir): snapshot-<gen>.ndjson y log-<gen>.ndjson. Al hacer snapshot se
+// rota a log-<gen+1> y se vuelca el estado a snapshot-<gen+1>.tmp -> rename.
+// Cada registro lleva s (secuencia monotónica). Las líneas del snapshot llevan la
+// secuencia vigente al serializarse; al reproducir se omiten los registros del
+// log ya cubiertos por el snapshot (s <= marca de esa entidad).
+//
+// Registros: u/st/cd/sp/fr/ut/txs/bws/sup son "set" (valor completo, se leen del
+// store al hacer flush); utx/tx/bw son "append" (se registran en el momento).
+const FAMILY = { utx: 'ut', tx: 'txs', bw: 'bws' };
+
+function famKey(k, id) { return (FAMILY[k] || k) + '\u0000' + (id || ''); }
+
+class MemoryPersistence {
+  constructor() {
+    this.enabled = String(process.env.MEMORY_PERSIST || 'true').toLowerCase() === 'true';
+    this.dir = path.resolve(process.env.MEMORY_PERSIST_DIR || path.resolve(__dirname, '../../storage/memory'));
+    this.commitMs = Math.max(0, parseInt(process.env.MEMORY_LOG_COMMIT_MS || '20', 10) || 0);
+    this.snapshotRecords = Math.max(1000, parseInt(process.env.MEMORY_SNAPSHOT_RECORDS || '500000', 10) || 500000);
+    this.snapshotMs = Math.max(60000, parseInt(process.env.MEMORY_SNAPSHOT_MS || '900000', 10) || 900000);
+    this.fsync = String(process.env.MEMORY_LOG_FSYNC || 'true').toLowerCase() === 'true';
+    this.store = null;
+    this.seq = 0;
+    this.gen = 0;
+    this.fd = null;
+    this.appends = []; // registros append pendientes
+    this.dirty = new Map(); // famKey -> { k, id, ref }
+    this.timer = null;
+    this.chain = Promise.resolve(); // escrituras serializadas
+    this.sinceSnapshot = 0;
+    this.snapshotting = null;
+    this.snapshotTimer = null;
+    this.stats = { records: 0, commits: 0, bytes: 0, errors: 0, lastCommitMs: 0, snapshots: 0, lastSnapshotMs: 0, lastSnapshotAt: 0, truncatedBytes: 0, recovery: null };
+  }
+
+  _file(kind, gen) { return path.join(this.dir, `${kind}-${gen}.ndjson`); }
+
+  _gens(kind) {
+    let names = [];
+    try { names = fs.readdirSync(this.dir); } catch (_) { return []; }
+    const re = new RegExp('^' + kind + '-(\\d+)\\.ndjson$');
+    return names.map((n) => re.exec(n)).filter(Boolean).map((m) => Number(m[1])).sort((a, b) => a - b);
+  }
+
+  // Lectura por bloques grandes y corte manual de líneas (más rápido que readline).
+  // info (opcional) recibe bytes = fin del último registro válido, torn = si hubo
+  // una cola inválida detrás y newline = si ese último registro termina en '\n'.
+  async _readLines(file, fn, info = null) {
+    if (info) { info.bytes = 0; info.torn = false; info.newline = true; }
+    if (!fs.existsSync(file)) return 0;
+    const stream = fs.createReadStream(file, { encoding: 'utf8', highWaterMark: 4 << 20 });
+    let n = 0; let rest = ''; let text = ''; let start = 0; let bytes = 0;
+    try {
+      for await (const chunk of stream) {
+        text = rest + chunk;
+        start = 0; let nl;
+        while ((nl = text.indexOf('\n', start)) !== -1) {
+          if (nl > start) { fn(JSON.parse(text.slice(start, nl))); n += 1; }
+          start = nl + 1;
+        }
+        rest = text.slice(start);
+        if (info) bytes += Buffer.byteLength(text.slice(0, start));
+      }
+      if (rest) { text = rest; start = 0; fn(JSON.parse(rest)); n += 1; if (info) { bytes += Buffer.byteLength(rest); info.newline = false; } }
+    } catch (_) {
+      // Línea truncada (caída a mitad de escritura): se descarta la cola
+      stream.destroy();
+      if (info) { bytes += Buffer.byteLength(text.slice(0, start)); info.torn = true; }
+    }
+    if (info) info.bytes = bytes;
+    return n;
+  }
+
+  // Deja el log listo para seguir escribiendo: corta la cola inválida (si no,
+  // los registros nuevos quedarían tras ella y la próxima lectura los perdería)
+  // y cierra con '\n' un último registro válido sin terminar
+  _repairTail(file, info) {
+    if (!info || !fs.existsSync(file)) return;
+    const size = fs.statSync(file).size;
+    if (size > info.bytes) { fs.truncateSync(file, info.bytes); this.stats.truncatedBytes += size - info.bytes; }
+    if (!info.newline && info.bytes > 0) fs.appendFileSync(file, '\n');
+  }
+
+  // ----- Recuperación -----
+  // Carga el último snapshot completo y reproduce los logs desde su generación;
+  // después engancha el store para registrar nuevas mutaciones.
+  async recover(store) {
+    const t0 = Date.now();
+    const out = { snapshotGen: null, snapshotLines: 0, logRecords: 0, skipped: 0, users: 0, ms: 0 };
+    if (this.enabled) {
+      fs.mkdirSync(this.dir, { recursive: true });
+      const ctx = { frById: new Map() };
+      for (const f of fs.readdirSync(this.dir)) { if (f.endsWith('.tmp')) { try { fs.unlinkSync(path.join(this.dir, f)); } catch (_) {} } }
+      // Último snapshot con línea final 'end' (los incompletos se ignoran)
+      let snapGen = null; let hdr = null;
+      for (const g of this._gens('snapshot').reverse()) {
+        const first = await this._firstAndLast(this._file('snapshot', g));
+        if (first && first.hdr && first.end) { snapGen = g; hdr = first.hdr; break; }
+      }
+      const logGens = this._gens('log').filter((g) => snapGen === null || g >= snapGen);
+      // Los logs se leen antes que el snapshot para guardar marcas solo de las entidades que tocan
+      const logRecs = []; let tail = null;
+      for (const g of logGens) { tail = {}; await this._readLines(this._file('log', g), (r) => { logRecs.push(r); }, tail); }
+      const marks = new Map();
+      if (snapGen !== null) {
+        const touched = new Set();
+        for (const r of logRecs) { if (r.s > hdr.startSeq) touched.add(famKey(r.k, r.id)); }
+        out.snapshotLines = await this._readLines(this._file('snapshot', snapGen), (r) => {
+          if (r.k === 'hdr' || r.k === 'end') { if (r.s) this.seq = Math.max(this.seq, r.s); return; }
+          if (r.s > hdr.startSeq) { const key = famKey(r.k, r.id); if (touched.has(key)) marks.set(key, r.s); }
+          this._apply(store, r, ctx);
+        });
+        this.seq = Math.max(this.seq, Number(hdr.startSeq || 0));
+      }
+      for (const r of logRecs) {
+        this.seq = Math.max(this.seq, Number(r.s || 0));
+        if (snapGen !== null && (r.s <= hdr.startSeq || (marks.get(famKey(r.k, r.id)) || 0) >= r.s)) { out.skipped += 1; continue; }
+        this._apply(store, r, ctx);
+        out.logRecords += 1;
+      }
+      if (ctx.frById.size) store.fireRequests.load(ctx.frById.values());
+      store.bingoWins = store.bingoWins.slice(0, 500);
+      try { store.rederiveCirculation({ fix: true }); } catch (_) {}
+      try { if (store._rebuildIndexes) store._rebuildIndexes(); } catch (_) {}
+      out.snapshotGen = snapGen;
+      this.gen = Math.max(snapGen || 0, logGens.length ? logGens[logGens.length - 1] : 0);
+      this.sinceSnapshot = logRecs.length;
+      if (logGens.length && logGens[logGens.length - 1] === this.gen) this._repairTail(this._file('log', this.gen), tail);
+      this.fd = fs.openSync(this._file('log', this.gen), 'a');
+    }
+    out.users = store.users.size;
+    out.ms = Date.now() - t0;
+    this.stats.recovery = out;
+    this.attach(store);
+    return out;
+  }
+
+  async _firstAndLast(file) {
+    try {
+      const fd = fs.openSync(file, 'r');
+      try {
+        const size = fs.fstatSync(fd).size; if (!size) return null;
+        const head = Buffer.alloc(Math.min(size, 4096)); fs.readSync(fd, head, 0, head.length, 0);
+        const tailLen = Math.min(size, 4096); const tail = Buffer.alloc(tailLen); fs.readSync(fd, tail, 0, tailLen, size - tailLen);
+        const h = JSON.parse(head.toString('utf8').split('\n')[0]);
+        const lines = tail.toString('utf8').split('\n').filter(Boolean);
+        let e = null; try { e = JSON.parse(lines[lines.length - 1]); } catch (_) { e = null; }
+        return { hdr: h && h.k === 'hdr' ? h : null, end: e && e.k === 'end' ? e : null };
+      } finally { fs.closeSync(fd); }
+    } catch (_) { return null; }
+  }
+
+  _apply(store, r, ctx) {
+    const id = r.id;
+    switch (r.k) {
+      case 'u': if (r.d) store.users.delete(id); else store.users.set(id, r.v); break;
+      case 'ut': if (r.d) store.userTx.delete(id); else store.userTx.set(id, TxRing.from(r.v, store.txUserCap)); break;
+      case 'utx': {
+        let ring = store.userTx.get(id);
+        if (!ring) { ring = new TxRing(store.txUserCap); store.userTx.set(id, ring); }
+        ring.push(r.v); break;
+      }
+      case 'st': if (r.d) store.userStats.delete(id); else store.userStats.set(id, r.v); break;
+      case 'cd': if (r.d) store.coinDaily.delete(id); else store.coinDaily.set(id, r.v); break;
+      case 'sp': if (r.d) store.sponsors.delete(id); else store.sponsors.set(id, r.v); break;
+      case 'fr': if (r.d) ctx.frById.delete(id); else ctx.frById.set(id, r.v); break;
+      case 'txs': store.txs = TxRing.from(r.v, store.txs.capacity); break;
+      case 'tx': store.txs.push(r.v); break;
+      case 'bws': store.bingoWins = r.v || []; break;
+      case 'bw': store.bingoWins.unshift(r.v); if (store.bingoWins.length > 1000) store.bingoWins.length = 500; break;
+      case 'sup': Object.assign(store.supply, r.v || {}); break;
+      default: break;
+    }
+  }
+
+  // ----- Registro de mutaciones -----
+  attach(store) {
+    this.store = store;
+    store.persist = this.enabled ? this : null;
+    if (!this.enabled) return;
+    if (!this.snapshotTimer) {
+      this.snapshotTimer = setInterval(() => { if (this.sinceSnapshot > 0) this.snapshot().catch(() => {}); }, this.snapshotMs);
+      try { this.snapshotTimer.unref(); } catch (_) {}
+    }
+    process.once('exit', () => { try { this.flushSync(); } catch (_) {} });
+    // Parada normal (docker stop / Ctrl+C): volcar la ventana de group commit antes
+    // de salir; si otro módulo también escucha la señal, él decide cuándo salir
+    for (const sig of ['SIGTERM', 'SIGINT']) {
+      process.once(sig, () => {
+        try { this.flushSync(); } catch (_) {}
+        if (process.listenerCount(sig) === 0) process.exit(sig === 'SIGTERM' ? 143 : 130);
+      });
+    }
+  }
+
+  // Entidad modificada: su valor se lee del store al hacer flush (varias
+  // mutaciones en la misma ventana se colapsan en un solo registro)
+  mark(k, id, ref) {
+    this.dirty.set(famKey(k, id), { k, id: id || '', ref });
+    this._schedule();
+  }
+
+  append(k, id, v) {
+    this.appends.push({ s: ++this.seq, k, id: id || '', v });
+    this._schedule();
+  }
+
+  _schedule() {
+    if (this.timer) return;
+    this.timer = setTimeout(() => { this.timer = null; this.flush().catch(() => {}); }, this.commitMs);
+    try { this.timer.unref(); } catch (_) {}
+  }
+
+  _value(k, id, ref) {
+    const st = this.store;
+    switch (k) {
+      case 'u': return st.users.get(id);
+      case 'ut': return st.userTx.get(id);
+      case 'st': return st.userStats.get(id);
+      case 'cd': return st.coinDaily.get(id);
+      case 'sp': return st.sponsors.get(id);
+      case 'fr': return ref;
+      case 'txs': return st.txs;
+      case 'bws': return st.bingoWins;
+      case 'sup': return st.supply;
+      default: return undefined;
+    }
+  }
+
+  // Los append van primero: un "set" posterior de la misma entidad ya los incluye
+  _drain() {
+    if (!this.appends.length && !this.dirty.size) return '';
+    let buf = '';
+    for (const r of this.appends) buf += JSON.stringify(r) + '\n';
+    for (const { k, id, ref } of this.dirty.values()) {
+      const v = this._value(k, id, ref);
+      buf += JSON.stringify(v === undefined ? { s: ++this.seq, k, id, d: 1 } : { s: ++this.seq, k, id, v }) + '\n';
+    }
+    const n = this.appends.length + this.dirty.size;
+    this.appends = []; this.dirty.clear();
+    this.stats.records += n; this.sinceSnapshot += n;
+    return buf;
+  }
+
+  flush() {
+    this.chain = this.chain.then(() => new Promise((resolve) => {
+      const buf = this._drain();
+      if (!buf || this.fd === null) return resolve();
+      const t0 = Date.now(); const fd = this.fd;
+      fs.write(fd, buf, null, 'utf8', (err) => {
+        if (err) { this.stats.errors += 1; return resolve(); }
+        const done = (e2) => {
+          if (e2) this.stats.errors += 1;
+          this.stats.commits += 1; this.stats.bytes += Buffer.byteLength(buf); this.stats.lastCommitMs = Date.now() - t0;
+          resolve();
+        };
+        if (this.fsync) fs.fdatasync(fd, done); else done();
+      });
+    })).then(() => {
+      if (this.sinceSnapshot >= this.snapshotRecords && !this.snapshotting) this.snapshot().catch(() => {});
+    });
+    return this.chain;
+  }
+
+  // Salida del proceso: volcado síncrono de lo pendiente
+  flushSync() {
+    const buf = this._drain();
+    if (!buf || this.fd === null) return;
+    fs.writeSync(this.fd, buf);
+    if (this.fsync) fs.fdatasyncSync(this.fd);
+  }
+
+  // ----- Snapshot -----
+  snapshot() {
+    if (!this.enabled || this.fd === null) return Promise.resolve(null);
+    if (this.snapshotting) return this.snapshotting;
+    this.snapshotting = this._snapshot().finally(() => { this.snapshotting = null; });
+    return this.snapshotting;
+  }
+
+  async _snapshot() {
+    const t0 = Date.now();
+    // Rotación dentro de la cadena de escrituras: lo pendiente va al log viejo,
+    // lo que llegue después al nuevo
+    const gen = await (this.chain = this.chain.then(() => {
+      const buf = this._drain();
+      if (buf) { fs.writeSync(this.fd, buf); if (this.fsync) fs.fdatasyncSync(this.fd); }
+      fs.closeSync(this.fd);
+      this.gen += 1;
+      this.fd = fs.openSync(this._file('log', this.gen), 'a');
+      this.sinceSnapshot = 0;
+      return this.gen;
+    }));
+    const st = this.store;
+    const tmp = this._file('snapshot', gen) + '.tmp';
+    const fh = await fs.promises.open(tmp, 'w');
+    let lines = 0;
+    try {
+      let chunk = JSON.stringify({ k: 'hdr', gen, startSeq: this.seq, at: Date.now() }) + '\n';
+      const put = async (k, id, v) => {
+        if (v === undefined) return;
+        chunk += JSON.stringify({ s: this.seq, k, id, v }) + '\n'; lines += 1;
+        if (chunk.length >= 1 << 20) { const c = chunk; chunk = ''; await fh.write(c); }
+      };
+      // Se cede el event loop entre porciones; las mutaciones concurrentes quedan
+      // en el log nuevo y la marca s de cada línea evita aplicarlas dos veces
+      const slice = async (map, k) => {
+        let i = 0;
+        for (const [id, v] of map) {
+          await put(k, id, v);
+          if (++i % 5000 === 0) await new Promise((r) => setImmediate(r));
+        }
+      };
+      await put('sup', '', st.supply);
+      await put('txs', '', st.txs);
+      await put('bws', '', st.bingoWins);
+      for (const fr of st.fireRequests) await put('fr', fr.id, fr);
+      await slice(st.sponsors, 'sp');
+      await slice(st.users, 'u');
+      await slice(st.userTx, 'ut');
+      await slice(st.userStats, 'st');
+      await slice(st.coinDaily, 'cd');
+      chunk += JSON.stringify({ k: 'end', s: this.seq, lines }) + '\n';
+      await fh.write(chunk);
+      await fh.sync();
+    } finally { await fh.close(); }
+    await fs.promises.rename(tmp, this._file('snapshot', gen));
+    try { const dfd = fs.openSync(this.dir, 'r'); try { fs.fsyncSync(dfd); } finally { fs.closeSync(dfd); } } catch (_) {}
+    // El snapshot nuevo cubre todo lo anterior
+    for (const g of this._gens('snapshot')) if (g < gen) { try { fs.unlinkSync(this._file('snapshot', g)); } catch (_) {} }
+    for (const g of this._gens('log')) if (g < gen) { try { fs.unlinkSync(this._file('log', g)); } catch (_) {} }
+    this.stats.snapshots += 1; this.stats.lastSnapshotMs = Date.now() - t0; this.stats.lastSnapshotAt = Date.now();
+    return { gen, lines, ms: this.stats.lastSnapshotMs };
+  }
+
+  getStats() {
+    return { ...this.stats, enabled: this.enabled, gen: this.gen, seq: this.seq, pending: this.appends.length + this.dirty.size, sinceSnapshot: this.sinceSnapshot, snapshotting: !!this.snapshotting };
+  }
+}
+
+module.exports = new MemoryPersistence();
@@ -1,6 +1,15 @@
 const EventEmitter = require('events');
 const fs = require('fs');
 const path = require('path');
+const WelcomeClaimsFile = require('./welcomeClaimsFile');
+const UserDirectory = require('./userDirectory');
+const TxRing = require('./txRing');
+const FireRequestQueue = require('./fireRequestQueue');
+const Leaderboards = require('./leaderboards');
+const PresenceTracker = require('./presenceTracker');
+
+const TX_GLOBAL_CAP = 500;
+const TX_USER_CAP = 200;
 let welcomeRepo = null; try { welcomeRepo = require('../repos/welcomeRepo'); } catch(_) { welcomeRepo = null; }
 
 class MemoryStore extends EventEmitter {
@@ -11,6 +20,9 @@ class MemoryStore extends EventEmitter {
       circulating: 100_000,
       burned: 0
     };
+    // Suma de max(0, fires) de todos los usuarios mantenida en cada mutación (O(1) en getSupplySummary)
+    this.firesCirculating = 0;
+    this.lastCirculationCheck = null; // { at, counted, actual, drift }
     // Flags de entorno para QA/DEV: auto-sembrar saldos iniciales
     this.isProd = String(process.env.NODE_ENV || 'development') === 'production';
     this.devAutoSeed = String(process.env.ECONOMY_DEV_AUTO_SEED || 'true').toLowerCase() === 'true';
@@ -18,15 +30,27 @@ class MemoryStore extends EventEmitter {
     this.devSeedFires = Math.max(0, parseInt(process.env.ECONOMY_DEV_SEED_FIRES || '0', 10) || 0);
     this.users = new Map(); // userId -> { userId, userName, fires, coins, createdAt, lastSeenAt, firstSeenAt, currentSessionStart, lastDurationMs, lastDevice, devices }
     this.sponsors = new Map(); // userId -> { userId, key, description }
-    this.userTx = new Map(); // userId -> [tx]
-    this.txs = []; // simple list of transactions
+    this.txUserCap = TX_USER_CAP;
+    this.userTx = new Map(); // userId -> TxRing (txUserCap)
+    this.txs = new TxRing(TX_GLOBAL_CAP); // journal global, más reciente primero
+    this.txSeq = 0; // id monotónico de transacción (tx.seq, 'tx_<seq>')
     this.coinDaily = new Map(); // userId -> { date: 'YYYY-MM-DD', count: number }
-    this.fireRequests = []; // [{ id, userId, amount, reference, status, createdAt, updatedAt }]
-    this.userStats = new Map(); // userId -> { wins, losses, draws, games, byGame: { [game]: { wins, losses, draws, games } } }
+    this.fireRequests = new FireRequestQueue(); // { id, userId, amount, reference, status, createdAt, updatedAt } indexado por id/estado/usuario
+    this.userStats = new Map(); // userId -> { wins, losses, draws, games, byGame: { [game]: { wins, losses, draws, games } }, periods: { daily, weekly } }
     // Evento de bienvenida (bono por primer login)
     this.welcomeEvent = { active: false, startsAt: 0, endsAt: 0, coins: 0, fires: 0, message: '' };
     this.welcomeClaims = new Map(); // userId -> ts de entrega
     this.bingoWins = [];
+    // Motor de persistencia (snapshot + log); lo engancha memoryPersistence.recover()
+    this.persist = null;
+    // Índice de usuarios (orden por createdAt + trigramas) para los listados
+    this.directory = new UserDirectory(this.users);
+    // Rankings por juego y ventana (all/daily/weekly) sobre userStats
+    this.leaderboards = new Leaderboards(this.userStats, this.users);
+    // Presencia online por cubetas de tiempo (conteos O(1) para el panel de admin)
+    const onlineWindowMs = Math.max(15000, Math.min(10 * 60_000, parseInt(process.env.ONLINE_WINDOW_MS || '120000', 10) || 120000));
+    const presenceBucketMs = Math.max(1000, parseInt(process.env.PRESENCE_BUCKET_MS || String(Math.floor(onlineWindowMs / 8)), 10) || 15000);
+    this.presence = new PresenceTracker({ windowMs: onlineWindowMs, bucketMs: presenceBucketMs });
     // Cargar estado persistido si existe
     try {
       const p = path.resolve(__dirname, '../../storage/events/welcome.json');
@@ -44,22 +68,47 @@ class MemoryStore extends EventEmitter {
         }
       }
     } catch (_) {}
-    // Cargar claims persistidos
-    try {
-      const pc = path.resolve(__dirname, '../../storage/events/welcome_claims.json');
-      if (fs.existsSync(pc)) {
-        const jc = JSON.parse(fs.readFileSync(pc, 'utf8'));
-        if (jc && typeof jc === 'object') {
-          for (const [k, v] of Object.entries(jc)) {
-            if (k) this.welcomeClaims.set(k, Number(v) || Date.now());
-          }
-        }
-      }
-    } catch (_) {}
+    // Cargar claims persistidos (JSON compacto + log de claims incremental)
+    this.welcomeClaimsFile = new WelcomeClaimsFile(path.resolve(__dirname, '../../storage/events'));
+    this.welcomeClaimsFile.load(this.welcomeClaims);
+  }
+
+  // Entidad modificada (se vuelca en el siguiente group commit) / registro append
+  _dirty(kind, id, ref) {
+    if (kind === 'u') this.directory.touch(id);
+    if (this.persist) this.persist.mark(kind, id, ref);
+  }
+  _journal(kind, id, value) { if (this.persist) this.persist.append(kind, id, value); }
+
+  // Tras cargar colecciones en bloque (recuperación) se reconstruyen los índices
+  _rebuildIndexes() { this.directory.rebuild(); this._resumeTxSeq(); this.leaderboards.reset(); this.presence.seed(this.users.values()); }
+
+  // Único punto de escritura de u.fires: mantiene firesCirculating al día
+  _setFires(u, value) {
+    const prev = Math.max(0, Number(u.fires || 0));
+    u.fires = value;
+    this.firesCirculating += Math.max(0, Number(value || 0)) - prev;
+    this._dirty('u', u.userId);
+  }
+
+  _sumFires() {
+    let sum = 0;
+    for (const u of this.users.values()) sum += Math.max(0, Number(u.fires || 0));
+    return sum;
+  }
+
+  // Re-deriva la suma completa (O(usuarios)) y reporta la deriva respecto al contador
+  rederiveCirculation({ fix = true } = {}) {
+    const counted = this.firesCirculating;
+    const actual = this._sumFires();
+    const drift = counted - actual;
+    if (fix && drift !== 0) this.firesCirculating = actual;
+    this.lastCirculationCheck = { at: Date.now(), counted, actual, drift };
+    return this.lastCirculationCheck;
   }
 
   getSupplySummary() {
-    const sumBalances = Array.from(this.users.values()).reduce((acc, u) => acc + Math.max(0, Number(u.fires || 0)), 0);
+    const sumBalances = Math.max(0, this.firesCirculating);
     const total = Number(this.supply.total);
     const burned = Math.max(0, Number(this.supply.burned || 0));
     const reserve = Math.max(0, total - (sumBalances + burned));
@@ -108,14 +157,10 @@ class MemoryStore extends EventEmitter {
   _setWelcomeClaim(userId) {
     const id = String(userId || '').trim();
     if (!id) return;
-    this.welcomeClaims.set(id, Date.now());
-    try {
-      const dir = path.resolve(__dirname, '../../storage/events');
-      fs.mkdirSync(dir, { recursive: true });
-      const obj = {};
-      for (const [k, v] of this.welcomeClaims.entries()) obj[k] = v;
-      fs.writeFileSync(path.join(dir, 'welcome_claims.json'), JSON.stringify(obj));
-    } catch (_) {}
+    const ts = Date.now();
+    this.welcomeClaims.set(id, ts);
+    // Append incremental con volcado asíncrono agrupado (sin reescribir el mapa completo)
+    this.welcomeClaimsFile.append(id, ts);
   }
 
   hasClaimedWelcome(userId) {
@@ -150,6 +195,7 @@ class MemoryStore extends EventEmitter {
     const canBurn = Math.min(request, reserve);
     if (canBurn > 0) {
       this.supply.burned += canBurn;
+      this._dirty('sup');
       this.emit('supply_changed', this.getSupplySummary());
     }
     return canBurn;
@@ -179,12 +225,21 @@ class MemoryStore extends EventEmitter {
   }
 
   pushTx(tx) {
-    const entry = { id: 'tx_' + Date.now(), ts: Date.now(), ...tx };
-    this.txs.unshift(entry);
-    this.txs = this.txs.slice(0, 500);
+    const seq = ++this.txSeq;
+    const entry = { id: 'tx_' + seq, seq, ts: Date.now(), ...tx };
+    this.txs.push(entry);
+    this._journal('tx', '', entry);
     return entry;
   }
 
+  // Journal global: cursor = seq de la última entrada recibida (offset por compatibilidad)
+  listTxs({ limit = 20, offset = 0, cursor = null } = {}) {
+    const l = Math.max(1, Math.min(100, Number(limit) || 20));
+    const o = Math.max(0, Number(offset) || 0);
+    const { items, nextCursor } = this.txs.page({ limit: l, offset: o, cursor });
+    return { items, nextCursor, total: this.txs.length, limit: l, offset: o };
+  }
+
   ensureUser(userId) {
     const id = String(userId || '').trim();
     if (!id) return null;
@@ -192,6 +247,7 @@ class MemoryStore extends EventEmitter {
     if (!this.users.has(id)) {
       const c0 = (!this.isProd && this.devAutoSeed) ? this.devSeedCoins : 0;
       const f0 = (!this.isProd && this.devAutoSeed) ? this.devSeedFires : 0;
+      this.firesCirculating += f0;
       this.users.set(id, { userId: id, userName: id, fires: f0, coins: c0, createdAt: now, lastSeenAt: now, firstSeenAt: now, currentSessionStart: now, lastDurationMs: 0, devices: [] });
     } else {
       const u = this.users.get(id);
@@ -203,12 +259,14 @@ class MemoryStore extends EventEmitter {
             u.coins = this.devSeedCoins;
           }
           if (this.devSeedFires > 0 && Math.max(0, Number(u.fires || 0)) <= 0) {
-            u.fires = this.devSeedFires;
+            this._setFires(u, this.devSeedFires);
           }
         }
         this.users.set(id, u);
       }
     }
+    // Las mutaciones síncronas que siguen a ensureUser entran en el mismo volcado
+    this._dirty('u', id);
     return this.users.get(id);
   }
 
@@ -218,6 +276,22 @@ class MemoryStore extends EventEmitter {
     return this.users.get(id) || null;
   }
 
+  // Elimina una cuenta interna de sala (pot:*, ttt:pot:*) ya vacía junto con su historial;
+  // con saldo se conserva para no destruir fondos
+  dropEmptyAccount(userId) {
+    const id = String(userId || '').trim();
+    if (!/^(ttt:)?pot:/.test(id)) return { ok: false, error: 'not_internal' };
+    const u = this.users.get(id);
+    if (!u) return { ok: true, removed: false };
+    const fires = Math.max(0, Number(u.fires || 0)); const coins = Math.max(0, Number(u.coins || 0));
+    if (fires > 0 || coins > 0) return { ok: false, error: 'not_empty', fires, coins };
+    this.users.delete(id);
+    this.userTx.delete(id);
+    this.presence.remove(id);
+    this._dirty('u', id); this._dirty('ut', id);
+    return { ok: true, removed: true };
+  }
+
   // Sincroniza (si está disponible) los saldos desde la billetera externa (Postgres)
   // Solo para IDs externos tg:/db:/em:. Sincronización bidireccional completa.
   async syncFromExtWallet(userId) {
@@ -234,8 +308,9 @@ class MemoryStore extends EventEmitter {
       if (u) {
         // Sincronización bidireccional: actualiza siempre con el valor de DB
         u.coins = coins;
-        u.fires = fires;
+        this._setFires(u, fires);
         this.users.set(id, u);
+        this._dirty('u', id);
       }
       return { ok: true, coins: (u && u.coins) || 0, fires: (u && u.fires) || 0 };
     } catch (_) {
@@ -243,15 +318,11 @@ class MemoryStore extends EventEmitter {
     }
   }
 
+  // Orden de alta ascendente; busca en userId y userName
   listUsers({ search = '', limit = 20, cursor = 0 } = {}) {
-    const arr = Array.from(this.users.values());
-    const q = String(search || '').toLowerCase();
-    const filtered = q ? arr.filter(u => (u.userId || '').toLowerCase().includes(q) || (u.userName || '').toLowerCase().includes(q)) : arr;
-    const start = Number(cursor) || 0;
-    const end = Math.min(filtered.length, start + Math.max(1, Math.min(100, Number(limit) || 20)));
-    const items = filtered.slice(start, end);
-    const nextCursor = end < filtered.length ? end : null;
-    return { items, nextCursor, total: filtered.length };
+    const l = Math.max(1, Math.min(100, Number(limit) || 20));
+    const match = (u, q) => (u.userId || '').toLowerCase().includes(q) || (u.userName || '').toLowerCase().includes(q);
+    return this.directory.page({ search, match, scope: 'basic', limit: l, cursor, order: 'asc' });
   }
 
   // --- Stats ---
@@ -270,12 +341,24 @@ class MemoryStore extends EventEmitter {
     if (!st.byGame[g]) st.byGame[g] = this._statObj();
     st.byGame[g].games += 1;
     if (r === 'win') st.byGame[g].wins += 1; else if (r === 'loss') st.byGame[g].losses += 1; else if (r === 'draw') st.byGame[g].draws += 1;
+    this.leaderboards.track(st, g, r);
     this.userStats.set(id, st);
+    this._dirty('st', id);
+    this.leaderboards.update(id, st, g);
   }
   getUserStats(userId){
     const st = this._getStats(userId);
     return { wins: st.wins, losses: st.losses, draws: st.draws, games: st.games, byGame: { ...st.byGame } };
   }
+  // Ranking por juego ('overall' | 'tictactoe' | 'bingo' | ...) y ventana (all|daily|weekly)
+  getLeaderboard({ game = 'overall', window = 'all', limit = 10, offset = 0 } = {}) {
+    const l = Math.max(1, Math.min(100, Number(limit) || 10));
+    return this.leaderboards.top({ game: String(game), window, limit: l, offset });
+  }
+  getLeaderboardAround({ game = 'overall', window = 'all', userId, k = 5 } = {}) {
+    const kk = Math.max(0, Math.min(25, Number(k) || 0));
+    return this.leaderboards.around({ game: String(game), window, userId: String(userId || '').trim(), k: kk });
+  }
 
   // --- User tracking & contact metadata ---
   touchUser(userId, opts) {
@@ -284,7 +367,8 @@ class MemoryStore extends EventEmitter {
     const now = Date.now();
     const prevLast = Number(u.lastSeenAt || 0);
     u.lastSeenAt = now;
-    const windowMs = Math.max(15000, Math.min(10 * 60_000, parseInt(process.env.ONLINE_WINDOW_MS || '120000', 10) || 120000));
+    const windowMs = this.presence.windowMs;
+    this.presence.touch(u.userId, { game: (opts && opts.game) || null, now });
     const gap = now - prevLast;
     if (!u.currentSessionStart || gap > windowMs) {
       u.currentSessionStart = now;
@@ -333,38 +417,53 @@ class MemoryStore extends EventEmitter {
     return u;
   }
 
+  // Más recientes primero; solo se construye el objeto detallado de la página
   listUsersDetailed({ search = '', limit = 50, cursor = 0 } = {}) {
-    const arr = Array.from(this.users.values()).map(u => {
-      const tgId = (u.telegramId) ? String(u.telegramId) : (String(u.userId || '').startsWith('tg:') ? String(u.userId).slice(3) : undefined);
-      return {
-        userId: u.userId,
-        userName: u.userName,
-        createdAt: Number(u.createdAt || 0),
-        lastSeenAt: Number(u.lastSeenAt || 0),
-        telegramId: tgId,
-        email: u.email,
-        phone: u.phone,
-        fires: Math.max(0, Number(u.fires || 0)),
-        coins: Math.max(0, Number(u.coins || 0)),
-        lastDevice: u.lastDevice,
-        lastDurationMs: Math.max(0, Number(u.lastDurationMs || 0)),
-        devices: Array.isArray(u.devices) ? u.devices.slice(0, 5) : []
-      };
-    });
-    const q = String(search || '').toLowerCase();
-    const filtered = q ? arr.filter(x =>
-      (x.userId||'').toLowerCase().includes(q) ||
-      (x.userName||'').toLowerCase().includes(q) ||
-      (x.email||'').toLowerCase().includes(q) ||
-      (x.phone||'').toLowerCase().includes(q) ||
-      (x.telegramId||'').toLowerCase().includes(q)
-    ) : arr;
-    filtered.sort((a,b)=> (b.createdAt||0)-(a.createdAt||0));
-    const start = Number(cursor) || 0;
-    const end = Math.min(filtered.length, start + Math.max(1, Math.min(200, Number(limit) || 50)));
-    const items = filtered.slice(start, end);
-    const nextCursor = end < filtered.length ? end : null;
-    return { items, nextCursor, total: filtered.length };
+    const tgIdOf = (u) => (u.telegramId) ? String(u.telegramId) : (String(u.userId || '').startsWith('tg:') ? String(u.userId).slice(3) : undefined);
+    const match = (u, q) =>
+      (u.userId||'').toLowerCase().includes(q) ||
+      (u.userName||'').toLowerCase().includes(q) ||
+      (u.email||'').toLowerCase().includes(q) ||
+      (u.phone||'').toLowerCase().includes(q) ||
+      (tgIdOf(u)||'').toLowerCase().includes(q);
+    const l = Math.max(1, Math.min(200, Number(limit) || 50));
+    const out = this.directory.page({ search, match, scope: 'detailed', limit: l, cursor, order: 'desc' });
+    return { items: out.items.map(u => this._detailedUser(u)), nextCursor: out.nextCursor, total: out.total };
+  }
+
+  // Usuarios online (actividad más reciente primero), opcionalmente de un juego;
+  // cursor = 'cubeta.id' devuelto en nextCursor (un número se acepta como offset heredado)
+  listOnlineUsers({ game = null, limit = 50, cursor = null } = {}) {
+    const l = Math.max(1, Math.min(200, Number(limit) || 50));
+    const c = (cursor === null || cursor === undefined) ? '' : String(cursor);
+    const legacy = /^\d+$/.test(c);
+    const out = this.presence.list({ game, limit: l, offset: legacy ? Number(c) : 0, cursor: legacy ? null : c });
+    const items = [];
+    for (const id of out.items) { const u = this.users.get(id); if (u) items.push(this._detailedUser(u)); }
+    const next = legacy ? (out.nextOffset === null ? null : String(out.nextOffset)) : out.nextCursor;
+    return { items, nextCursor: next, total: out.total };
+  }
+
+  getPresenceStats() {
+    return { online: this.presence.count(), byGame: this.presence.byGame(), windowMs: this.presence.windowMs, bucketMs: this.presence.bucketMs };
+  }
+
+  _detailedUser(u) {
+    const tgIdOf = (x) => (x.telegramId) ? String(x.telegramId) : (String(x.userId || '').startsWith('tg:') ? String(x.userId).slice(3) : undefined);
+    return {
+      userId: u.userId,
+      userName: u.userName,
+      createdAt: Number(u.createdAt || 0),
+      lastSeenAt: Number(u.lastSeenAt || 0),
+      telegramId: tgIdOf(u),
+      email: u.email,
+      phone: u.phone,
+      fires: Math.max(0, Number(u.fires || 0)),
+      coins: Math.max(0, Number(u.coins || 0)),
+      lastDevice: u.lastDevice,
+      lastDurationMs: Math.max(0, Number(u.lastDurationMs || 0)),
+      devices: Array.isArray(u.devices) ? u.devices.slice(0, 5) : []
+    };
   }
 
   addSponsor({ userId, key, description, initialAmount = 0 }) {
@@ -372,6 +471,7 @@ class MemoryStore extends EventEmitter {
     if (!id) throw new Error('invalid_user');
     const rec = { userId: id, key: key ? String(key) : undefined, description: description ? String(description) : undefined };
     this.sponsors.set(id, rec);
+    this._dirty('sp', id);
     if (initialAmount > 0) {
       this.grantFromSupply({ toUserId: id, amount: Number(initialAmount), reason: 'sponsor_init' });
     }
@@ -381,6 +481,7 @@ class MemoryStore extends EventEmitter {
   removeSponsor({ userId }) {
     const id = String(userId || '').trim();
     this.sponsors.delete(id);
+    this._dirty('sp', id);
     return true;
   }
 
@@ -389,6 +490,7 @@ class MemoryStore extends EventEmitter {
     const cur = this.sponsors.get(id) || { userId: id };
     cur.description = description;
     this.sponsors.set(id, cur);
+    this._dirty('sp', id);
     return cur;
   }
 
@@ -397,6 +499,7 @@ class MemoryStore extends EventEmitter {
     const cur = this.sponsors.get(id) || { userId: id };
     cur.key = String(key || '');
     this.sponsors.set(id, cur);
+    this._dirty('sp', id);
     return cur;
   }
 
@@ -404,6 +507,7 @@ class MemoryStore extends EventEmitter {
     const id = String(userId || '').trim();
     const cur = this.sponsors.get(id);
     if (cur) delete cur.key;
+    this._dirty('sp', id);
     return cur;
   }
 
@@ -429,6 +533,7 @@ class MemoryStore extends EventEmitter {
     u.coins = Math.max(0, Number(u.coins || 0)) + award;
     rec.count += award;
     this.coinDaily.set(id, rec);
+    this._dirty('cd', id);
     const tx = this.pushTx({ type: 'coin', toUserId: id, amount: award, reason });
     this._addUserTx(id, tx);
     return { u, tx, awarded: award, remaining: Math.max(0, cap - rec.count), cap };
@@ -440,7 +545,7 @@ class MemoryStore extends EventEmitter {
     if (!u || a <= 0) throw new Error('invalid_grant');
     const reserve = this.getReserve();
     if (a > reserve) throw new Error('insufficient_reserve');
-    u.fires += a;
+    this._setFires(u, u.fires + a);
     const tx = this.pushTx({ type: 'grant', toUserId, amount: a, reason: reason || 'grant' });
     this._addUserTx(toUserId, tx);
     this.emit('supply_changed', this.getSupplySummary());
@@ -455,7 +560,7 @@ class MemoryStore extends EventEmitter {
     const a = Math.max(0, Number(amount) || 0);
     if (a <= 0) throw new Error('invalid_amount');
     const to = this.ensureUser(toUserId);
-    to.fires += a;
+    this._setFires(to, to.fires + a);
     const tx = this.pushTx({ type: 'transfer', fromUserId, toUserId, amount: a, reason: reason || 'transfer' });
     this._addUserTx(toUserId, tx);
     return { to, tx };
@@ -463,18 +568,28 @@ class MemoryStore extends EventEmitter {
 
   _addUserTx(userId, tx) {
     const id = String(userId || '').trim();
-    if (!this.userTx.has(id)) this.userTx.set(id, []);
-    const arr = this.userTx.get(id);
-    arr.unshift(tx);
-    this.userTx.set(id, arr.slice(0, 200));
+    let ring = this.userTx.get(id);
+    if (!ring) { ring = new TxRing(this.txUserCap); this.userTx.set(id, ring); }
+    ring.push(tx);
+    this._journal('utx', id, tx);
   }
 
-  getUserHistory(userId, { limit = 20, offset = 0 } = {}) {
+  getUserHistory(userId, { limit = 20, offset = 0, cursor = null } = {}) {
     const id = String(userId || '').trim();
-    const arr = this.userTx.get(id) || [];
+    const ring = this.userTx.get(id);
     const l = Math.max(1, Math.min(100, Number(limit) || 20));
     const o = Math.max(0, Number(offset) || 0);
-    return { items: arr.slice(o, o + l), total: arr.length, limit: l, offset: o };
+    if (!ring) return { items: [], nextCursor: null, total: 0, limit: l, offset: o };
+    const { items, nextCursor } = ring.page({ limit: l, offset: o, cursor });
+    return { items, nextCursor, total: ring.length, limit: l, offset: o };
+  }
+
+  // Tras cargar journals persistidos: los ids nuevos continúan la secuencia
+  _resumeTxSeq() {
+    let max = 0;
+    const top = this.txs.at(0); if (top && top.seq) max = Number(top.seq);
+    for (const ring of this.userTx.values()) { const t = ring.at(0); if (t && t.seq > max) max = Number(t.seq); }
+    this.txSeq = Math.max(this.txSeq, max);
   }
 
   // ----- Fire Requests (compras de fuegos) -----
@@ -493,39 +608,41 @@ class MemoryStore extends EventEmitter {
       createdAt: Date.now(),
       updatedAt: Date.now()
     };
-    this.fireRequests.unshift(rec);
+    this.fireRequests.add(rec);
+    this._dirty('fr', rec.id, rec);
     const tx = this.pushTx({ type: 'fire_request_create', userId: uid, amount: a, reference: ref });
     this._addUserTx(uid, tx);
     return rec;
   }
 
-  listFireRequests({ status, limit = 20, offset = 0 } = {}) {
-    let arr = this.fireRequests.slice();
-    if (status) arr = arr.filter(r => r.status === status);
+  // cursor: nextCursor de la página anterior (dígitos); sin cursor se usa offset
+  listFireRequests({ status, limit = 20, offset = 0, cursor = null } = {}) {
+    if (cursor !== null && cursor !== undefined && cursor !== '' && !/^\d+$/.test(String(cursor))) throw new Error('invalid_cursor');
     const l = Math.max(1, Math.min(100, Number(limit) || 20));
     const o = Math.max(0, Number(offset) || 0);
-    return { items: arr.slice(o, o + l), total: arr.length, limit: l, offset: o };
+    const { items, nextCursor, total } = this.fireRequests.page({ status: status || null, limit: l, offset: o, cursor });
+    return { items, total, limit: l, offset: o, nextCursor };
   }
 
-  listFireRequestsByUser(userId, { limit = 20, offset = 0 } = {}) {
+  listFireRequestsByUser(userId, { limit = 20, offset = 0, cursor = null, status } = {}) {
+    if (cursor !== null && cursor !== undefined && cursor !== '' && !/^\d+$/.test(String(cursor))) throw new Error('invalid_cursor');
     const uid = String(userId || '').trim();
-    const all = this.fireRequests.filter(r => r.userId === uid);
     const l = Math.max(1, Math.min(100, Number(limit) || 20));
     const o = Math.max(0, Number(offset) || 0);
-    return { items: all.slice(o, o + l), total: all.length, limit: l, offset: o };
+    const { items, nextCursor, total } = this.fireRequests.page({ userId: uid, status: status || null, limit: l, offset: o, cursor });
+    return { items, total, limit: l, offset: o, nextCursor };
   }
 
   getFireRequest(id) {
-    const rid = String(id || '').trim();
-    return this.fireRequests.find(r => r.id === rid) || null;
+    return this.fireRequests.get(String(id || '').trim());
   }
 
   acceptFireRequest({ id, adminUserName }) {
     const rec = this.getFireRequest(id);
     if (!rec) throw new Error('request_not_found');
     if (rec.status !== 'pending') throw new Error('request_not_pending');
-    rec.status = 'accepted';
-    rec.updatedAt = Date.now();
+    this.fireRequests.setStatus(rec, 'accepted');
+    this._dirty('fr', rec.id, rec);
     // Aceptar: otorgar desde la reserva hacia el usuario
     const out = this.grantFromSupply({ toUserId: rec.userId, amount: rec.amount, reason: 'fire_request_accept' });
     const tx = this.pushTx({ type: 'fire_request_accept', requestId: rec.id, toUserId: rec.userId, amount: rec.amount, admin: adminUserName });
@@ -537,8 +654,8 @@ class MemoryStore extends EventEmitter {
     const rec = this.getFireRequest(id);
     if (!rec) throw new Error('request_not_found');
     if (rec.status !== 'pending') throw new Error('request_not_pending');
-    rec.status = 'rejected';
-    rec.updatedAt = Date.now();
+    this.fireRequests.setStatus(rec, 'rejected');
+    this._dirty('fr', rec.id, rec);
     const tx = this.pushTx({ type: 'fire_request_reject', requestId: rec.id, userId: rec.userId, amount: rec.amount, admin: adminUserName });
     this._addUserTx(rec.userId, tx);
     return { request: rec };
@@ -566,7 +683,7 @@ class MemoryStore extends EventEmitter {
     const u = this.ensureUser(id);
     const cur = Math.max(0, Number(u.fires || 0));
     if (cur < a) return { ok: false, error: 'insufficient_fires' };
-    u.fires = cur - a;
+    this._setFires(u, cur - a);
     const tx = this.pushTx({ type: 'fires_spend', fromUserId: id, amount: a, reason });
     this._addUserTx(id, tx);
     return { ok: true, remaining: u.fires, tx };
@@ -600,14 +717,56 @@ class MemoryStore extends EventEmitter {
     const tu = this.ensureUser(to);
     const cur = Math.max(0, Number(fu.fires || 0));
     if (cur < a) return { ok: false, error: 'insufficient_fires' };
-    fu.fires = cur - a;
-    tu.fires = Math.max(0, Number(tu.fires || 0)) + a;
+    this._setFires(fu, cur - a);
+    this._setFires(tu, Math.max(0, Number(tu.fires || 0)) + a);
     const tx = this.pushTx({ type: 'transfer', fromUserId: from, toUserId: to, amount: a, reason });
     this._addUserTx(from, tx);
     this._addUserTx(to, tx);
     return { ok: true, from: fu, to: tu, tx };
   }
 
+  // Asiento contable de varias patas (p. ej. pot -> ganador/host/sponsor).
+  // Valida todos los saldos antes de tocar nada y aplica las patas en un solo
+  // bloque síncrono con una única entrada de journal: o se aplican todas o ninguna.
+  postLedger({ currency = 'fires', legs = [], reason = 'ledger_posting', ref = null } = {}) {
+    if (currency !== 'fires' && currency !== 'coins') return { ok: false, error: 'invalid_currency' };
+    const clean = [];
+    for (const l of (legs || [])) {
+      const from = String(l && l.fromUserId || '').trim();
+      const to = String(l && l.toUserId || '').trim();
+      const a = Math.max(0, Math.floor(Number(l && l.amount) || 0));
+      if (a <= 0) continue;
+      if (!from || !to || from === to) return { ok: false, error: 'invalid_leg' };
+      clean.push({ fromUserId: from, toUserId: to, amount: a, reason: String(l.reason || reason) });
+    }
+    if (!clean.length) return { ok: false, error: 'empty_posting' };
+    const net = new Map(); // userId -> delta neto
+    for (const l of clean) {
+      net.set(l.fromUserId, (net.get(l.fromUserId) || 0) - l.amount);
+      net.set(l.toUserId, (net.get(l.toUserId) || 0) + l.amount);
+    }
+    const accounts = new Map();
+    for (const [id, d] of net) {
+      const u = this.ensureUser(id);
+      const cur = Math.max(0, Number(u[currency] || 0));
+      if (cur + d < 0) return { ok: false, error: currency === 'fires' ? 'insufficient_fires' : 'insufficient_coins', userId: id };
+      accounts.set(id, { u, next: cur + d });
+    }
+    for (const { u, next } of accounts.values()) {
+      if (currency === 'fires') this._setFires(u, next); else u.coins = next;
+    }
+    const amount = clean.reduce((s, l) => s + l.amount, 0);
+    const tx = this.pushTx({ type: 'ledger_posting', currency, amount, reason, ref, legs: clean });
+    for (const id of accounts.keys()) this._addUserTx(id, tx);
+    return { ok: true, tx, amount };
+  }
+
+  // Liquidación por lotes (muchas salas a la vez): cada asiento es atómico por
+  // sí mismo; uno rechazado no impide aplicar los demás
+  postLedgerBatch(postings = []) {
+    return (postings || []).map((p) => { try { return this.postLedger(p); } catch (e) { return { ok: false, error: String(e && e.message || e) }; } });
+  }
+
   // Crédito administrativo de coins (sin cap diario)
   addCoinsAdmin({ userId, amount = 0, reason = 'coins_admin_add' }) {
     const id = String(userId || '').trim();
@@ -626,7 +785,7 @@ class MemoryStore extends EventEmitter {
     const a = Math.max(0, Math.floor(Number(amount) || 0));
     if (!id || a <= 0) return { ok: false, error: 'invalid_amount' };
     const u = this.ensureUser(id);
-    u.fires = Math.max(0, Number(u.fires || 0)) + a;
+    this._setFires(u, Math.max(0, Number(u.fires || 0)) + a);
     const tx = this.pushTx({ type: 'fires_admin_add', toUserId: id, amount: a, reason });
     this._addUserTx(id, tx);
     return { ok: true, balance: u.fires, tx };
@@ -640,11 +799,11 @@ class MemoryStore extends EventEmitter {
     const s = this.getUser(sId);
     if (!s) return { ok: true };
     p.coins = Math.max(0, Number(p.coins || 0)) + Math.max(0, Number(s.coins || 0));
-    p.fires = Math.max(0, Number(p.fires || 0)) + Math.max(0, Number(s.fires || 0));
-    const sTx = this.userTx.get(sId) || [];
-    const pTx = this.userTx.get(pId) || [];
-    const merged = sTx.concat(pTx).slice(0, 200);
-    this.userTx.set(pId, merged);
+    this._setFires(p, Math.max(0, Number(p.fires || 0)) + Math.max(0, Number(s.fires || 0)));
+    const sTx = this.userTx.get(sId);
+    const pTx = this.userTx.get(pId);
+    const merged = (sTx ? sTx.toArray() : []).concat(pTx ? pTx.toArray() : []).sort((a, b) => Number(b.seq || 0) - Number(a.seq || 0));
+    this.userTx.set(pId, TxRing.from(merged, this.txUserCap));
     this.userTx.delete(sId);
     for (const tx of this.txs) {
       if (!tx) continue;
@@ -652,7 +811,7 @@ class MemoryStore extends EventEmitter {
       if (tx.fromUserId === sId) tx.fromUserId = pId;
       if (tx.userId === sId) tx.userId = pId;
     }
-    this.fireRequests = this.fireRequests.map(r => r && r.userId === sId ? { ...r, userId: pId } : r);
+    for (const moved of this.fireRequests.reassignUser(sId, pId)) this._dirty('fr', moved.id, moved);
     const sSponsor = this.sponsors.get(sId);
     const pSponsor = this.sponsors.get(pId);
     if (sSponsor && !pSponsor) {
@@ -660,7 +819,9 @@ class MemoryStore extends EventEmitter {
       this.sponsors.set(pId, moved);
     }
     this.sponsors.delete(sId);
+    this._setFires(s, 0);
     this.users.delete(sId);
+    this.presence.remove(sId);
     const sDaily = this.coinDaily.get(sId);
     if (sDaily) {
       const pDaily = this.coinDaily.get(pId);
@@ -672,6 +833,7 @@ class MemoryStore extends EventEmitter {
       }
       this.coinDaily.delete(sId);
     }
+    for (const [kind, id] of [['u', sId], ['ut', pId], ['ut', sId], ['sp', pId], ['sp', sId], ['cd', pId], ['cd', sId], ['txs', '']]) this._dirty(kind, id);
     this.emit('supply_changed', this.getSupplySummary());
     return { ok: true, primaryId: pId };
   }
@@ -696,6 +858,7 @@ class MemoryStore extends EventEmitter {
     };
     this.bingoWins.unshift(rec);
     this.bingoWins = this.bingoWins.slice(0, 500);
+    this._journal('bw', '', rec);
     return rec;
   }
 
@@ -0,0 +1,158 @@
+// Presencia online por cubetas de tiempo (rueda simple): cada usuario vive en la
+// cubeta de su último toque y, opcionalmente, en el conjunto del juego donde está.
+// - touch(): O(1); mover a un usuario de cubeta no recorre nada.
+// - Expiración: se descartan cubetas completas más antiguas que la ventana; cada
+//   usuario sale una vez por sesión, así que el coste es O(1) amortizado.
+// - count()/byGame(): tamaño de los conjuntos, O(1).
+// La precisión es de una cubeta: un usuario cuenta como online hasta que su cubeta
+// entera queda fuera de la ventana (la marca exacta sigue siendo u.lastSeenAt).
+
+// Juego asociado a una ruta HTTP (API o página)
+function gameOfPath(p) {
+  const m = /^\/(?:api\/)?games\/(tictactoe|bingo)(?:\/|$)/.exec(String(p || ''));
+  if (m) return m[1];
+  if (/^\/(?:api\/)?raffles(?:\/|$)/.test(String(p || ''))) return 'raffles';
+  return null;
+}
+
+class PresenceTracker {
+  constructor({ windowMs = 120000, bucketMs = 15000 } = {}) {
+    this.windowMs = windowMs;
+    this.bucketMs = Math.max(1000, Math.min(windowMs, bucketMs));
+    this.reset();
+  }
+
+  static gameOfPath(p) { return gameOfPath(p); }
+
+  reset() {
+    this.buckets = new Map(); // n de cubeta -> Set(userId); orden de inserción = orden del último toque
+    this.newest = -Infinity;
+    this.seen = new Map(); // userId -> { bucket, game }
+    this.games = new Map(); // game -> Set(userId)
+  }
+
+  _leaveGame(id, game) {
+    const g = this.games.get(game);
+    if (g) { g.delete(id); if (!g.size) this.games.delete(game); }
+  }
+
+  _expire(now) {
+    const min = Math.floor((now - this.windowMs) / this.bucketMs);
+    for (const [b, set] of this.buckets) {
+      if (b >= min) break;
+      for (const id of set) {
+        const e = this.seen.get(id);
+        if (e && e.bucket === b) { this.seen.delete(id); if (e.game) this._leaveGame(id, e.game); }
+      }
+      this.buckets.delete(b);
+    }
+  }
+
+  touch(userId, { game = null, now = Date.now() } = {}) {
+    const id = String(userId || ''); if (!id) return;
+    this._expire(now);
+    // Relojes que retroceden caen en la cubeta más reciente para no romper el orden
+    const b = Math.max(this.newest, Math.floor(now / this.bucketMs));
+    this.newest = b;
+    let e = this.seen.get(id);
+    if (!e) { e = { bucket: null, game: null }; this.seen.set(id, e); }
+    if (e.bucket === b) {
+      // Mismo tramo: pasar al final para que el Set siga ordenado por último toque
+      const set = this.buckets.get(b);
+      set.delete(id); set.add(id);
+    } else {
+      if (e.bucket !== null) {
+        const prev = this.buckets.get(e.bucket);
+        if (prev) { prev.delete(id); if (!prev.size) this.buckets.delete(e.bucket); }
+      }
+      let set = this.buckets.get(b);
+      if (!set) { set = new Set(); this.buckets.set(b, set); }
+      set.add(id);
+      e.bucket = b;
+    }
+    // Una petición sin juego conserva el último juego de la sesión
+    if (game && game !== e.game) {
+      if (e.game) this._leaveGame(id, e.game);
+      e.game = game;
+      let g = this.games.get(game);
+      if (!g) { g = new Set(); this.games.set(game, g); }
+      g.add(id);
+    }
+  }
+
+  remove(userId) {
+    const id = String(userId || '');
+    const e = this.seen.get(id); if (!e) return;
+    const set = this.buckets.get(e.bucket);
+    if (set) { set.delete(id); if (!set.size) this.buckets.delete(e.bucket); }
+    if (e.game) this._leaveGame(id, e.game);
+    this.seen.delete(id);
+  }
+
+  // Reconstrucción desde lastSeenAt tras recuperar el estado: [{ userId, lastSeenAt }]
+  seed(entries, now = Date.now()) {
+    this.reset();
+    const recent = [];
+    for (const e of entries) if (Number(e.lastSeenAt || 0) > now - this.windowMs) recent.push(e);
+    recent.sort((a, b) => Number(a.lastSeenAt) - Number(b.lastSeenAt));
+    for (const e of recent) this.touch(e.userId, { now: Number(e.lastSeenAt) });
+    this._expire(now);
+  }
+
+  isOnline(userId, now = Date.now()) {
+    this._expire(now);
+    return this.seen.has(String(userId || ''));
+  }
+
+  count(game = null, now = Date.now()) {
+    this._expire(now);
+    if (!game) return this.seen.size;
+    const g = this.games.get(game);
+    return g ? g.size : 0;
+  }
+
+  byGame(now = Date.now()) {
+    this._expire(now);
+    const out = {};
+    for (const [game, g] of this.games) out[game] = g.size;
+    return out;
+  }
+
+  // Ids online, actividad más reciente primero. cursor = 'cubeta.id' del último
+  // visto (nextCursor): la página siguiente continúa tras esa posición aunque
+  // entren usuarios nuevos delante. Si ese id ya cambió de cubeta, la cubeta del
+  // cursor se recorre entera; si volvió a tocar dentro de la misma, se sigue desde
+  // su nueva posición (en ambos casos puede repetir ids, no saltárselos). Un offset
+  // numérico se acepta como paginación heredada.
+  list({ game = null, limit = 50, offset = 0, cursor = null, now = Date.now() } = {}) {
+    this._expire(now);
+    let key = null;
+    if (cursor !== null && cursor !== undefined && cursor !== '') {
+      const m = /^(-?\d+)\.(.+)$/.exec(String(cursor));
+      if (!m) throw new Error('invalid_cursor');
+      key = { bucket: Number(m[1]), id: m[2] };
+    }
+    const inGame = game ? (this.games.get(game) || new Set()) : null;
+    const keys = Array.from(this.buckets.keys());
+    const items = []; let skip = key ? 0 : Math.max(0, Number(offset) || 0); let more = false; let last = null;
+    outer: for (let i = keys.length - 1; i >= 0; i--) {
+      const b = keys[i];
+      if (key && b > key.bucket) continue;
+      // Dentro de la cubeta, último toque primero
+      const ids = Array.from(this.buckets.get(b));
+      let j = ids.length - 1;
+      if (key && b === key.bucket) { const at = ids.lastIndexOf(key.id); if (at >= 0) j = at - 1; }
+      for (; j >= 0; j--) {
+        const id = ids[j];
+        if (inGame && !inGame.has(id)) continue;
+        if (skip > 0) { skip -= 1; continue; }
+        if (items.length >= limit) { more = true; break outer; }
+        items.push(id); last = b + '.' + id;
+      }
+    }
+    const o = Math.max(0, Number(offset) || 0);
+    return { items, nextCursor: (more && last) ? last : null, nextOffset: (more && !key) ? o + items.length : null, total: inGame ? inGame.size : this.seen.size };
+  }
+}
+
+module.exports = PresenceTracker;
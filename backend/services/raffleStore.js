@@ -221,9 +221,11 @@ class RaffleStore extends EventEmitter {
         const g = Math.floor(potBal * 0.70);
         const h = Math.floor(potBal * 0.20);
         const s = Math.max(0, potBal - g - h); // 10%
-        try{ store.transferFires({ fromUserId: potId, toUserId: win.userId, amount: g, reason: 'raffle_payout_winner' }); }catch(_){ }
-        try{ store.transferFires({ fromUserId: potId, toUserId: r.hostId, amount: h, reason: 'raffle_payout_host' }); }catch(_){ }
-        try{ store.transferFires({ fromUserId: potId, toUserId: SPONSOR_ID, amount: s, reason: 'raffle_payout_sponsor' }); }catch(_){ }
+        try{ store.postLedger({ currency: 'fires', reason: 'raffle_payout', ref: r.id, legs: [
+          { fromUserId: potId, toUserId: win.userId, amount: g, reason: 'raffle_payout_winner' },
+          { fromUserId: potId, toUserId: r.hostId, amount: h, reason: 'raffle_payout_host' },
+          { fromUserId: potId, toUserId: SPONSOR_ID, amount: s, reason: 'raffle_payout_sponsor' }
+        ] }); }catch(_){ }
       }
     }
 
@@ -1,5 +1,8 @@
 const EventEmitter = require('events');
 const db = require('../db');
+const userResolver = require('./userResolver');
+const supplyRepo = require('../repos/supplyRepo');
+const walletRepo = require('../repos/walletRepo');
 
 class RaffleStoreSql extends EventEmitter {
   constructor(){ super(); }
@@ -7,21 +10,7 @@ class RaffleStoreSql extends EventEmitter {
   sizeFromRange(range){ return (range === '000-999') ? 1000 : 100; }
 
   async mapExtToDbUserId(userExt){
-    try{
-      const v = String(userExt||'').trim(); if (!v) return null;
-      if (v.startsWith('db:')) return v.slice(3);
-      if (v.startsWith('tg:')) {
-        const tg = v.slice(3);
-        const r = await db.query('SELECT id FROM users WHERE tg_id=$1 LIMIT 1', [tg]);
-        return (r.rows && r.rows[0] && r.rows[0].id) || null;
-      }
-      if (v.startsWith('em:')) {
-        const em = v.slice(3).toLowerCase();
-        const r = await db.query('SELECT id FROM users WHERE LOWER(email)=$1 LIMIT 1', [em]);
-        return (r.rows && r.rows[0] && r.rows[0].id) || null;
-      }
-      return null;
-    }catch(_){ return null; }
+    try{ return await userResolver.resolve(userExt); }catch(_){ return null; }
   }
 
   getPublicInfoRow(r){
@@ -214,6 +203,7 @@ class RaffleStoreSql extends EventEmitter {
         const bal = Number(wal && wal.fires_balance || 0);
         if (bal < price) throw new Error('insufficient_fires');
         await client.query('UPDATE wallets SET fires_balance = fires_balance - $2, updated_at=NOW() WHERE id=$1', [wal.id, price]);
+        await supplyRepo.adjustCirculating(client, wal.id, -price);
         await client.query('INSERT INTO wallet_transactions(wallet_id, type, amount_fire, reference, meta, created_at) VALUES ($1,$2,$3,$4,$5,NOW())', [wal.id, 'raffle_buy', -price, String(id), { number: idx }]);
         await client.query('UPDATE raffles SET pot_fires = COALESCE(pot_fires,0) + $2 WHERE id=$1', [id, price]);
       } else if (mode === 'prize') {
@@ -252,17 +242,12 @@ class RaffleStoreSql extends EventEmitter {
             const sponsorDbId = await this.mapExtToDbUserId('tg:1417856820');
             // ganador
             const winDbId = winnerExt ? await this.mapExtToDbUserId(String(winnerExt)) : null;
-            const credit = async (userId, amount, type) => {
-              if (!userId || amount<=0) return;
-              await client.query('INSERT INTO wallets (user_id, fires_balance, coins_balance, updated_at) VALUES ($1,0,0,NOW()) ON CONFLICT (user_id) DO NOTHING', [userId]);
-              const w = await client.query('SELECT id FROM wallets WHERE user_id=$1 FOR UPDATE', [userId]);
-              const wid = w.rows[0]?.id; if (!wid) return;
-              await client.query('UPDATE wallets SET fires_balance = fires_balance + $2, updated_at=NOW() WHERE id=$1', [wid, amount]);
-              await client.query('INSERT INTO wallet_transactions(wallet_id,type,amount_fire,reference,meta,created_at) VALUES ($1,$2,$3,$4,$5,NOW())', [wid, type, amount, String(row.id), { raffleId: row.id }]);
-            };
-            await credit(winDbId, g, 'raffle_payout_winner');
-            await credit(hostDbId, h, 'raffle_payout_host');
-            await credit(sponsorDbId, s, 'raffle_payout_sponsor');
+            // Un solo asiento (una sentencia) dentro de la transacción del cierre
+            await walletRepo.postLedger(client, { currency:'fires', reference: String(row.id), meta: { raffleId: row.id }, legs: [
+              { userId: winDbId, amount: winDbId ? g : 0, type: 'raffle_payout_winner' },
+              { userId: hostDbId, amount: hostDbId ? h : 0, type: 'raffle_payout_host' },
+              { userId: sponsorDbId, amount: sponsorDbId ? s : 0, type: 'raffle_payout_sponsor' }
+            ] });
           }
         }
         await client.query('UPDATE raffles SET status=\'completed\', pot_fires=0 WHERE id=$1', [row.id]);
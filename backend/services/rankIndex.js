@@ -0,0 +1,120 @@
+// Skip list indexable (cada enlace guarda cuántas posiciones salta) para rankings.
+// set/delete/rankOf/at en O(log n) esperado; range(start, count) en O(log n + count).
+// compare(a, b) recibe nodos { id, key } y debe definir un orden total (desempate por id).
+const MAX_LEVEL = 32;
+const P = 0.25;
+
+class RankIndex {
+  constructor(compare) {
+    this.compare = compare;
+    this.head = { id: null, key: null, next: new Array(MAX_LEVEL).fill(null), span: new Array(MAX_LEVEL).fill(0) };
+    this.level = 1;
+    this.length = 0;
+    this.nodes = new Map(); // id -> nodo
+  }
+
+  get size() { return this.length; }
+
+  _randomLevel() {
+    let lvl = 1;
+    while (lvl < MAX_LEVEL && Math.random() < P) lvl += 1;
+    return lvl;
+  }
+
+  has(id) { return this.nodes.has(id); }
+
+  get(id) { const n = this.nodes.get(id); return n ? n.key : undefined; }
+
+  // Carga en bloque [[id, key], ...] (ids únicos): ordena una vez y enlaza en O(n)
+  load(pairs) {
+    const nodes = pairs.map(([id, key]) => ({ id, key, next: null, span: null }));
+    nodes.sort(this.compare);
+    this.head.next.fill(null); this.head.span.fill(0);
+    this.nodes = new Map(); this.level = 1; this.length = nodes.length;
+    const tails = new Array(MAX_LEVEL).fill(this.head); const tailPos = new Array(MAX_LEVEL).fill(0);
+    for (let p = 1; p <= nodes.length; p++) {
+      const node = nodes[p - 1]; const lvl = this._randomLevel();
+      node.next = new Array(lvl).fill(null); node.span = new Array(lvl).fill(0);
+      for (let i = 0; i < lvl; i++) { tails[i].next[i] = node; tails[i].span[i] = p - tailPos[i]; tails[i] = node; tailPos[i] = p; }
+      if (lvl > this.level) this.level = lvl;
+      this.nodes.set(node.id, node);
+    }
+    for (let i = 0; i < this.level; i++) tails[i].span[i] = nodes.length - tailPos[i];
+    return this;
+  }
+
+  // Inserta o reubica id con su nueva clave
+  set(id, key) {
+    if (this.nodes.has(id)) this.delete(id);
+    const probe = { id, key };
+    const update = new Array(this.level); const rank = new Array(this.level);
+    let x = this.head;
+    for (let i = this.level - 1; i >= 0; i--) {
+      rank[i] = i === this.level - 1 ? 0 : rank[i + 1];
+      while (x.next[i] && this.compare(x.next[i], probe) < 0) { rank[i] += x.span[i]; x = x.next[i]; }
+      update[i] = x;
+    }
+    const lvl = this._randomLevel();
+    if (lvl > this.level) {
+      for (let i = this.level; i < lvl; i++) { rank[i] = 0; update[i] = this.head; this.head.span[i] = this.length; }
+      this.level = lvl;
+    }
+    const node = { id, key, next: new Array(lvl), span: new Array(lvl) };
+    for (let i = 0; i < lvl; i++) {
+      node.next[i] = update[i].next[i];
+      update[i].next[i] = node;
+      node.span[i] = update[i].span[i] - (rank[0] - rank[i]);
+      update[i].span[i] = (rank[0] - rank[i]) + 1;
+    }
+    for (let i = lvl; i < this.level; i++) update[i].span[i] += 1;
+    this.nodes.set(id, node);
+    this.length += 1;
+    return node;
+  }
+
+  delete(id) {
+    const node = this.nodes.get(id);
+    if (!node) return false;
+    let x = this.head;
+    for (let i = this.level - 1; i >= 0; i--) {
+      while (x.next[i] && x.next[i] !== node && this.compare(x.next[i], node) < 0) x = x.next[i];
+      if (x.next[i] === node) { x.span[i] += node.span[i] - 1; x.next[i] = node.next[i]; } else x.span[i] -= 1;
+    }
+    while (this.level > 1 && !this.head.next[this.level - 1]) this.level -= 1;
+    this.nodes.delete(id);
+    this.length -= 1;
+    return true;
+  }
+
+  // Posición 0-based de id; -1 si no está
+  rankOf(id) {
+    const node = this.nodes.get(id);
+    if (!node) return -1;
+    let r = 0; let x = this.head;
+    for (let i = this.level - 1; i >= 0; i--) {
+      while (x.next[i] && (x.next[i] === node || this.compare(x.next[i], node) < 0)) { r += x.span[i]; x = x.next[i]; }
+      if (x === node) return r - 1;
+    }
+    return -1;
+  }
+
+  // Nodo en la posición 0-based i
+  at(i) {
+    if (i < 0 || i >= this.length) return null;
+    const target = i + 1; let t = 0; let x = this.head;
+    for (let l = this.level - 1; l >= 0; l--) {
+      while (x.next[l] && t + x.span[l] <= target) { t += x.span[l]; x = x.next[l]; }
+      if (t === target) return x;
+    }
+    return null;
+  }
+
+  range(start, count) {
+    const out = [];
+    let x = this.at(Math.max(0, start));
+    while (x && out.length < count) { out.push(x); x = x.next[0]; }
+    return out;
+  }
+}
+
+module.exports = RankIndex;
@@ -0,0 +1,97 @@
+const fs = require('fs');
+const path = require('path');
+let db = null; try { db = require('../db'); } catch(_) { db = null; }
+let schema = null; try { schema = require('../db/schema'); } catch(_) { schema = null; }
+let logger = null; try { logger = require('../config/logger'); } catch(_) { logger = console; }
+
+// Archivo de salas desalojadas (TicTacToe/Bingo). El GC solo encola (O(1)); un
+// flush diferido hace un INSERT multi-fila en game_room_archive o, sin Postgres
+// (o si el INSERT falla), añade el lote a storage/rooms/archive-YYYY-MM-DD.ndjson.
+class RoomArchive {
+  constructor() {
+    this.dir = path.resolve(process.env.ROOM_ARCHIVE_DIR || path.resolve(__dirname, '../../storage/rooms'));
+    this.batchSize = Math.max(10, parseInt(process.env.ROOM_ARCHIVE_BATCH_SIZE || '200', 10) || 200);
+    this.flushMs = Math.max(100, parseInt(process.env.ROOM_ARCHIVE_FLUSH_MS || '5000', 10) || 5000);
+    this.useDb = String(process.env.ROOM_ARCHIVE_BACKEND || 'db').toLowerCase() !== 'file';
+    this.queue = []; // [{ game, roomId, code, hostId, status, reason, createdAt, updatedAt, archivedAt, data }]
+    this.timer = null;
+    this.flushing = false;
+    this.stats = { enqueued: 0, writtenDb: 0, writtenFile: 0, dropped: 0, flushes: 0, flushErrors: 0, lastFlushAt: 0, lastFlushMs: 0 };
+  }
+
+  dbEnabled() { return !!(this.useDb && db && db.query); }
+
+  record(rec) {
+    if (!rec || !rec.roomId) return false;
+    this.queue.push({ ...rec, archivedAt: Number(rec.archivedAt || Date.now()) });
+    this.stats.enqueued += 1;
+    this._schedule(this.queue.length >= this.batchSize ? 0 : this.flushMs);
+    return true;
+  }
+
+  _schedule(delay) {
+    if (this.timer && delay > 0) return;
+    if (this.timer) { clearTimeout(this.timer); this.timer = null; }
+    this.timer = setTimeout(() => { this.timer = null; this.flush().catch(() => {}); }, delay);
+    try { this.timer.unref(); } catch(_) {}
+  }
+
+  async _writeDb(rows) {
+    if (schema) await schema.ensure('game_room_archive');
+    const cols = [[], [], [], [], [], [], [], [], [], []];
+    for (const r of rows) {
+      cols[0].push(String(r.game)); cols[1].push(String(r.roomId)); cols[2].push(r.code ? String(r.code) : null);
+      cols[3].push(r.hostId ? String(r.hostId) : null); cols[4].push(String(r.status || '')); cols[5].push(String(r.reason || ''));
+      cols[6].push(r.createdAt ? new Date(Number(r.createdAt)) : null); cols[7].push(r.updatedAt ? new Date(Number(r.updatedAt)) : null);
+      cols[8].push(new Date(r.archivedAt)); cols[9].push(JSON.stringify(r.data || {}));
+    }
+    await db.query(`INSERT INTO game_room_archive (game, room_id, code, host_ext, status, reason, created_at, updated_at, archived_at, data)
+      SELECT * FROM UNNEST($1::text[], $2::text[], $3::text[], $4::text[], $5::text[], $6::text[], $7::timestamptz[], $8::timestamptz[], $9::timestamptz[], $10::jsonb[])
+      ON CONFLICT (game, room_id) DO NOTHING`, cols);
+    this.stats.writtenDb += rows.length;
+  }
+
+  async _writeFile(rows) {
+    const day = new Date().toISOString().slice(0, 10);
+    let buf = '';
+    for (const r of rows) buf += JSON.stringify(r) + '\n';
+    await fs.promises.mkdir(this.dir, { recursive: true });
+    await fs.promises.appendFile(path.join(this.dir, `archive-${day}.ndjson`), buf);
+    this.stats.writtenFile += rows.length;
+  }
+
+  async flush() {
+    if (this.flushing || !this.queue.length) return;
+    this.flushing = true;
+    const t0 = Date.now();
+    const rows = this.queue.splice(0, this.batchSize);
+    try {
+      if (this.dbEnabled()) {
+        try { await this._writeDb(rows); }
+        catch (err) {
+          this.stats.flushErrors += 1;
+          try { logger.warn && logger.warn('game_room_archive insert failed, using file', { error: String(err && err.message || err), rows: rows.length }); } catch(_) {}
+          await this._writeFile(rows);
+        }
+      } else {
+        await this._writeFile(rows);
+      }
+      this.stats.flushes += 1;
+    } catch (err) {
+      this.stats.flushErrors += 1;
+      this.stats.dropped += rows.length;
+      try { logger.warn && logger.warn('room archive flush failed', { error: String(err && err.message || err), rows: rows.length }); } catch(_) {}
+    } finally {
+      this.stats.lastFlushAt = Date.now();
+      this.stats.lastFlushMs = this.stats.lastFlushAt - t0;
+      this.flushing = false;
+    }
+    if (this.queue.length) this._schedule(this.queue.length >= this.batchSize ? 0 : this.flushMs);
+  }
+
+  getStats() {
+    return { ...this.stats, queueDepth: this.queue.length, backend: this.dbEnabled() ? 'db' : 'file', batchSize: this.batchSize, flushMs: this.flushMs, flushing: this.flushing };
+  }
+}
+
+module.exports = new RoomArchive();
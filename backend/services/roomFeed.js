@@ -0,0 +1,80 @@
+// Cambios de sala versionados para los streams SSE (TicTacToe/Bingo).
+// Cada cambio de estado incrementa r.v y viaja como un RoomMessage compartido por
+// todos los suscriptores: las tramas SSE se serializan como mucho una vez por
+// mensaje, no una vez por suscriptor.
+// - 'patch': delta compacto { v, ... } para el cambio caliente (jugada, bola).
+// - 'state': estado completo { v, ... }; al conectar o cuando el cliente no tiene
+//   la versión anterior (resync).
+// Cada trama lleva 'id: <v>', así un EventSource que reconecta envía Last-Event-ID
+// y ReplayBuffer le reenvía solo los mensajes que se perdió.
+class RoomMessage {
+  constructor(v, state, patch = null, view = null) {
+    this.v = v;
+    this.state = state;
+    this.patch = patch;
+    this.view = view; // state -> payload público (p.ej. bingo sin cartones)
+    this._stateFrame = null;
+    this._patchFrame = null;
+  }
+
+  stateFrame() {
+    if (this._stateFrame === null) this._stateFrame = sseFrame('state', this.view ? this.view(this.state) : this.state, this.v);
+    return this._stateFrame;
+  }
+
+  patchFrame() {
+    if (this._patchFrame === null) this._patchFrame = sseFrame('patch', { v: this.v, ...this.patch }, this.v);
+    return this._patchFrame;
+  }
+
+  // Trama para un cliente que tiene la versión clientV
+  frameFor(clientV) {
+    return (this.patch && clientV === this.v - 1) ? this.patchFrame() : this.stateFrame();
+  }
+}
+
+function sseFrame(name, payload, id = null) {
+  return (id === null ? '' : `id: ${id}\n`) + `event: ${name}\ndata: ${JSON.stringify(payload)}\n\n`;
+}
+
+// Últimos mensajes por sala en un anillo de capacidad fija (objetos con .v creciente)
+class ReplayBuffer {
+  constructor(capacity = 32) {
+    this.capacity = Math.max(1, Number(capacity) || 32);
+    this.rings = new Map(); // roomId -> { buf, start, len }
+  }
+
+  push(roomId, msg) {
+    let g = this.rings.get(roomId);
+    if (!g) { g = { buf: new Array(this.capacity), start: 0, len: 0 }; this.rings.set(roomId, g); }
+    if (g.len < this.capacity) { g.buf[(g.start + g.len) % this.capacity] = msg; g.len += 1; }
+    else { g.buf[g.start] = msg; g.start = (g.start + 1) % this.capacity; }
+  }
+
+  // Mensajes posteriores a la versión v ([] si está al día); null si v no es válida
+  // o el hueco ya salió del anillo (el cliente necesita un estado completo)
+  since(roomId, v) {
+    const g = this.rings.get(roomId);
+    const n = Number(v);
+    if (!g || !g.len || !Number.isInteger(n) || n < 0) return null;
+    const at = (i) => g.buf[(g.start + i) % this.capacity];
+    const last = at(g.len - 1).v;
+    if (n > last) return null;
+    if (n < at(0).v - 1) return null;
+    const out = [];
+    for (let i = 0; i < g.len; i++) { const m = at(i); if (m.v > n) out.push(m); }
+    return out;
+  }
+
+  drop(roomId) { this.rings.delete(roomId); }
+
+  get size() { return this.rings.size; }
+}
+
+// Last-Event-ID de una reconexión SSE (cabecera estándar o ?lastEventId= como respaldo)
+function lastEventIdOf(req) {
+  const raw = (req.get && req.get('Last-Event-ID')) || (req.query && req.query.lastEventId);
+  return (raw === undefined || raw === null || raw === '') ? null : String(raw);
+}
+
+module.exports = { RoomMessage, ReplayBuffer, sseFrame, lastEventIdOf };
@@ -0,0 +1,104 @@
+// Índices secundarios de salas (TicTacToe): jugador -> salas, host -> salas sin
+// terminar y salas públicas ordenadas por (createdAt, id) para el lobby.
+// sync(r) compara con lo indexado la última vez y solo aplica las diferencias;
+// los stores lo llaman en cada cambio de estado (mismo punto en que emiten).
+
+function cmp(a, b) {
+  if (a.createdAt !== b.createdAt) return a.createdAt < b.createdAt ? -1 : 1;
+  return a.id < b.id ? -1 : (a.id > b.id ? 1 : 0);
+}
+
+function lowerBound(list, key) {
+  let lo = 0; let hi = list.length;
+  while (lo < hi) {
+    const mid = (lo + hi) >>> 1;
+    if (cmp(list[mid], key) < 0) lo = mid + 1; else hi = mid;
+  }
+  return lo;
+}
+
+function decodeCursor(cursor) {
+  const m = /^(\d+)\.(.+)$/.exec(String(cursor));
+  return m ? { createdAt: Number(m[1]), id: m[2] } : null;
+}
+
+class RoomIndex {
+  constructor() {
+    this.rooms = new Map(); // roomId -> { createdAt, players: [uid], host: uid|null, pub: bool }
+    this.byPlayer = new Map(); // userId -> Set(roomId)
+    this.byHost = new Map(); // userId (X) -> Set(roomId) con status !== 'finished'
+    this.pub = []; // [{ createdAt, id }] asc
+  }
+
+  _add(map, k, id) { let s = map.get(k); if (!s) { s = new Set(); map.set(k, s); } s.add(id); }
+  _del(map, k, id) { const s = map.get(k); if (s) { s.delete(id); if (!s.size) map.delete(k); } }
+
+  _pubInsert(key) { this.pub.splice(lowerBound(this.pub, key), 0, key); }
+  _pubRemove(key) {
+    const i = lowerBound(this.pub, key);
+    if (this.pub[i] && this.pub[i].id === key.id) this.pub.splice(i, 1);
+  }
+
+  sync(r) {
+    if (!r || !r.id) return;
+    const id = r.id;
+    let rec = this.rooms.get(id);
+    if (!rec) { rec = { createdAt: Number(r.createdAt || 0), players: [], host: null, pub: false }; this.rooms.set(id, rec); }
+    const players = [r.players && r.players.X, r.players && r.players.O].filter(Boolean).map(String);
+    for (const p of rec.players) if (!players.includes(p)) this._del(this.byPlayer, p, id);
+    for (const p of players) if (!rec.players.includes(p)) this._add(this.byPlayer, p, id);
+    rec.players = players;
+    const host = (r.status !== 'finished' && r.players && r.players.X) ? String(r.players.X) : null;
+    if (host !== rec.host) {
+      if (rec.host) this._del(this.byHost, rec.host, id);
+      if (host) this._add(this.byHost, host, id);
+      rec.host = host;
+    }
+    const pub = r.visibility === 'public';
+    if (pub !== rec.pub) {
+      if (pub) this._pubInsert({ createdAt: rec.createdAt, id }); else this._pubRemove({ createdAt: rec.createdAt, id });
+      rec.pub = pub;
+    }
+  }
+
+  remove(id) {
+    const rec = this.rooms.get(id);
+    if (!rec) return;
+    for (const p of rec.players) this._del(this.byPlayer, p, id);
+    if (rec.host) this._del(this.byHost, rec.host, id);
+    if (rec.pub) this._pubRemove({ createdAt: rec.createdAt, id });
+    this.rooms.delete(id);
+  }
+
+  // Salas del usuario, más recientes primero
+  roomsOf(userId) {
+    const s = this.byPlayer.get(String(userId));
+    if (!s) return [];
+    return Array.from(s).sort((a, b) => (this.rooms.get(b).createdAt - this.rooms.get(a).createdAt) || (a < b ? 1 : -1));
+  }
+
+  openRoomOf(hostId) {
+    const s = this.byHost.get(String(hostId));
+    if (!s) return null;
+    for (const id of s) return id;
+    return null;
+  }
+
+  // Públicas, más recientes primero; cursor = 'createdAt.id' de la última vista
+  publicPage({ limit = 50, cursor = null } = {}) {
+    let pos = this.pub.length - 1;
+    if (cursor !== null && cursor !== undefined && cursor !== '') {
+      const key = decodeCursor(cursor);
+      if (!key) throw new Error('invalid_cursor');
+      pos = lowerBound(this.pub, key) - 1;
+    }
+    const ids = []; let last = null;
+    for (; pos >= 0 && ids.length < limit; pos--) { last = this.pub[pos]; ids.push(last.id); }
+    const nextCursor = (pos >= 0 && last) ? `${last.createdAt}.${last.id}` : null;
+    return { ids, nextCursor, total: this.pub.length };
+  }
+
+  publicIds() { return this.pub.map((e) => e.id).reverse(); }
+}
+
+module.exports = RoomIndex;
@@ -0,0 +1,74 @@
+const mem = require('./memoryStore');
+const archive = require('./roomArchive');
+
+// Ciclo de vida de las salas de un store en memoria (TicTacToe o Bingo).
+// sweep() desaloja las salas terminadas tras finishedTtlMs y las abandonadas
+// (sin cambios de estado) tras idleTtlMs: las archiva, libera su código y borra
+// la cuenta pot:* si quedó vacía. Las salas con un vencimiento pendiente en el
+// heap del store (partida de TicTacToe en curso) no se tocan: terminan solas.
+// Una sala abandonada sin terminar que retiene fondos se reembolsa primero
+// (store.refundRoom); mientras siga con fondos (pot en memoria, _dbPot, asiento
+// pagado o reembolso en curso) no se desaloja.
+// Contrato del store: rooms, potUserId(id), evictRoom(id) -> sala cruda|null,
+// archiveRecord(r) -> datos compactos para el archivo y, opcional, refundRoom(r).
+class RoomLifecycle {
+  constructor({ game, store, finishedTtlMs, idleTtlMs }) {
+    this.game = game;
+    this.store = store;
+    this.finishedTtlMs = Math.max(1000, Number(finishedTtlMs) || 600000);
+    this.idleTtlMs = Math.max(1000, Number(idleTtlMs) || 3600000);
+    this.stats = { sweeps: 0, archived: 0, evictedFinished: 0, evictedIdle: 0, potsDrained: 0, potsRetained: 0, refunds: 0, retainedFunded: 0, lastSweepAt: 0, lastSweepMs: 0 };
+  }
+
+  _reason(r, now) {
+    const last = Number(r.updatedAt || r.createdAt || 0);
+    if (r.status === 'finished') return (now - last >= this.finishedTtlMs) ? 'finished' : null;
+    if (this.store.timers && this.store.timers.has(r.id)) return null;
+    return (now - last >= this.idleTtlMs) ? 'idle' : null;
+  }
+
+  _funded(r) {
+    if (r._refunding) return true;
+    if (r.status !== 'finished' && r.paidFlags && (r.paidFlags.X || r.paidFlags.O)) return true;
+    if (r._dbPot && Number(r._dbPot.amount || 0) > 0) return true;
+    const pot = mem.getUser(this.store.potUserId(r.id));
+    return !!(pot && (Number(pot.fires || 0) > 0 || Number(pot.coins || 0) > 0));
+  }
+
+  sweep(now = Date.now()) {
+    const t0 = Date.now();
+    const due = [];
+    for (const r of this.store.rooms.values()) { const reason = this._reason(r, now); if (reason) due.push([r.id, reason]); }
+    for (const [id, reason] of due) {
+      const live = this.store.rooms.get(id);
+      if (!live) continue;
+      if (reason === 'idle' && typeof this.store.refundRoom === 'function' && this._funded(live)) {
+        try { if (this.store.refundRoom(live)) this.stats.refunds += 1; } catch(_) {}
+      }
+      if (this._funded(live)) { this.stats.retainedFunded += 1; continue; }
+      const r = this.store.evictRoom(id);
+      if (!r) continue;
+      if (reason === 'finished') this.stats.evictedFinished += 1; else this.stats.evictedIdle += 1;
+      try {
+        archive.record({ game: this.game, roomId: r.id, code: r.code, hostId: r.hostId || (r.players && r.players.X) || null, status: r.status, reason, createdAt: r.createdAt, updatedAt: r.updatedAt || r.createdAt, data: this.store.archiveRecord(r) });
+        this.stats.archived += 1;
+      } catch(_) {}
+      try {
+        const d = mem.dropEmptyAccount(this.store.potUserId(r.id));
+        if (d && d.removed) this.stats.potsDrained += 1; else if (d && d.error === 'not_empty') this.stats.potsRetained += 1;
+      } catch(_) {}
+    }
+    this.stats.sweeps += 1;
+    this.stats.lastSweepAt = Date.now();
+    this.stats.lastSweepMs = this.stats.lastSweepAt - t0;
+    return due.length;
+  }
+
+  getStats() {
+    const byStatus = {};
+    for (const r of this.store.rooms.values()) byStatus[r.status] = (byStatus[r.status] || 0) + 1;
+    return { game: this.game, live: this.store.rooms.size, byStatus, codes: this.store.codeIndex ? this.store.codeIndex.size : null, finishedTtlMs: this.finishedTtlMs, idleTtlMs: this.idleTtlMs, ...this.stats };
+  }
+}
+
+module.exports = RoomLifecycle;
@@ -0,0 +1,89 @@
+const EventEmitter = require('events');
+
+// Difusor único del dashboard de supply para todos los suscriptores SSE.
+// Un solo cálculo de getDashboardSnapshot por tick (no uno por conexión),
+// se omite el envío si el valor no cambió y las mutaciones de wallet/supply
+// llaman a notify() para empujar el nuevo valor sin esperar al sondeo.
+class SupplyHub extends EventEmitter {
+  constructor() {
+    super();
+    this.pollMs = Math.max(1000, parseInt(process.env.SUPPLY_STREAM_POLL_MS || '5000', 10) || 5000);
+    this.notifyDelayMs = Math.max(0, parseInt(process.env.SUPPLY_STREAM_NOTIFY_MS || '250', 10) || 0);
+    this.subs = new Set(); // fn(frame)
+    this.timer = null;
+    this.notifyTimer = null;
+    this.computing = null; // Promise en curso (coalesce ticks concurrentes)
+    this.last = null; // { value, ts, key, frame, checkedAt }
+    this.stats = { ticks: 0, computes: 0, sends: 0, skipped: 0, notifies: 0, errors: 0 };
+  }
+
+  _repo() { return require('../repos/supplyRepo'); }
+
+  _frame(value, ts) {
+    return `event: supply\ndata: ${JSON.stringify({ value, ts })}\n\n`;
+  }
+
+  async _compute() {
+    if (this.computing) return this.computing;
+    this.computing = (async () => {
+      this.stats.computes += 1;
+      const value = await this._repo().getDashboardSnapshot();
+      const key = JSON.stringify(value);
+      const ts = Date.now();
+      const changed = !this.last || this.last.key !== key;
+      if (changed) this.last = { value, ts, key, frame: this._frame(value, ts), checkedAt: ts };
+      else this.last.checkedAt = ts;
+      return changed;
+    })().finally(() => { this.computing = null; });
+    return this.computing;
+  }
+
+  async tick() {
+    this.stats.ticks += 1;
+    let changed = false;
+    try { changed = await this._compute(); } catch (_) { this.stats.errors += 1; return; }
+    if (!changed) { this.stats.skipped += 1; return; }
+    this._fanout();
+  }
+
+  _fanout() {
+    const frame = this.last.frame;
+    for (const fn of this.subs) { try { fn(frame); this.stats.sends += 1; } catch (_) {} }
+    try { this.emit('supply', { value: this.last.value, ts: this.last.ts }); } catch (_) {}
+  }
+
+  // Mutación conocida: recalcular pronto (agrupa ráfagas en una sola consulta)
+  notify() {
+    this.stats.notifies += 1;
+    if (!this.subs.size || this.notifyTimer) return;
+    this.notifyTimer = setTimeout(() => { this.notifyTimer = null; this.tick().catch(() => {}); }, this.notifyDelayMs);
+    try { this.notifyTimer.unref(); } catch (_) {}
+  }
+
+  // Devuelve la función para darse de baja; el primer frame se entrega de inmediato
+  async subscribe(fn) {
+    this.subs.add(fn);
+    if (!this.timer) {
+      this.timer = setInterval(() => { this.tick().catch(() => {}); }, this.pollMs);
+      try { this.timer.unref(); } catch (_) {}
+    }
+    try {
+      // Si el recálculo trae un valor nuevo, lo reciben todos (fn incluida), no solo fn
+      const stale = !this.last || (Date.now() - this.last.checkedAt) > this.pollMs;
+      if (stale && await this._compute()) { if (this.last) this._fanout(); }
+      else if (this.last && this.subs.has(fn)) fn(this.last.frame);
+    } catch (_) { this.stats.errors += 1; }
+    return () => this.unsubscribe(fn);
+  }
+
+  unsubscribe(fn) {
+    this.subs.delete(fn);
+    if (!this.subs.size && this.timer) { clearInterval(this.timer); this.timer = null; }
+  }
+
+  getStats() {
+    return { ...this.stats, subscribers: this.subs.size, pollMs: this.pollMs, lastTs: this.last ? this.last.ts : null };
+  }
+}
+
+module.exports = new SupplyHub();
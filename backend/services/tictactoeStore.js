@@ -1,5 +1,8 @@
 const EventEmitter = require('events');
 const mem = require('./memoryStore');
+const DeadlineHeap = require('./deadlineHeap');
+const RoomIndex = require('./roomIndex');
+const { RoomMessage, ReplayBuffer } = require('./roomFeed');
 let walletRepo = null; try { walletRepo = require('../repos/walletRepo'); } catch(_) { walletRepo = null; }
 let logger = null; try { logger = require('../config/logger'); } catch(_) { logger = console; }
 
@@ -9,6 +12,9 @@ class TTTStore extends EventEmitter {
     this.rooms = new Map();
     this.turnTimeoutMs = Math.max(1000, parseInt(process.env.TTT_TURN_TIMEOUT_MS || '10000', 10) || 10000);
     this.codeIndex = new Map(); // code -> roomId
+    this.timers = new DeadlineHeap(); // roomId -> próximo vencimiento (fin de pausa o timeout de turno)
+    this.index = new RoomIndex(); // jugador/host -> salas y públicas ordenadas
+    this.replay = new ReplayBuffer(Math.max(1, parseInt(process.env.SSE_REPLAY_SIZE || '32', 10) || 32)); // últimos mensajes por sala (reconexión SSE)
     this.dbWalletEnabled = String(process.env.TTT_DB_WALLET || 'false').toLowerCase() === 'true';
   }
   potUserId(id) {
@@ -21,8 +27,8 @@ class TTTStore extends EventEmitter {
     return String(Math.floor(100000 + Math.random() * 900000));
   }
   createRoom(hostId, opts = {}) {
-    const existing = (()=>{ const uid=String(hostId); for (const r of this.rooms.values()){ if (r && r.players && r.players.X === uid && r.status !== 'finished') return r; } return null; })();
-    if (existing) return this.getState(existing.id);
+    const openId = this.index.openRoomOf(hostId);
+    if (openId && this.rooms.has(openId)) return this.getState(openId);
     const id = this.newId();
     const state = {
       id,
@@ -49,6 +55,7 @@ class TTTStore extends EventEmitter {
     };
     this.rooms.set(id, state);
     this.codeIndex.set(state.code, id);
+    this.index.sync(state);
     return this.getState(id);
   }
   getState(roomId) {
@@ -66,6 +73,7 @@ class TTTStore extends EventEmitter {
     const display = (uid)=>{ if(!uid) return null; const u = mem.getUser(uid); const n = u && u.userName ? String(u.userName).trim() : ''; return n || maskId(uid); };
     return {
       id: r.id,
+      v: r.v || 0,
       createdAt: r.createdAt,
       players: { X: r.players.X, O: r.players.O },
       board: [...r.board],
@@ -92,13 +100,7 @@ class TTTStore extends EventEmitter {
     };
   }
   listRoomsByUser(userId) {
-    const uid = String(userId);
-    const out = [];
-    for (const r of this.rooms.values()) {
-      if (r.players.X === uid || r.players.O === uid) out.push(this.getState(r.id));
-    }
-    out.sort((a,b)=> (b.createdAt||0)-(a.createdAt||0));
-    return out;
+    return this.index.roomsOf(userId).map(id => this.getState(id)).filter(Boolean);
   }
   findByCode(code) {
     const id = this.codeIndex.get(String(code));
@@ -106,12 +108,13 @@ class TTTStore extends EventEmitter {
     return this.getState(id);
   }
   listPublicRooms() {
-    const out = [];
-    for (const r of this.rooms.values()) {
-      if (r.visibility === 'public') out.push(this.getState(r.id));
-    }
-    out.sort((a,b)=> (b.createdAt||0)-(a.createdAt||0));
-    return out;
+    return this.index.publicIds().map(id => this.getState(id)).filter(Boolean);
+  }
+  // Lobby paginado: más recientes primero; getState solo para la página
+  pagePublicRooms({ limit = 50, cursor = null } = {}) {
+    const l = Math.max(1, Math.min(100, Number(limit) || 50));
+    const { ids, nextCursor, total } = this.index.publicPage({ limit: l, cursor });
+    return { rooms: ids.map(id => this.getState(id)).filter(Boolean), nextCursor, total };
   }
   async chargeAndMaybeStart(r) {
     if (!r) return false;
@@ -264,44 +267,44 @@ class TTTStore extends EventEmitter {
     const potCoins = Math.max(0, Number(pot.coins||0));
     const potFires = Math.max(0, Number(pot.fires||0));
     try {
+      // Un asiento por moneda: todas las patas del pot se aplican juntas o ninguna
+      const useDb = !!(this.dbWalletEnabled && r._dbPot && r._dbPot.type && walletRepo && typeof walletRepo.postLedgerByExt === 'function');
+      const meta = { roomId: r.id, round: r.round };
       if (r.winner) {
         const winId = r.winner === 'X' ? r.players.X : r.players.O;
         // Si DB está habilitado, usar el pot DB. Si no, usar memoria
-        if (this.dbWalletEnabled && r._dbPot && r._dbPot.type && walletRepo) {
+        if (useDb) {
           const amt = Math.max(0, Number(r._dbPot.amount||0))*2; // *2 porque ambos jugadores pagaron
-          if (r._dbPot.type === 'fuego' && typeof walletRepo.creditFiresByExt === 'function') {
-            walletRepo.creditFiresByExt(winId, amt, { type:'ttt_wager_win', reference: r.id, meta: { roomId: r.id, round: r.round } });
-          } else if (r._dbPot.type === 'coins' && typeof walletRepo.creditCoinsByExt === 'function') {
-            walletRepo.creditCoinsByExt(winId, amt, { type:'ttt_wager_win', reference: r.id, meta: { roomId: r.id, round: r.round } });
-          }
+          walletRepo.postLedgerByExt({ currency: r._dbPot.type === 'fuego' ? 'fires' : 'coins', reference: r.id, meta, legs: [
+            { userExt: winId, amount: amt, type: 'ttt_wager_win' }
+          ] }).catch(()=>{});
         } else {
           // Modo memoria: transferir desde pot
-          if (potCoins > 0) mem.transferCoins({ fromUserId: potId, toUserId: winId, amount: potCoins, reason: 'ttt_wager_win' });
-          if (potFires > 0) mem.transferFires({ fromUserId: potId, toUserId: winId, amount: potFires, reason: 'ttt_wager_win' });
+          mem.postLedgerBatch([
+            { currency: 'coins', reason: 'ttt_wager_win', ref: r.id, legs: [{ fromUserId: potId, toUserId: winId, amount: potCoins }] },
+            { currency: 'fires', reason: 'ttt_wager_win', ref: r.id, legs: [{ fromUserId: potId, toUserId: winId, amount: potFires }] }
+          ].filter(p => p.legs[0].amount > 0));
         }
       } else {
         // Empate: dividir entre ambos
-        if (this.dbWalletEnabled && r._dbPot && r._dbPot.type && walletRepo) {
+        if (useDb) {
           const amt = Math.max(0, Number(r._dbPot.amount||0)); // Cada uno recupera lo que apostó
-          if (r._dbPot.type === 'fuego' && typeof walletRepo.creditFiresByExt === 'function') {
-            if (r.players.X) walletRepo.creditFiresByExt(r.players.X, amt, { type:'ttt_wager_draw', reference: r.id, meta: { roomId: r.id, round: r.round } });
-            if (r.players.O) walletRepo.creditFiresByExt(r.players.O, amt, { type:'ttt_wager_draw', reference: r.id, meta: { roomId: r.id, round: r.round } });
-          } else if (r._dbPot.type === 'coins' && typeof walletRepo.creditCoinsByExt === 'function') {
-            if (r.players.X) walletRepo.creditCoinsByExt(r.players.X, amt, { type:'ttt_wager_draw', reference: r.id, meta: { roomId: r.id, round: r.round } });
-            if (r.players.O) walletRepo.creditCoinsByExt(r.players.O, amt, { type:'ttt_wager_draw', reference: r.id, meta: { roomId: r.id, round: r.round } });
-          }
+          walletRepo.postLedgerByExt({ currency: r._dbPot.type === 'fuego' ? 'fires' : 'coins', reference: r.id, meta, legs: [
+            { userExt: r.players.X, amount: r.players.X ? amt : 0, type: 'ttt_wager_draw' },
+            { userExt: r.players.O, amount: r.players.O ? amt : 0, type: 'ttt_wager_draw' }
+          ] }).catch(()=>{});
         } else {
           // Modo memoria: dividir pot
           const halfC = Math.floor(potCoins / 2);
           const halfF = Math.floor(potFires / 2);
-          if (potCoins > 0) {
-            if (r.players.X) mem.transferCoins({ fromUserId: potId, toUserId: r.players.X, amount: halfC, reason: 'ttt_wager_draw' });
-            if (r.players.O) mem.transferCoins({ fromUserId: potId, toUserId: r.players.O, amount: potCoins - halfC, reason: 'ttt_wager_draw' });
-          }
-          if (potFires > 0) {
-            if (r.players.X) mem.transferFires({ fromUserId: potId, toUserId: r.players.X, amount: halfF, reason: 'ttt_wager_draw' });
-            if (r.players.O) mem.transferFires({ fromUserId: potId, toUserId: r.players.O, amount: potFires - halfF, reason: 'ttt_wager_draw' });
-          }
+          const split = (currency, total, half) => ({ currency, reason: 'ttt_wager_draw', ref: r.id, legs: [
+            { fromUserId: potId, toUserId: r.players.X, amount: r.players.X ? half : 0 },
+            { fromUserId: potId, toUserId: r.players.O, amount: r.players.O ? total - half : 0 }
+          ] });
+          mem.postLedgerBatch([
+            potCoins > 0 ? split('coins', potCoins, halfC) : null,
+            potFires > 0 ? split('fires', potFires, halfF) : null
+          ].filter(Boolean));
         }
       }
     } catch (_) {}
@@ -329,17 +332,64 @@ class TTTStore extends EventEmitter {
     }
     // no auto-start; el host debe iniciar manualmente
     const s = this.getState(roomId);
-    this.emit('room_update_' + r.id, s);
+    this._publish(r, s);
     return s;
   }
   closeRoom(roomId){
     const id = String(roomId);
     const r = this.rooms.get(id);
     if (!r) return false;
-    try { if (r && r.code) this.codeIndex.delete(r.code); } catch(_){ }
+    try { if (r && r.code && this.codeIndex.get(r.code) === id) this.codeIndex.delete(r.code); } catch(_){ }
     this.rooms.delete(id);
+    this.timers.cancel(id);
+    this.index.remove(id);
+    this.replay.drop(id);
+    return true;
+  }
+  // Reembolso previo al desalojo de una sala sin terminar (roomLifecycle): cada
+  // asiento pagado recupera su apuesta. Memoria: un asiento desde el pot. DB: asiento
+  // asíncrono sobre el pot DB; r._refunding mientras tanto (el GC la reintenta después)
+  refundRoom(r) {
+    if (!r || r.status === 'finished' || !r.paidFlags || r._refunding) return false;
+    const seats = ['X', 'O'].filter(k => r.paidFlags[k] && r.players[k]);
+    if (!seats.length) return false;
+    const cv = Math.max(1, Number(r.costValue||1) || 1);
+    const useDb = !!(this.dbWalletEnabled && r._dbPot && r._dbPot.type && walletRepo && typeof walletRepo.postLedgerByExt === 'function');
+    if (useDb) {
+      r._refunding = true;
+      walletRepo.postLedgerByExt({ currency: r._dbPot.type === 'fuego' ? 'fires' : 'coins', reference: r.id, meta: { roomId: r.id, round: r.round },
+        legs: seats.map(k => ({ userExt: r.players[k], amount: cv, type: 'ttt_wager_refund' })) })
+        .then((out) => { if (out && out.ok) { r.paidFlags = { X:false, O:false }; r._dbPot = { type:null, amount:0 }; } })
+        .catch(() => {})
+        .finally(() => { r._refunding = false; });
+      return true;
+    }
+    const potId = this.potUserId(r.id);
+    const out = mem.postLedger({ currency: String(r.costType||'coins') === 'fuego' ? 'fires' : 'coins', reason: 'ttt_wager_refund', ref: r.id,
+      legs: seats.map(k => ({ fromUserId: potId, toUserId: r.players[k], amount: cv })) });
+    if (!out || !out.ok) return false;
+    r.paidFlags = { X:false, O:false };
     return true;
   }
+  // Desalojo por el GC de salas (roomLifecycle): devuelve la sala cruda para archivarla
+  evictRoom(roomId) {
+    const r = this.rooms.get(String(roomId));
+    if (!r) return null;
+    this.closeRoom(r.id);
+    return r;
+  }
+  archiveRecord(r) {
+    return {
+      players: { X: r.players.X || null, O: r.players.O || null },
+      visibility: r.visibility,
+      costType: r.costType,
+      costValue: r.costValue,
+      round: r.round,
+      score: { ...r.score },
+      winner: r.winner || null,
+      board: r.board.slice()
+    };
+  }
   setOptions(roomId, opts = {}) {
     const r = this.rooms.get(String(roomId));
     if (!r) throw new Error('room_not_found');
@@ -357,7 +407,7 @@ class TTTStore extends EventEmitter {
     r.ready.O = false;
     r.paidFlags = { X:false, O:false };
     const s = this.getState(roomId);
-    this.emit('room_update_' + r.id, s);
+    this._publish(r, s);
     return s;
   }
   who(room, userId) {
@@ -390,13 +440,13 @@ class TTTStore extends EventEmitter {
         if (winner === 'X') r.score.X += 1; else if (winner === 'O') r.score.O += 1;
         this.settlePot(r);
         const s = this.getState(r.id);
-        this.emit('room_update_' + r.id, s);
+        this._publish(r, s);
         return { state: s, closed: false };
       }
       r.pausedBy = seat;
       r.pauseUntil = Date.now() + budget;
       const s = this.getState(roomId);
-      this.emit('room_update_' + r.id, s);
+      this._publish(r, s);
       return { state: s, closed: false };
     }
     if (r.status === 'waiting'){
@@ -408,13 +458,13 @@ class TTTStore extends EventEmitter {
           r.players.X = r.players.O;
           r.players.O = null;
           const s = this.getState(roomId);
-          this.emit('room_update_' + r.id, s);
+          this._publish(r, s);
           return { state: s, closed: false };
         }
       } else {
         r.players.O = null;
         const s = this.getState(roomId);
-        this.emit('room_update_' + r.id, s);
+        this._publish(r, s);
         return { state: s, closed: false };
       }
     }
@@ -426,11 +476,11 @@ class TTTStore extends EventEmitter {
         return { state: null, closed: ok };
       }
       const s = this.getState(roomId);
-      this.emit('room_update_' + r.id, s);
+      this._publish(r, s);
       return { state: s, closed: false };
     }
     const s = this.getState(roomId);
-    this.emit('room_update_' + r.id, s);
+    this._publish(r, s);
     return { state: s, closed: false };
   }
   checkWinner(b) {
@@ -503,7 +553,8 @@ class TTTStore extends EventEmitter {
       r.turnDeadline = r.lastMoveAt + this.turnTimeoutMs;
     }
     const s = this.getState(roomId);
-    this.emit('room_update_' + r.id, s);
+    // Jugada sin final de partida: los streams reciben solo el delta
+    this._publish(r, s, w ? null : { cell: i, mark: me, turn: r.turn, deadline: r.turnDeadline, lastMoveAt: r.lastMoveAt });
     return s;
   }
   rematch(roomId, userId) {
@@ -528,7 +579,7 @@ class TTTStore extends EventEmitter {
       r.ready = { X:false, O:false };
     }
     const s = this.getState(roomId);
-    this.emit('room_update_' + r.id, s);
+    this._publish(r, s);
     return s;
   }
   setReady(roomId, userId, ready){
@@ -539,7 +590,7 @@ class TTTStore extends EventEmitter {
     if (!r.ready) r.ready = { X:false, O:false };
     r.ready[seat] = !!ready;
     const s = this.getState(roomId);
-    this.emit('room_update_' + r.id, s);
+    this._publish(r, s);
     return s;
   }
   async startGame(roomId, userId){
@@ -552,70 +603,100 @@ class TTTStore extends EventEmitter {
     r.paidFlags = { X:false, O:false };
     const ok = await this.chargeAndMaybeStart(r);
     const s = this.getState(roomId);
-    this.emit('room_update_' + r.id, s);
+    this._publish(r, s);
     if (!ok) throw new Error('payment_failed');
     r.ready = { X:false, O:false };
     return s;
   }
+  // Publica un cambio de estado: nueva versión, índices y un único mensaje para los streams
+  _publish(r, s, patch = null) {
+    r.v = (r.v || 0) + 1;
+    if (s) s.v = r.v;
+    this._reindex(r);
+    const msg = new RoomMessage(r.v, s, patch);
+    if (this.rooms.has(r.id)) this.replay.push(r.id, msg);
+    this.emit('room_update_' + r.id, s, msg);
+  }
+  // Tras un cambio de estado: marca de actividad (GC), índices secundarios y próximo vencimiento
+  _reindex(r) {
+    if (!r) return;
+    r.updatedAt = Date.now();
+    if (this.rooms.has(r.id)) this.index.sync(r);
+    this._schedule(r);
+  }
+  // Próximo vencimiento de la sala: fin de pausa o timeout de turno (solo en juego)
+  _schedule(r) {
+    if (!r) return;
+    if (r.status !== 'playing' || !this.rooms.has(r.id)) { this.timers.cancel(r.id); return; }
+    if (r.pauseUntil) this.timers.schedule(r.id, Number(r.pauseUntil));
+    else if (r.turnDeadline) this.timers.schedule(r.id, Number(r.turnDeadline) + 1);
+    else this.timers.cancel(r.id);
+  }
+  // Solo visita las salas cuyo vencimiento ya llegó (O(k log n) por tick)
   tick() {
     const now = Date.now();
-    for (const r of this.rooms.values()) {
+    for (const id of this.timers.popDue(now)) {
+      const r = this.rooms.get(id);
       if (!r || r.status !== 'playing') continue;
-      // si hay pausa activa, resolver o esperar
-      if (r.pauseUntil && now >= r.pauseUntil) {
-        // derrota del que salió
-        const loser = r.pausedBy === 'X' ? 'X' : 'O';
-        const winner = loser === 'X' ? 'O' : 'X';
-        r.status = 'finished';
-        r.winner = winner;
-        r.lastWinner = winner;
-        r.turnDeadline = null;
-        r.rematchVotes = { X:false, O:false };
-        if (winner === 'X') r.score.X += 1; else if (winner === 'O') r.score.O += 1;
-        r.pausedBy = null; r.pauseUntil = null;
-        try {
-          const xid = r.players.X; const oid = r.players.O;
-          if (xid && oid) {
-            if (winner === 'X') { mem.recordGameResult({ userId: xid, game: 'tictactoe', result: 'win' }); mem.recordGameResult({ userId: oid, game: 'tictactoe', result: 'loss' }); }
-            else { mem.recordGameResult({ userId: oid, game: 'tictactoe', result: 'win' }); mem.recordGameResult({ userId: xid, game: 'tictactoe', result: 'loss' }); }
-          }
-        } catch(_) {}
-        this.settlePot(r);
-        const s = this.getState(r.id);
-        this.emit('room_update_' + r.id, s);
-        continue;
-      }
-      if (r.pauseUntil && now < r.pauseUntil) {
-        // en pausa: no aplicar timeout de turno
-        continue;
-      }
-      if (r.turnDeadline && now > r.turnDeadline) {
-        const loser = r.turn;
-        const winner = loser === 'X' ? 'O' : 'X';
-        r.status = 'finished';
-        r.winner = winner;
-        r.lastWinner = winner;
-        r.turnDeadline = null;
-        r.rematchVotes = { X: false, O: false };
-        if (winner === 'X') r.score.X += 1; else if (winner === 'O') r.score.O += 1;
-        try {
-          const xid = r.players.X;
-          const oid = r.players.O;
-          if (xid && oid) {
-            if (winner === 'X') {
-              mem.recordGameResult({ userId: xid, game: 'tictactoe', result: 'win' });
-              mem.recordGameResult({ userId: oid, game: 'tictactoe', result: 'loss' });
-            } else if (winner === 'O') {
-              mem.recordGameResult({ userId: oid, game: 'tictactoe', result: 'win' });
-              mem.recordGameResult({ userId: xid, game: 'tictactoe', result: 'loss' });
-            }
+      this._expireRoom(r, now);
+      this._schedule(r);
+    }
+  }
+  _expireRoom(r, now) {
+    // si hay pausa activa, resolver o esperar
+    if (r.pauseUntil && now >= r.pauseUntil) {
+      // derrota del que salió
+      const loser = r.pausedBy === 'X' ? 'X' : 'O';
+      const winner = loser === 'X' ? 'O' : 'X';
+      r.status = 'finished';
+      r.winner = winner;
+      r.lastWinner = winner;
+      r.turnDeadline = null;
+      r.rematchVotes = { X:false, O:false };
+      if (winner === 'X') r.score.X += 1; else if (winner === 'O') r.score.O += 1;
+      r.pausedBy = null; r.pauseUntil = null;
+      try {
+        const xid = r.players.X; const oid = r.players.O;
+        if (xid && oid) {
+          if (winner === 'X') { mem.recordGameResult({ userId: xid, game: 'tictactoe', result: 'win' }); mem.recordGameResult({ userId: oid, game: 'tictactoe', result: 'loss' }); }
+          else { mem.recordGameResult({ userId: oid, game: 'tictactoe', result: 'win' }); mem.recordGameResult({ userId: xid, game: 'tictactoe', result: 'loss' }); }
+        }
+      } catch(_) {}
+      this.settlePot(r);
+      const s = this.getState(r.id);
+      this._publish(r, s);
+      return;
+    }
+    if (r.pauseUntil && now < r.pauseUntil) {
+      // en pausa: no aplicar timeout de turno
+      return;
+    }
+    if (r.turnDeadline && now > r.turnDeadline) {
+      const loser = r.turn;
+      const winner = loser === 'X' ? 'O' : 'X';
+      r.status = 'finished';
+      r.winner = winner;
+      r.lastWinner = winner;
+      r.turnDeadline = null;
+      r.rematchVotes = { X: false, O: false };
+      if (winner === 'X') r.score.X += 1; else if (winner === 'O') r.score.O += 1;
+      try {
+        const xid = r.players.X;
+        const oid = r.players.O;
+        if (xid && oid) {
+          if (winner === 'X') {
+            mem.recordGameResult({ userId: xid, game: 'tictactoe', result: 'win' });
+            mem.recordGameResult({ userId: oid, game: 'tictactoe', result: 'loss' });
+          } else if (winner === 'O') {
+            mem.recordGameResult({ userId: oid, game: 'tictactoe', result: 'win' });
+            mem.recordGameResult({ userId: xid, game: 'tictactoe', result: 'loss' });
           }
-        } catch(_) {}
-        // liquidar pot
-        this.settlePot(r);
-        const s = this.getState(r.id);
-        this.emit('room_update_' + r.id, s);
-      }
+        }
+      } catch(_) {}
+      // liquidar pot
+      this.settlePot(r);
+      const s = this.getState(r.id);
+      this._publish(r, s);
     }
   }
   onRoom(roomId, fn) {
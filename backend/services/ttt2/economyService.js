@@ -70,6 +70,19 @@ class EconomyService {
       return r && r.ok ? { ok:true } : { ok:false, error: (r && r.error)||'mem_credit_error' };
     }
   }
+
+  // Reparto del pot en un solo asiento: legs [{ userId, amount, type }]
+  async payout({ legs, reference, asset }){
+    const assetKind = String(asset||'coins');
+    const currency = assetKind==='coins' ? 'coins' : 'fires';
+    if (this.isDb() && walletRepo){
+      return await withTimeout(walletRepo.postLedgerByExt({ currency, reference, meta:{ asset: assetKind==='coins' ? 'coins' : 'fuego' }, legs: legs.map(l => ({ userExt: l.userId, amount: l.amount, type: l.type||'ttt_credit' })) }), 2500, { ok:false, error:'db_timeout' });
+    }
+    // memoria
+    const potId = await this.getPotId(reference);
+    const r = mem.postLedger({ currency, reason: 'ttt_payout', ref: reference, legs: legs.map(l => ({ fromUserId: potId, toUserId: l.userId, amount: l.amount, reason: l.type||'ttt_payout' })) });
+    return r && r.ok ? { ok:true } : { ok:false, error: (r && r.error)||'mem_credit_error' };
+  }
 }
 
 module.exports = new EconomyService();
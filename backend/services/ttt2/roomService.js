@@ -4,6 +4,9 @@ const EventEmitter = require('events');
 const mem = require('../memoryStore');
 const engine = require('./engine');
 const economy = require('./economyService');
+const DeadlineHeap = require('../deadlineHeap');
+const RoomIndex = require('../roomIndex');
+const { RoomMessage, ReplayBuffer } = require('../roomFeed');
 let logger = null; try { logger = require('../../config/logger'); } catch(_) { logger = console; }
 
 function potUserId(roomId){ return `ttt:pot:${String(roomId)}`; }
@@ -13,6 +16,9 @@ class RoomService extends EventEmitter {
     super();
     this.rooms = new Map();
     this.turnTimeoutMs = Math.max(1000, parseInt(process.env.TTT_TURN_TIMEOUT_MS || '10000', 10) || 10000);
+    this.timers = new DeadlineHeap(); // roomId -> próximo vencimiento (fin de pausa o timeout de turno)
+    this.index = new RoomIndex(); // jugador/host -> salas y públicas ordenadas
+    this.replay = new ReplayBuffer(Math.max(1, parseInt(process.env.SSE_REPLAY_SIZE || '32', 10) || 32)); // últimos mensajes por sala (reconexión SSE)
   }
   newId(){ return 'tt2_' + Math.random().toString(36).slice(2, 8) + Date.now().toString(36).slice(-3); }
   makeCode(){ return String(Math.floor(100000 + Math.random()*900000)); }
@@ -26,6 +32,7 @@ class RoomService extends EventEmitter {
     const display = (uid)=>{ if(!uid) return null; const u = mem.getUser(uid); const n = u && u.userName ? String(u.userName).trim() : ''; if (n) return n; const raw = String(uid||''); let seed=0; for(let i=0;i<raw.length;i++){ seed=((seed<<5)-seed)+raw.charCodeAt(i); seed|=0; } const tag=Math.abs(seed).toString(36).slice(-6).toUpperCase().padStart(6,'0'); return 'User '+tag; };
     return {
       id: r.id,
+      v: r.v || 0,
       createdAt: r.createdAt,
       players: { X: r.players.X, O: r.players.O },
       board: [...r.board],
@@ -54,8 +61,8 @@ class RoomService extends EventEmitter {
   onRoom(roomId, fn){ const ev='room_update_'+String(roomId); this.on(ev, fn); return ()=> this.off(ev, fn); }
 
   createRoom(hostId, opts={}){
-    const existing = (()=>{ const uid=String(hostId); for (const r of this.rooms.values()){ if (r && r.players && r.players.X===uid && r.status!=='finished') return r; } return null; })();
-    if (existing) return this.getState(existing.id);
+    const openId = this.index.openRoomOf(hostId);
+    if (openId && this.rooms.has(openId)) return this.getState(openId);
     const id = this.newId();
     const r = {
       id,
@@ -82,11 +89,18 @@ class RoomService extends EventEmitter {
     this.rooms.set(id, r);
     this.codeIndex = this.codeIndex || new Map();
     this.codeIndex.set(r.code, id);
+    this.index.sync(r);
     return this.getState(id);
   }
 
-  listPublicRooms(){ const out=[]; for (const r of this.rooms.values()){ if (r.visibility==='public') out.push(this.getState(r.id)); } out.sort((a,b)=> (b.createdAt||0)-(a.createdAt||0)); return out; }
-  listRoomsByUser(userId){ const uid=String(userId); const out=[]; for (const r of this.rooms.values()){ if (r.players.X===uid || r.players.O===uid) out.push(this.getState(r.id)); } out.sort((a,b)=> (b.createdAt||0)-(a.createdAt||0)); return out; }
+  listPublicRooms(){ return this.index.publicIds().map(id => this.getState(id)).filter(Boolean); }
+  // Lobby paginado: más recientes primero; getState solo para la página
+  pagePublicRooms({ limit = 50, cursor = null } = {}){
+    const l = Math.max(1, Math.min(100, Number(limit) || 50));
+    const { ids, nextCursor, total } = this.index.publicPage({ limit: l, cursor });
+    return { rooms: ids.map(id => this.getState(id)).filter(Boolean), nextCursor, total };
+  }
+  listRoomsByUser(userId){ return this.index.roomsOf(userId).map(id => this.getState(id)).filter(Boolean); }
   findByCode(code){ const id = this.codeIndex && this.codeIndex.get(String(code)); return id ? this.getState(id) : null; }
 
   who(r, userId){ const uid=String(userId); if (r.players.X===uid) return 'X'; if (r.players.O===uid) return 'O'; return null; }
@@ -99,7 +113,7 @@ class RoomService extends EventEmitter {
     // reset ready y pagos al cambiar modo
     r.ready = r.ready || { X:false, O:false }; r.ready.O = false;
     r.paidFlags = { X:false, O:false };
-    const s = this.getState(roomId); this.emit('room_update_'+r.id, s); return s;
+    const s = this.getState(roomId); this._publish(r, s); return s;
   }
 
   joinRoom(roomId, userId){
@@ -115,7 +129,7 @@ class RoomService extends EventEmitter {
       r.pauseUntil = null; r.pausedBy = null;
       if (r.status === 'playing') { r.lastMoveAt = Date.now(); r.turnDeadline = r.lastMoveAt + this.turnTimeoutMs; }
     }
-    const s = this.getState(roomId); this.emit('room_update_'+r.id, s); return s;
+    const s = this.getState(roomId); this._publish(r, s); return s;
   }
 
   async startGame(roomId, userId){
@@ -153,19 +167,17 @@ class RoomService extends EventEmitter {
     r.lastMoveAt = Date.now();
     r.turnDeadline = r.lastMoveAt + this.turnTimeoutMs;
     r.rematchVotes = { X:false, O:false };
-    const s = this.getState(roomId); this.emit('room_update_'+r.id, s); return s;
+    const s = this.getState(roomId); this._publish(r, s); return s;
   }
 
   async settlePot(r){
     const ct = String(r.costType||'coins'); const cv = Math.max(1, Number(r.costValue||1)||1);
     const winnerId = r.winner ? (r.winner==='X' ? r.players.X : r.players.O) : null;
-    if (winnerId){
-      const amt = cv*2; await economy.credit({ userId: winnerId, amount: amt, type:'ttt_wager_win', reference: r.id, asset: ct });
-    } else {
+    const legs = winnerId
+      ? [{ userId: winnerId, amount: cv*2, type:'ttt_wager_win' }]
       // empate: reembolsar
-      if (r.players.X) await economy.credit({ userId: r.players.X, amount: cv, type:'ttt_wager_draw', reference: r.id, asset: ct });
-      if (r.players.O) await economy.credit({ userId: r.players.O, amount: cv, type:'ttt_wager_draw', reference: r.id, asset: ct });
-    }
+      : [r.players.X, r.players.O].filter(Boolean).map(uid => ({ userId: uid, amount: cv, type:'ttt_wager_draw' }));
+    if (legs.length) await economy.payout({ legs, reference: r.id, asset: ct });
   }
 
   move({ roomId, userId, index }){
@@ -192,7 +204,8 @@ class RoomService extends EventEmitter {
     } else {
       r.turn = r.turn==='X' ? 'O':'X'; r.turnDeadline = r.lastMoveAt + this.turnTimeoutMs;
     }
-    const s = this.getState(roomId); this.emit('room_update_'+r.id, s); return s;
+    // Jugada sin final de partida: los streams reciben solo el delta
+    const s = this.getState(roomId); this._publish(r, s, w ? null : { cell:i, mark:me, turn:r.turn, deadline:r.turnDeadline, lastMoveAt:r.lastMoveAt }); return s;
   }
 
   rematch(roomId, userId){
@@ -203,7 +216,7 @@ class RoomService extends EventEmitter {
     if (r.rematchVotes.X && r.rematchVotes.O){
       r.round += 1; r.board = Array(9).fill(null); r.winner=null; r.lastMoveAt=null; r.turnDeadline=null; r.status='waiting'; r.turn = (r.turn==='X')? 'O':'X'; r.paidFlags={ X:false, O:false }; r.rematchVotes={ X:false, O:false }; r.ready={ X:false, O:false };
     }
-    const s = this.getState(roomId); this.emit('room_update_'+r.id, s); return s;
+    const s = this.getState(roomId); this._publish(r, s); return s;
   }
 
   leaveRoom(roomId, userId){
@@ -216,46 +229,104 @@ class RoomService extends EventEmitter {
       if (budget <= 0){
         const loser = seat; const winner = loser==='X' ? 'O' : 'X'; r.status='finished'; r.winner=winner; r.lastWinner=winner; r.turnDeadline=null; r.rematchVotes={ X:false, O:false };
         if (winner==='X') r.score.X+=1; else r.score.O+=1; this.settlePot(r).catch(()=>{});
-        const s = this.getState(r.id); this.emit('room_update_'+r.id, s); return { state: s, closed:false };
+        const s = this.getState(r.id); this._publish(r, s); return { state: s, closed:false };
       }
-      r.pausedBy = seat; r.pauseUntil = Date.now() + budget; const s = this.getState(roomId); this.emit('room_update_'+r.id, s); return { state:s, closed:false };
+      r.pausedBy = seat; r.pauseUntil = Date.now() + budget; const s = this.getState(roomId); this._publish(r, s); return { state:s, closed:false };
     }
     if (r.status === 'waiting'){
       if (seat === 'X'){
-        if (!r.players.O){ this.rooms.delete(String(roomId)); return { state:null, closed:true }; }
-        else { r.players.X = r.players.O; r.players.O = null; const s=this.getState(roomId); this.emit('room_update_'+r.id, s); return { state:s, closed:false }; }
-      } else { r.players.O = null; const s=this.getState(roomId); this.emit('room_update_'+r.id, s); return { state:s, closed:false }; }
+        if (!r.players.O){ this._drop(r); return { state:null, closed:true }; }
+        else { r.players.X = r.players.O; r.players.O = null; const s=this.getState(roomId); this._publish(r, s); return { state:s, closed:false }; }
+      } else { r.players.O = null; const s=this.getState(roomId); this._publish(r, s); return { state:s, closed:false }; }
     }
     if (r.status === 'finished'){
-      if (seat === 'X') r.players.X=null; if (seat==='O') r.players.O=null; if (!r.players.X && !r.players.O){ this.rooms.delete(String(roomId)); return { state:null, closed:true }; }
-      const s=this.getState(roomId); this.emit('room_update_'+r.id, s); return { state:s, closed:false };
+      if (seat === 'X') r.players.X=null; if (seat==='O') r.players.O=null; if (!r.players.X && !r.players.O){ this._drop(r); return { state:null, closed:true }; }
+      const s=this.getState(roomId); this._publish(r, s); return { state:s, closed:false };
     }
-    const s=this.getState(roomId); this.emit('room_update_'+r.id, s); return { state:s, closed:false };
+    const s=this.getState(roomId); this._publish(r, s); return { state:s, closed:false };
+  }
+
+  // Saca la sala del store: código (si sigue siendo suyo), vencimiento e índices
+  _drop(r){
+    this.rooms.delete(r.id);
+    if (r.code && this.codeIndex && this.codeIndex.get(r.code) === r.id) this.codeIndex.delete(r.code);
+    this.timers.cancel(r.id); this.index.remove(r.id); this.replay.drop(r.id);
+  }
+
+  // Desalojo por el GC de salas (roomLifecycle): devuelve la sala cruda para archivarla
+  potUserId(roomId){ return potUserId(roomId); }
+  // Reembolso previo al desalojo de una sala sin terminar (roomLifecycle): cada asiento pagado
+  // recupera su apuesta en un solo asiento; asíncrono, r._refunding mientras tanto
+  refundRoom(r){
+    if (!r || r.status==='finished' || !r.paidFlags || r._refunding) return false;
+    const seats = ['X','O'].filter(k => r.paidFlags[k] && r.players[k]); if (!seats.length) return false;
+    const ct = String(r.costType||'coins'); const cv = Math.max(1, Number(r.costValue||1)||1);
+    r._refunding = true;
+    economy.payout({ legs: seats.map(k => ({ userId: r.players[k], amount: cv, type:'ttt_wager_refund' })), reference: r.id, asset: ct })
+      .then((out) => { if (out && out.ok) r.paidFlags = { X:false, O:false }; })
+      .catch(() => {})
+      .finally(() => { r._refunding = false; });
+    return true;
+  }
+  evictRoom(roomId){ const r = this.rooms.get(String(roomId)); if (!r) return null; this._drop(r); return r; }
+  archiveRecord(r){ return { players:{ X:r.players.X||null, O:r.players.O||null }, visibility:r.visibility, costType:r.costType, costValue:r.costValue, round:r.round, score:{ ...r.score }, winner:r.winner||null, board:r.board.slice() }; }
+
+  // Publica un cambio de estado: nueva versión, índices y un único mensaje para los streams
+  _publish(r, s, patch=null){
+    r.v = (r.v||0) + 1; if (s) s.v = r.v;
+    this._reindex(r);
+    const msg = new RoomMessage(r.v, s, patch);
+    if (this.rooms.has(r.id)) this.replay.push(r.id, msg);
+    this.emit('room_update_'+r.id, s, msg);
   }
 
+  // Tras un cambio de estado: marca de actividad (GC), índices secundarios y próximo vencimiento
+  _reindex(r){
+    if (!r) return;
+    r.updatedAt = Date.now();
+    if (this.rooms.has(r.id)) this.index.sync(r);
+    this._schedule(r);
+  }
+
+  // Próximo vencimiento de la sala: fin de pausa o timeout de turno (solo en juego)
+  _schedule(r){
+    if (!r) return;
+    if (r.status !== 'playing' || !this.rooms.has(r.id)) { this.timers.cancel(r.id); return; }
+    if (r.pauseUntil) this.timers.schedule(r.id, Number(r.pauseUntil));
+    else if (r.turnDeadline) this.timers.schedule(r.id, Number(r.turnDeadline) + 1);
+    else this.timers.cancel(r.id);
+  }
+
+  // Solo visita las salas cuyo vencimiento ya llegó (O(k log n) por tick)
   tick(){
     const now = Date.now();
-    for (const r of this.rooms.values()){
+    for (const id of this.timers.popDue(now)){
+      const r = this.rooms.get(id);
       if (!r || r.status !== 'playing') continue;
-      // pausa expirada -> derrota del que salió
-      if (r.pauseUntil && now >= r.pauseUntil){
-        const loser = r.pausedBy === 'X' ? 'X' : 'O';
-        const winner = loser === 'X' ? 'O' : 'X';
-        r.status = 'finished'; r.winner = winner; r.lastWinner = winner; r.turnDeadline = null; r.rematchVotes = { X:false, O:false };
-        if (winner === 'X') r.score.X += 1; else r.score.O += 1;
-        r.pausedBy = null; r.pauseUntil = null;
-        try { this.settlePot(r).catch(()=>{}); } catch(_){ }
-        const s = this.getState(r.id); this.emit('room_update_'+r.id, s);
-        continue;
-      }
-      if (r.pauseUntil && now < r.pauseUntil) continue; // en pausa: no aplicar timeout de turno
-      if (r.turnDeadline && now > r.turnDeadline){
-        const loser = r.turn; const winner = loser==='X' ? 'O' : 'X';
-        r.status = 'finished'; r.winner = winner; r.lastWinner = winner; r.turnDeadline = null; r.rematchVotes = { X:false, O:false };
-        if (winner === 'X') r.score.X += 1; else r.score.O += 1;
-        try { this.settlePot(r).catch(()=>{}); } catch(_){ }
-        const s = this.getState(r.id); this.emit('room_update_'+r.id, s);
-      }
+      this._expireRoom(r, now);
+      this._schedule(r);
+    }
+  }
+
+  _expireRoom(r, now){
+    // pausa expirada -> derrota del que salió
+    if (r.pauseUntil && now >= r.pauseUntil){
+      const loser = r.pausedBy === 'X' ? 'X' : 'O';
+      const winner = loser === 'X' ? 'O' : 'X';
+      r.status = 'finished'; r.winner = winner; r.lastWinner = winner; r.turnDeadline = null; r.rematchVotes = { X:false, O:false };
+      if (winner === 'X') r.score.X += 1; else r.score.O += 1;
+      r.pausedBy = null; r.pauseUntil = null;
+      try { this.settlePot(r).catch(()=>{}); } catch(_){ }
+      const s = this.getState(r.id); this._publish(r, s);
+      return;
+    }
+    if (r.pauseUntil && now < r.pauseUntil) return; // en pausa: no aplicar timeout de turno
+    if (r.turnDeadline && now > r.turnDeadline){
+      const loser = r.turn; const winner = loser==='X' ? 'O' : 'X';
+      r.status = 'finished'; r.winner = winner; r.lastWinner = winner; r.turnDeadline = null; r.rematchVotes = { X:false, O:false };
+      if (winner === 'X') r.score.X += 1; else r.score.O += 1;
+      try { this.settlePot(r).catch(()=>{}); } catch(_){ }
+      const s = this.getState(r.id); this._publish(r, s);
     }
   }
 }
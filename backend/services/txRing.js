@@ -0,0 +1,74 @@
+// Buffer circular de capacidad fija para journals de transacciones.
+// push() es O(1) (sobrescribe la más antigua al llenarse) y el almacenamiento
+// crece bajo demanda hasta la capacidad, así un journal por usuario casi vacío
+// no reserva las 200 posiciones. Se lee de la más reciente a la más antigua;
+// con ids de secuencia monotónica (tx.seq) admite lectura por cursor en O(log n).
+class TxRing {
+  constructor(capacity) {
+    this.capacity = Math.max(1, Number(capacity) || 1);
+    this.buf = [];
+    this.head = 0; // próxima posición de escritura
+    this.size = 0;
+  }
+
+  // arr: de más reciente a más antigua (formato de los listados)
+  static from(arr, capacity) {
+    const r = new TxRing(capacity);
+    const src = Array.isArray(arr) ? arr.slice(0, r.capacity) : [];
+    for (let i = src.length - 1; i >= 0; i--) r.push(src[i]);
+    return r;
+  }
+
+  get length() { return this.size; }
+
+  push(item) {
+    if (this.buf.length < this.capacity) this.buf.push(item);
+    else this.buf[this.head] = item;
+    this.head = (this.head + 1) % this.capacity;
+    if (this.size < this.capacity) this.size += 1;
+  }
+
+  // i = 0 es la más reciente
+  at(i) {
+    if (i < 0 || i >= this.size) return undefined;
+    return this.buf[(this.head - 1 - i + this.capacity * 2) % this.capacity];
+  }
+
+  *[Symbol.iterator]() {
+    for (let i = 0; i < this.size; i++) yield this.at(i);
+  }
+
+  slice(start = 0, end = this.size) {
+    const s = Math.max(0, Math.min(this.size, start));
+    const e = Math.max(s, Math.min(this.size, end));
+    const out = new Array(e - s);
+    for (let i = s; i < e; i++) out[i - s] = this.at(i);
+    return out;
+  }
+
+  toArray() { return this.slice(0, this.size); }
+
+  toJSON() { return this.toArray(); }
+
+  // Primera posición (desde la más reciente) con seq < before
+  _indexBefore(before) {
+    let lo = 0; let hi = this.size;
+    while (lo < hi) {
+      const mid = (lo + hi) >>> 1;
+      if (Number((this.at(mid) || {}).seq || 0) >= before) lo = mid + 1; else hi = mid;
+    }
+    return lo;
+  }
+
+  // Página de más reciente a más antigua; cursor = seq de la última entrada vista
+  page({ limit = 20, offset = 0, cursor = null } = {}) {
+    const before = (cursor !== null && cursor !== undefined && cursor !== '') ? Number(cursor) : NaN;
+    const start = Number.isFinite(before) ? this._indexBefore(before) : Math.max(0, Number(offset) || 0);
+    const items = this.slice(start, start + limit);
+    const last = items[items.length - 1];
+    const nextCursor = (start + items.length < this.size && last && last.seq) ? String(last.seq) : null;
+    return { items, nextCursor };
+  }
+}
+
+module.exports = TxRing;
@@ -0,0 +1,234 @@
+// Directorio indexado de usuarios de MemoryStore para los listados de admin.
+// - Orden por (createdAt, userId) en un array ordenado: paginación por cursor
+//   (o por offset heredado) en O(log n + página), sin recorrer todos los usuarios.
+// - Índice de trigramas sobre userId, userName, email, phone y telegramId:
+//   cada búsqueda de >= 3 caracteres parte de la lista de trigramas más corta y
+//   verifica la coincidencia real contra el usuario vivo.
+// Las altas/cambios llegan por touch(id) (desde _dirty('u')) y se indexan de forma
+// perezosa antes de la siguiente consulta, cuando las mutaciones síncronas que
+// siguen a ensureUser ya se han aplicado.
+const SEP = '\u0001';
+
+function tgIdOf(u) {
+  if (u.telegramId) return String(u.telegramId);
+  return String(u.userId || '').startsWith('tg:') ? String(u.userId).slice(3) : '';
+}
+
+function textOf(u) {
+  return [u.userId, u.userName, u.email, u.phone, tgIdOf(u)].map((x) => String(x || '').toLowerCase()).join(SEP);
+}
+
+function gramsOf(text) {
+  const out = new Set();
+  for (let i = 0; i + 3 <= text.length; i++) {
+    const g = text.slice(i, i + 3);
+    if (!g.includes(SEP)) out.add(g);
+  }
+  return out;
+}
+
+function cmp(aC, aId, bC, bId) {
+  if (aC !== bC) return aC < bC ? -1 : 1;
+  return aId < bId ? -1 : (aId > bId ? 1 : 0);
+}
+
+function encodeCursor(e) { return Buffer.from(JSON.stringify({ c: e.createdAt, i: e.id })).toString('base64url'); }
+
+function decodeCursor(cursor) {
+  try {
+    const j = JSON.parse(Buffer.from(String(cursor), 'base64url').toString('utf8'));
+    if (j && typeof j.i === 'string' && Number.isFinite(Number(j.c))) return { createdAt: Number(j.c), id: j.i };
+  } catch (_) {}
+  return null;
+}
+
+class UserDirectory {
+  constructor(users) {
+    this.users = users; // Map vivo userId -> user
+    this.rebuild();
+  }
+
+  rebuild() {
+    this.entries = new Map(); // userId -> { id, ix, createdAt, text }
+    this.ordered = []; // entries ordenadas por (createdAt, id) asc
+    this.byIx = []; // ix -> entry | null
+    this.grams = new Map(); // trigrama -> [ix] (puede contener ix obsoletos o repetidos)
+    this.stale = 0;
+    this.pending = new Set();
+    this.version = (this.version || 0) + 1; // cambia con cada alta/cambio indexado
+    this.totals = new Map(); // scope+q -> { version, total } (búsquedas amplias)
+    const list = [];
+    for (const u of this.users.values()) {
+      const e = { id: String(u.userId), ix: this.byIx.length, createdAt: Number(u.createdAt || 0), text: textOf(u) };
+      this.byIx.push(e); this.entries.set(e.id, e); list.push(e);
+      for (const g of gramsOf(e.text)) this._post(g, e.ix);
+    }
+    list.sort((a, b) => cmp(a.createdAt, a.id, b.createdAt, b.id));
+    this.ordered = list;
+  }
+
+  touch(id) { if (id) this.pending.add(String(id)); }
+
+  _post(g, ix) {
+    const arr = this.grams.get(g);
+    if (arr) arr.push(ix); else this.grams.set(g, [ix]);
+  }
+
+  // Posición de la primera entrada >= (createdAt, id)
+  _lowerBound(createdAt, id) { return lowerBoundIn(this.ordered, { createdAt, id }); }
+
+  _remove(e) {
+    const pos = this._lowerBound(e.createdAt, e.id);
+    if (this.ordered[pos] === e) this.ordered.splice(pos, 1);
+    this.entries.delete(e.id);
+    this.byIx[e.ix] = null;
+    this.stale += 1;
+  }
+
+  _sync() {
+    if (!this.pending.size) return;
+    // version solo cambia si varía algo indexado: un touch de saldo o de
+    // lastSeen no invalida los totales memoizados
+    let changed = false;
+    for (const id of this.pending) {
+      const u = this.users.get(id);
+      const e = this.entries.get(id);
+      if (!u) { if (e) { this._remove(e); changed = true; } continue; }
+      const createdAt = Number(u.createdAt || 0);
+      const text = textOf(u);
+      if (!e) {
+        const ne = { id, ix: this.byIx.length, createdAt, text };
+        this.byIx.push(ne); this.entries.set(id, ne);
+        // Las altas llegan casi siempre al final: inserción O(1) amortizada
+        const last = this.ordered[this.ordered.length - 1];
+        if (!last || cmp(last.createdAt, last.id, createdAt, id) < 0) this.ordered.push(ne);
+        else this.ordered.splice(this._lowerBound(createdAt, id), 0, ne);
+        for (const g of gramsOf(text)) this._post(g, ne.ix);
+        changed = true;
+        continue;
+      }
+      if (e.createdAt !== createdAt) {
+        changed = true;
+        const pos = this._lowerBound(e.createdAt, e.id);
+        if (this.ordered[pos] === e) this.ordered.splice(pos, 1);
+        e.createdAt = createdAt;
+        this.ordered.splice(this._lowerBound(createdAt, id), 0, e);
+      }
+      if (e.text !== text) {
+        changed = true;
+        const before = gramsOf(e.text);
+        for (const g of gramsOf(text)) { if (!before.has(g)) this._post(g, e.ix); else before.delete(g); }
+        this.stale += before.size ? 1 : 0;
+        e.text = text;
+      }
+    }
+    this.pending.clear();
+    if (changed) this.version += 1;
+    // Demasiadas entradas obsoletas en las listas de trigramas: reconstruir
+    if (this.stale > 1000 && this.stale > this.entries.size / 2) this.rebuild();
+  }
+
+  // Lista de trigramas más corta para q; null si q tiene < 3 caracteres
+  _postings(q) {
+    let best = null;
+    for (const g of gramsOf(q)) {
+      const arr = this.grams.get(g);
+      if (!arr) return [];
+      if (!best || arr.length < best.length) best = arr;
+    }
+    return best;
+  }
+
+  // Recorre una lista de trigramas sin repetir ix; fn(entry, user)
+  // El buffer de marcas se reutiliza entre búsquedas y se limpia solo en los ix tocados
+  _eachPosting(arr, fn) {
+    if (!this._seen || this._seen.length < this.byIx.length) this._seen = new Uint8Array(Math.max(1024, this.byIx.length * 2));
+    const seen = this._seen;
+    try {
+      for (const ix of arr) {
+        if (seen[ix]) continue;
+        seen[ix] = 1;
+        const e = this.byIx[ix]; if (!e) continue;
+        const u = this.users.get(e.id); if (u) fn(e, u);
+      }
+    } finally {
+      for (const ix of arr) seen[ix] = 0;
+    }
+  }
+
+  // Total de coincidencias de una búsqueda amplia, memoizado hasta el siguiente cambio
+  _count(scope, q, list, test) {
+    const k = scope + SEP + q;
+    const hit = this.totals.get(k);
+    if (hit && hit.version === this.version) return hit.total;
+    let total = 0;
+    if (list) this._eachPosting(list, (e, u) => { if (test(u)) total += 1; });
+    else for (const e of this.ordered) { const u = this.users.get(e.id); if (u && test(u)) total += 1; }
+    if (this.totals.size > 256) this.totals.clear();
+    this.totals.set(k, { version: this.version, total });
+    return total;
+  }
+
+  // page({ search, match, limit, cursor, order }) -> { items: [user], nextCursor, total }
+  // cursor: opaco (el nextCursor anterior); ''/0 = primera página; un número > 0
+  // se acepta como offset heredado. nextCursor siempre es opaco.
+  // scope identifica la función match para memoizar totales ('basic', 'detailed', ...)
+  page({ search = '', match, scope = 'default', limit = 50, cursor = null, order = 'desc' } = {}) {
+    this._sync();
+    const desc = order !== 'asc';
+    const q = String(search || '').toLowerCase();
+    const key = (cursor !== null && cursor !== undefined && cursor !== '' && !/^\d+$/.test(String(cursor))) ? decodeCursor(cursor) : null;
+    const offset = (!key && /^\d+$/.test(String(cursor || ''))) ? Number(cursor) : 0;
+    const test = q ? (u) => match(u, q) : null;
+
+    let list = this.ordered; let total = this.ordered.length; let filter = null;
+    if (q) {
+      const best = this._postings(q);
+      if (best && best.length * 8 < this.ordered.length) {
+        // Búsqueda selectiva: verificar solo los candidatos y ordenarlos
+        const cands = [];
+        this._eachPosting(best, (e, u) => { if (test(u)) cands.push(e); });
+        list = cands.sort((a, b) => cmp(a.createdAt, a.id, b.createdAt, b.id)); total = cands.length;
+      } else {
+        // Búsqueda corta (< 3 caracteres) o amplia: recorrido del orden global con
+        // parada temprana; el total se cuenta aparte y se memoiza
+        filter = test; total = this._count(scope, q, best, test);
+      }
+    }
+
+    let pos;
+    if (key) {
+      const lb = lowerBoundIn(list, key);
+      if (desc) pos = lb - 1; else pos = (list[lb] && list[lb].id === key.id && list[lb].createdAt === key.createdAt) ? lb + 1 : lb;
+    } else {
+      pos = desc ? list.length - 1 : 0;
+    }
+    const items = []; let skip = filter ? offset : 0;
+    if (!filter && offset) pos = desc ? pos - offset : pos + offset;
+    let last = null; let more = false;
+    for (let i = pos; desc ? i >= 0 : i < list.length; desc ? i-- : i++) {
+      const e = list[i]; const u = this.users.get(e.id);
+      if (!u || (filter && !filter(u))) continue;
+      if (skip > 0) { skip -= 1; continue; }
+      if (items.length >= limit) { more = true; break; }
+      items.push(u); last = e;
+    }
+    return { items, nextCursor: (more && last) ? encodeCursor(last) : null, total };
+  }
+
+  getStats() {
+    this._sync();
+    return { users: this.entries.size, grams: this.grams.size, stale: this.stale };
+  }
+}
+
+function lowerBoundIn(list, key) {
+  let lo = 0; let hi = list.length;
+  while (lo < hi) {
+    const mid = (lo + hi) >>> 1; const e = list[mid];
+    if (cmp(e.createdAt, e.id, key.createdAt, key.id) < 0) lo = mid + 1; else hi = mid;
+  }
+  return lo;
+}
+
+module.exports = UserDirectory;
@@ -0,0 +1,118 @@
+let db = null; try { db = require('../db'); } catch(_) { db = null; }
+
+const UUID_RE = /^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$/i;
+
+// Resolución compartida userExt ('tg:<id>' | 'em:<email>' | 'db:<uuid>') -> users.id
+// Caché LRU + TTL (Map en orden de inserción), caché negativa con TTL corto
+// y coalescencia de consultas en vuelo para la misma clave.
+class UserResolver {
+  constructor() {
+    this.max = Math.max(100, parseInt(process.env.USER_RESOLVER_MAX || '50000', 10) || 50000);
+    this.ttlMs = Math.max(1000, parseInt(process.env.USER_RESOLVER_TTL_MS || '600000', 10) || 600000);
+    this.negTtlMs = Math.max(0, parseInt(process.env.USER_RESOLVER_NEG_TTL_MS || '30000', 10) || 0);
+    this.cache = new Map(); // key -> { id, exp }
+    this.inflight = new Map(); // key -> Promise<id|null>
+    this.stats = { hits: 0, negativeHits: 0, misses: 0, coalesced: 0, queries: 0, errors: 0, evictions: 0 };
+  }
+
+  // Normaliza la clave; devuelve null si el formato no es resoluble
+  key(userExt) {
+    const v = String(userExt || '').trim(); if (!v) return null;
+    if (v.startsWith('tg:')) { const tg = v.slice(3).trim(); return /^\d+$/.test(tg) ? ('tg:' + tg) : null; }
+    if (v.startsWith('em:')) { const em = v.slice(3).trim().toLowerCase(); return em ? ('em:' + em) : null; }
+    return null;
+  }
+
+  _get(k) {
+    const e = this.cache.get(k); if (!e) return undefined;
+    if (e.exp <= Date.now()) { this.cache.delete(k); return undefined; }
+    // refrescar posición LRU
+    this.cache.delete(k); this.cache.set(k, e);
+    return e.id;
+  }
+
+  _set(k, id) {
+    const ttl = id ? this.ttlMs : this.negTtlMs;
+    if (!ttl) { this.cache.delete(k); return; }
+    this.cache.delete(k);
+    this.cache.set(k, { id: id || null, exp: Date.now() + ttl });
+    while (this.cache.size > this.max) { const oldest = this.cache.keys().next().value; this.cache.delete(oldest); this.stats.evictions += 1; }
+  }
+
+  async _lookup(k) {
+    this.stats.queries += 1;
+    if (k.startsWith('tg:')) { const r = await db.query('SELECT id FROM users WHERE tg_id=$1 LIMIT 1', [k.slice(3)]); return (r.rows && r.rows[0] && r.rows[0].id) || null; }
+    const r = await db.query('SELECT id FROM users WHERE LOWER(email)=$1 LIMIT 1', [k.slice(3)]);
+    return (r.rows && r.rows[0] && r.rows[0].id) || null;
+  }
+
+  async resolve(userExt) {
+    const v = String(userExt || '').trim(); if (!v) return null;
+    if (v.startsWith('db:')) return v.slice(3);
+    const k = this.key(v); if (!k) return null;
+    const hit = this._get(k);
+    if (hit !== undefined) { if (hit) this.stats.hits += 1; else this.stats.negativeHits += 1; return hit; }
+    const pending = this.inflight.get(k);
+    if (pending) { this.stats.coalesced += 1; return pending; }
+    this.stats.misses += 1;
+    if (!db || !db.query) return null;
+    const p = this._lookup(k)
+      .then((id) => { this._set(k, id); return id; })
+      .catch((err) => { this.stats.errors += 1; throw err; })
+      .finally(() => { this.inflight.delete(k); });
+    this.inflight.set(k, p);
+    return p;
+  }
+
+  // Resolución por lotes: las claves tg: que fallan en caché van en un solo ANY()
+  async resolveMany(exts) {
+    const out = new Map();
+    const missing = [];
+    for (const ext of exts) {
+      const v = String(ext || '').trim(); if (!v || out.has(v)) continue;
+      if (v.startsWith('db:')) { const id = v.slice(3); if (UUID_RE.test(id)) out.set(v, id); continue; }
+      const k = this.key(v); if (!k) continue;
+      const hit = this._get(k);
+      if (hit !== undefined) { if (hit) { this.stats.hits += 1; out.set(v, hit); } else this.stats.negativeHits += 1; continue; }
+      missing.push([v, k]);
+    }
+    const tgs = missing.filter(([, k]) => k.startsWith('tg:') && !this.inflight.has(k)).map(([, k]) => k.slice(3));
+    if (tgs.length && db && db.query) {
+      this.stats.misses += tgs.length; this.stats.queries += 1;
+      let rows = [];
+      try { const r = await db.query('SELECT id, tg_id FROM users WHERE tg_id = ANY($1::bigint[])', [tgs]); rows = r.rows || []; }
+      catch (err) { this.stats.errors += 1; throw err; }
+      const found = new Map(rows.map((row) => ['tg:' + String(row.tg_id), row.id]));
+      for (const tg of tgs) this._set('tg:' + tg, found.get('tg:' + tg) || null);
+    }
+    for (const [v, k] of missing) {
+      let id = this._get(k);
+      if (id === undefined) id = await this.resolve(k);
+      if (id) out.set(v, id);
+    }
+    return out;
+  }
+
+  // Registrar un alta conocida (evita que una entrada negativa oculte al usuario nuevo)
+  prime(userExt, dbUserId) {
+    const k = this.key(userExt); if (!k || !dbUserId) return;
+    this._set(k, String(dbUserId));
+  }
+
+  invalidate(userExt) {
+    const k = this.key(userExt); if (k) this.cache.delete(k);
+  }
+
+  // Olvidar todas las claves que apuntan a un users.id (p. ej. cambio de email)
+  invalidateDbId(dbUserId) {
+    const id = String(dbUserId || ''); if (!id) return;
+    for (const [k, e] of this.cache) { if (e.id === id) this.cache.delete(k); }
+  }
+
+  getStats() {
+    const lookups = this.stats.hits + this.stats.negativeHits + this.stats.misses + this.stats.coalesced;
+    return { ...this.stats, size: this.cache.size, inflight: this.inflight.size, max: this.max, ttlMs: this.ttlMs, negTtlMs: this.negTtlMs, hitRatio: lookups ? Number(((this.stats.hits + this.stats.negativeHits + this.stats.coalesced) / lookups).toFixed(4)) : 0 };
+  }
+}
+
+module.exports = new UserResolver();
@@ -0,0 +1,78 @@
+const EventEmitter = require('events');
+const supplyRepo = require('../repos/supplyRepo');
+const appKv = require('../repos/appKvRepo');
+
+const CHECKPOINT_KEY = 'backfill:welcome_bonus';
+
+// Job en segundo plano del backfill welcome_bonus: avanza por lotes, persiste el
+// checkpoint en app_kv tras cada lote y puede reanudarse tras un reinicio.
+class WelcomeBackfillJob extends EventEmitter {
+  constructor() {
+    super();
+    this.state = this._idle();
+    this.cancelRequested = false;
+    this.starting = false;
+  }
+
+  _idle() {
+    return { status: 'idle', from: null, to: null, chunkSize: 0, after: null, scanned: 0, inserted: 0, chunks: 0, candidates: null, startedAt: 0, finishedAt: 0, lastChunkMs: 0, error: null, resumed: false };
+  }
+
+  getStatus() {
+    return { ...this.state, running: this.state.status === 'running' };
+  }
+
+  // restart=true ignora el checkpoint y empieza desde el principio del rango
+  async start({ from, to, chunkSize = 1000, restart = false } = {}) {
+    if (this.state.status === 'running' || this.starting) throw new Error('backfill_running');
+    this.starting = true;
+    try {
+      return await this._start({ from, to, chunkSize, restart });
+    } finally { this.starting = false; }
+  }
+
+  async _start({ from, to, chunkSize, restart }) {
+    let after = null; let resumed = false;
+    if (!restart) {
+      try {
+        const cp = await appKv.getJson(CHECKPOINT_KEY);
+        if (cp && !cp.done && (cp.from || null) === (from || null) && (cp.to || null) === (to || null) && cp.after) { after = cp.after; resumed = true; }
+      } catch (_) {}
+    }
+    let candidates = null;
+    try { candidates = await supplyRepo.countWelcomeBonusCandidates({ from, to }); } catch (_) { candidates = null; }
+    this.cancelRequested = false;
+    this.state = { ...this._idle(), status: 'running', from: from || null, to: to || null, chunkSize: Math.max(1, Math.min(10000, Number(chunkSize) || 1000)), after, candidates, startedAt: Date.now(), resumed };
+    setImmediate(() => { this._run().catch(() => {}); });
+    return this.getStatus();
+  }
+
+  cancel() {
+    if (this.state.status !== 'running') return false;
+    this.cancelRequested = true;
+    return true;
+  }
+
+  async _run() {
+    const st = this.state;
+    try {
+      for (;;) {
+        if (this.cancelRequested) { st.status = 'cancelled'; break; }
+        const t0 = Date.now();
+        const r = await supplyRepo.backfillWelcomeBonusChunk({ from: st.from, to: st.to, after: st.after, chunkSize: st.chunkSize, checkpointKey: CHECKPOINT_KEY });
+        st.after = r.after; st.scanned += r.scanned; st.inserted += r.inserted; st.chunks += 1; st.lastChunkMs = Date.now() - t0;
+        try { this.emit('progress', this.getStatus()); } catch (_) {}
+        if (r.done) { st.status = 'completed'; break; }
+        await new Promise((resolve) => setImmediate(resolve));
+      }
+    } catch (err) {
+      st.status = 'failed';
+      st.error = String(err && err.message || err);
+    } finally {
+      st.finishedAt = Date.now();
+      try { this.emit('finished', this.getStatus()); } catch (_) {}
+    }
+  }
+}
+
+module.exports = new WelcomeBackfillJob();
@@ -0,0 +1,113 @@
+const fs = require('fs');
+const path = require('path');
+
+// Persistencia de claims de bienvenida: welcome_claims.json (compacto, mapa
+// userId -> ts) + welcome_claims.log (una línea [userId, ts] por claim).
+// Cada claim se encola y se añade al log en lote tras un debounce (escritura
+// asíncrona); al crecer el log se compacta escribiendo un .tmp y haciendo
+// rename atómico sobre el JSON antes de vaciar el log.
+class WelcomeClaimsFile {
+  constructor(dir) {
+    this.dir = dir;
+    this.jsonPath = path.join(dir, 'welcome_claims.json');
+    this.logPath = path.join(dir, 'welcome_claims.log');
+    this.flushMs = Math.max(0, parseInt(process.env.WELCOME_CLAIMS_FLUSH_MS || '200', 10) || 0);
+    this.compactMin = Math.max(100, parseInt(process.env.WELCOME_CLAIMS_COMPACT_MIN || '5000', 10) || 5000);
+    this.pending = [];
+    this.timer = null;
+    this.chain = Promise.resolve(); // flush y compactación nunca se solapan
+    this.logLines = 0;
+    this.claims = null; // Map vivo del store (para compactar)
+    this.stats = { appended: 0, flushes: 0, compactions: 0, errors: 0, truncated: 0 };
+    process.once('exit', () => { try { this.flushSync(); } catch (_) {} });
+  }
+
+  // JSON compacto + réplica del log. Una línea inválida (caída a mitad de
+  // escritura) corta la réplica y se trunca el log justo antes de ella: si no,
+  // los claims añadidos después quedarían tras la línea rota y se perderían en
+  // la siguiente carga (y esos usuarios podrían volver a cobrar la bienvenida).
+  load(claims) {
+    this.claims = claims;
+    try {
+      if (fs.existsSync(this.jsonPath)) {
+        const jc = JSON.parse(fs.readFileSync(this.jsonPath, 'utf8'));
+        if (jc && typeof jc === 'object') {
+          for (const [k, v] of Object.entries(jc)) {
+            if (k) claims.set(k, Number(v) || Date.now());
+          }
+        }
+      }
+    } catch (_) {}
+    try {
+      if (fs.existsSync(this.logPath)) {
+        const buf = fs.readFileSync(this.logPath);
+        let start = 0; let good = 0; let torn = false;
+        while (start < buf.length) {
+          let nl = buf.indexOf(10, start); const last = nl === -1; if (last) nl = buf.length;
+          if (nl > start) {
+            let rec; try { rec = JSON.parse(buf.toString('utf8', start, nl)); } catch (_) { torn = true; break; }
+            if (Array.isArray(rec) && rec[0]) { claims.set(String(rec[0]), Number(rec[1]) || Date.now()); this.logLines += 1; }
+          }
+          good = last ? nl : nl + 1; start = nl + 1;
+        }
+        if (torn) { fs.truncateSync(this.logPath, good); this.stats.truncated += 1; }
+        if (good > 0 && buf[good - 1] !== 10) fs.appendFileSync(this.logPath, '\n');
+      }
+    } catch (_) {}
+    return claims;
+  }
+
+  append(userId, ts) {
+    this.pending.push(JSON.stringify([userId, ts]) + '\n');
+    if (this.timer) return;
+    this.timer = setTimeout(() => { this.timer = null; this.flush().catch(() => {}); }, this.flushMs);
+    try { this.timer.unref(); } catch (_) {}
+  }
+
+  flush() {
+    this.chain = this.chain.then(async () => {
+      if (!this.pending.length) return;
+      const lines = this.pending; this.pending = [];
+      try {
+        await fs.promises.mkdir(this.dir, { recursive: true });
+        await fs.promises.appendFile(this.logPath, lines.join(''));
+        this.logLines += lines.length; this.stats.appended += lines.length; this.stats.flushes += 1;
+      } catch (_) { this.stats.errors += 1; this.pending = lines.concat(this.pending); return; }
+      if (this.claims && this.logLines >= Math.max(this.compactMin, this.claims.size)) await this._compact();
+    });
+    return this.chain;
+  }
+
+  // Escribe el mapa completo en .tmp, fsync y rename; después vacía el log.
+  // Si el proceso cae entre ambos pasos, el log se vuelve a aplicar (idempotente).
+  async _compact() {
+    const tmp = this.jsonPath + '.tmp';
+    try {
+      const obj = {};
+      for (const [k, v] of this.claims.entries()) obj[k] = v;
+      const fh = await fs.promises.open(tmp, 'w');
+      try { await fh.writeFile(JSON.stringify(obj)); await fh.sync(); } finally { await fh.close(); }
+      await fs.promises.rename(tmp, this.jsonPath);
+      await fs.promises.truncate(this.logPath, 0);
+      this.logLines = 0; this.stats.compactions += 1;
+    } catch (_) { this.stats.errors += 1; }
+  }
+
+  compact() {
+    this.chain = this.chain.then(() => (this.claims ? this._compact() : null));
+    return this.chain;
+  }
+
+  flushSync() {
+    if (!this.pending.length) return;
+    fs.mkdirSync(this.dir, { recursive: true });
+    fs.appendFileSync(this.logPath, this.pending.join(''));
+    this.pending = [];
+  }
+
+  getStats() {
+    return { ...this.stats, pending: this.pending.length, logLines: this.logLines };
+  }
+}
+
+module.exports = WelcomeClaimsFile;
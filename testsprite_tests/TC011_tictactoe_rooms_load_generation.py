@@ -0,0 +1,157 @@
+import asyncio
+import os
+import time
+import uuid
+
+import aiohttp
+
+BASE_URL = os.environ.get("LOADGEN_BASE_URL", "http://127.0.0.1:3000")
+HEADERS_QA = {
+    "X-Test-Runner": "testsprite",
+    "User-Agent": "TestSprite",
+}
+TIMEOUT = 30
+
+# Tamaño de la carga (sobrescribible por entorno)
+PAIRS = int(os.environ.get("LOADGEN_PAIRS", "2000"))
+CONCURRENCY = int(os.environ.get("LOADGEN_CONCURRENCY", "200"))
+ROUNDS = int(os.environ.get("LOADGEN_ROUNDS", "1"))
+
+# X gana en la columna superior: X0, O3, X1, O4, X2
+WIN_SEQUENCE = [("X", 0), ("O", 3), ("X", 1), ("O", 4), ("X", 2)]
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = max(0, min(len(ordered) - 1, int(round((p / 100.0) * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.rooms = 0
+        self.moves = 0
+
+    def add(self, endpoint, ms, ok):
+        self.latencies.setdefault(endpoint, []).append(ms)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def report(self, elapsed):
+        print(f"pairs={PAIRS} concurrency={CONCURRENCY} rounds={ROUNDS} elapsed={elapsed:.2f}s")
+        print(f"rooms/sec={self.rooms / elapsed:.1f} moves/sec={self.moves / elapsed:.1f}")
+        print(f"{'endpoint':<12} {'count':>8} {'errors':>7} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8}")
+        for endpoint, samples in sorted(self.latencies.items()):
+            print(
+                f"{endpoint:<12} {len(samples):>8} {self.errors.get(endpoint, 0):>7} "
+                f"{percentile(samples, 50):>8.1f} {percentile(samples, 95):>8.1f} {percentile(samples, 99):>8.1f}"
+            )
+
+
+async def call(session, rec, endpoint, method, path, payload=None):
+    t0 = time.perf_counter()
+    ok = False
+    body = None
+    try:
+        async with session.request(method, f"{BASE_URL}{path}", json=payload) as resp:
+            body = await resp.json(content_type=None)
+            ok = resp.status == 200 and isinstance(body, dict) and body.get("success") is True
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+        ok = False
+    rec.add(endpoint, (time.perf_counter() - t0) * 1000.0, ok)
+    return body if ok else None
+
+
+async def play_pair(session, rec, sem):
+    """
+    Simula una pareja de jugadores: crea sala, el invitado entra por código,
+    marca listo, el anfitrión inicia y se juegan las rondas hasta victoria de X.
+    """
+    async with sem:
+        tag = uuid.uuid4().hex[:12]
+        players = {"X": f"lt:x_{tag}", "O": f"lt:o_{tag}"}
+        created = await call(
+            session, rec, "create", "POST", "/api/games/tictactoe/rooms",
+            {"userId": players["X"], "visibility": "private", "costType": "coins", "costValue": 1},
+        )
+        if not created:
+            return
+        rec.rooms += 1
+        room_id = created["state"]["id"]
+        code = created["state"]["code"]
+        joined = await call(
+            session, rec, "join-code", "POST", "/api/games/tictactoe/join-code",
+            {"code": code, "userId": players["O"]},
+        )
+        if not joined:
+            return
+        for rnd in range(ROUNDS):
+            if not await call(
+                session, rec, "ready", "POST", f"/api/games/tictactoe/rooms/{room_id}/ready",
+                {"userId": players["O"], "ready": True},
+            ):
+                return
+            started = await call(
+                session, rec, "start", "POST", f"/api/games/tictactoe/rooms/{room_id}/start",
+                {"userId": players["X"]},
+            )
+            if not started:
+                return
+            # El turno inicial alterna tras cada revancha
+            first = started["state"].get("turn", "X")
+            for seat, index in WIN_SEQUENCE:
+                mover = seat if first == "X" else ("O" if seat == "X" else "X")
+                moved = await call(
+                    session, rec, "move", "POST", f"/api/games/tictactoe/rooms/{room_id}/move",
+                    {"userId": players[mover], "index": index},
+                )
+                if not moved:
+                    return
+                rec.moves += 1
+            if rnd + 1 < ROUNDS:
+                for seat in ("X", "O"):
+                    if not await call(
+                        session, rec, "rematch", "POST", f"/api/games/tictactoe/rooms/{room_id}/rematch",
+                        {"userId": players[seat]},
+                    ):
+                        return
+        for seat in ("X", "O"):
+            await call(
+                session, rec, "leave", "POST", f"/api/games/tictactoe/rooms/{room_id}/leave",
+                {"userId": players[seat]},
+            )
+
+
+async def run_load():
+    rec = Recorder()
+    sem = asyncio.Semaphore(CONCURRENCY)
+    connector = aiohttp.TCPConnector(limit=CONCURRENCY)
+    timeout = aiohttp.ClientTimeout(total=TIMEOUT)
+    async with aiohttp.ClientSession(headers=HEADERS_QA, connector=connector, timeout=timeout) as session:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(play_pair(session, rec, sem) for _ in range(PAIRS)))
+        elapsed = max(1e-6, time.perf_counter() - t0)
+    rec.report(elapsed)
+    return rec
+
+
+def test_tictactoe_rooms_load_generation():
+    """
+    Generador de carga asyncio contra un servidor local: miles de parejas simuladas
+    recorren /api/games/tictactoe/rooms, /join-code y /rooms/:id/move.
+    Reporta salas/seg, movimientos/seg y p50/p95/p99 de latencia por endpoint.
+    """
+    rec = asyncio.run(run_load())
+    assert rec.rooms > 0, "No room could be created"
+    assert rec.moves > 0, "No move was accepted"
+    total = sum(len(v) for v in rec.latencies.values())
+    failed = sum(rec.errors.values())
+    assert failed <= total * 0.01, f"Error rate too high: {failed}/{total}"
+
+
+if __name__ == "__main__":
+    test_tictactoe_rooms_load_generation()
@@ -0,0 +1,294 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+
+import aiohttp
+
+BASE_URL = os.environ.get("SSE_BENCH_BASE_URL", "http://127.0.0.1:3000")
+HEADERS_QA = {
+    "X-Test-Runner": "testsprite",
+    "User-Agent": "TestSprite",
+}
+HEADERS_ADMIN = {
+    **HEADERS_QA,
+    "x-admin-username": "wilcnct",
+    "x-admin-code": os.environ.get("X_ADMIN_CODE", "default_admin_code"),
+}
+TIMEOUT = 30
+
+# Escalones de suscriptores por stream; 10k requiere `ulimit -n` alto en cliente y servidor
+STEPS = [int(x) for x in os.environ.get("SSE_BENCH_STEPS", "10,100,1000,10000").split(",") if x.strip()]
+# PID del servidor local para medir RSS por conexión (opcional)
+SERVER_PID = os.environ.get("SSE_BENCH_SERVER_PID", "")
+TTT_ROUNDS = int(os.environ.get("SSE_BENCH_TTT_ROUNDS", "3"))
+BINGO_DRAWS = int(os.environ.get("SSE_BENCH_BINGO_DRAWS", "30"))
+# Mutaciones de supply por escalón (solicitud de fuegos aceptada) y pausa entre ellas;
+# la pausa debe superar SUPPLY_STREAM_NOTIFY_MS para que cada una salga en su propio frame
+SUPPLY_MUTATIONS = int(os.environ.get("SSE_BENCH_SUPPLY_MUTATIONS", "5"))
+SUPPLY_GAP_S = float(os.environ.get("SSE_BENCH_SUPPLY_GAP_S", "1.0"))
+SETTLE_S = 2.0
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = max(0, min(len(ordered) - 1, int(round((p / 100.0) * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def server_rss_kb():
+    if not SERVER_PID:
+        return None
+    try:
+        with open(f"/proc/{SERVER_PID}/status", "r", encoding="utf-8") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+class Reader:
+    """Lector estilo EventSource: guarda (instante de recepción, data, evento) de los eventos pedidos."""
+
+    def __init__(self, session, path, event_names):
+        self.session = session
+        self.path = path
+        self.event_names = set(event_names)
+        self.events = []
+        self.ready = asyncio.Event()
+        self.failed = False
+
+    async def run(self):
+        try:
+            async with self.session.get(f"{BASE_URL}{self.path}") as resp:
+                if resp.status != 200:
+                    self.failed = True
+                    self.ready.set()
+                    return
+                name, data = None, []
+                while True:
+                    raw = await resp.content.readline()
+                    if not raw:
+                        break
+                    line = raw.decode("utf-8").rstrip("\n")
+                    if line.startswith("event: "):
+                        name = line[len("event: "):]
+                    elif line.startswith("data: "):
+                        data.append(line[len("data: "):])
+                    elif line == "":
+                        if name in self.event_names and data:
+                            self.events.append((time.time() * 1000.0, "\n".join(data), name))
+                            self.ready.set()
+                        name, data = None, []
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.failed = True
+            self.ready.set()
+        except asyncio.CancelledError:
+            pass
+
+
+async def post(session, method, path, payload, headers=None):
+    async with session.request(method, f"{BASE_URL}{path}", json=payload, headers=headers) as resp:
+        body = await resp.json(content_type=None)
+        assert resp.status == 200 and body.get("success") is True, f"{path} failed: {resp.status} {body}"
+        return body
+
+
+async def open_readers(session, n, path, event_names):
+    readers = [Reader(session, path, event_names) for _ in range(n)]
+    tasks = [asyncio.create_task(r.run()) for r in readers]
+    await asyncio.wait_for(asyncio.gather(*(r.ready.wait() for r in readers)), timeout=TIMEOUT + n / 100.0)
+    return readers, tasks
+
+
+async def close_readers(tasks):
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def summarize(label, n, readers, sent_at, rss_before, rss_after):
+    """Empareja el i-ésimo evento posterior al snapshot con la i-ésima acción enviada.
+    Cada acción llega como un `patch` o, si el lector tuvo que resincronizar, como un `state`."""
+    latencies = []
+    dropped = 0
+    patches = 0
+    resyncs = 0
+    failed = sum(1 for r in readers if r.failed)
+    for r in readers:
+        updates = r.events[1:]
+        dropped += max(0, len(sent_at) - len(updates))
+        for i, (recv_ms, _, name) in enumerate(updates[:len(sent_at)]):
+            latencies.append(recv_ms - sent_at[i])
+            if name == "patch":
+                patches += 1
+            else:
+                resyncs += 1
+    per_conn = ""
+    if rss_before is not None and rss_after is not None and n:
+        per_conn = f" rss/conn={(rss_after - rss_before) / n:.1f}KB"
+    print(
+        f"{label:<7} N={n:<6} events={len(sent_at):<4} delivered={len(latencies):<8} dropped={dropped:<6} "
+        f"failed_conns={failed:<4} p50={percentile(latencies, 50):.1f}ms p95={percentile(latencies, 95):.1f}ms "
+        f"p99={percentile(latencies, 99):.1f}ms max={max(latencies) if latencies else 0:.1f}ms "
+        f"patch={patches} state={resyncs}{per_conn}"
+    )
+    return {"label": label, "n": n, "dropped": dropped, "failed": failed, "latencies": latencies}
+
+
+async def bench_ttt(session, n):
+    tag = uuid.uuid4().hex[:12]
+    x, o = f"sb:x_{tag}", f"sb:o_{tag}"
+    created = await post(session, "POST", "/api/games/tictactoe/rooms", {"userId": x, "costType": "coins", "costValue": 1})
+    room_id = created["state"]["id"]
+    await post(session, "POST", "/api/games/tictactoe/join-code", {"code": created["state"]["code"], "userId": o})
+    rss_before = server_rss_kb()
+    readers, tasks = await open_readers(session, n, f"/api/games/tictactoe/rooms/{room_id}/stream", ("state", "patch"))
+    rss_after = server_rss_kb()
+    sent_at = []
+    players = {"X": x, "O": o}
+    turn = "X"
+    try:
+        for rnd in range(TTT_ROUNDS):
+            sent_at.append(time.time() * 1000.0)
+            await post(session, "POST", f"/api/games/tictactoe/rooms/{room_id}/ready", {"userId": o, "ready": True})
+            sent_at.append(time.time() * 1000.0)
+            await post(session, "POST", f"/api/games/tictactoe/rooms/{room_id}/start", {"userId": x})
+            other = "O" if turn == "X" else "X"
+            for seat, index in [(turn, 0), (other, 3), (turn, 1), (other, 4), (turn, 2)]:
+                sent_at.append(time.time() * 1000.0)
+                await post(session, "POST", f"/api/games/tictactoe/rooms/{room_id}/move", {"userId": players[seat], "index": index})
+            if rnd + 1 < TTT_ROUNDS:
+                for seat in ("X", "O"):
+                    sent_at.append(time.time() * 1000.0)
+                    await post(session, "POST", f"/api/games/tictactoe/rooms/{room_id}/rematch", {"userId": players[seat]})
+                turn = other
+        await asyncio.sleep(SETTLE_S)
+    finally:
+        await close_readers(tasks)
+    return summarize("ttt", n, readers, sent_at, rss_before, rss_after)
+
+
+async def bench_bingo(session, n):
+    host = f"sb:h_{uuid.uuid4().hex[:12]}"
+    created = await post(session, "POST", "/api/games/bingo/rooms", {"userId": host, "costType": "coins"})
+    room_id = created["state"]["id"]
+    rss_before = server_rss_kb()
+    readers, tasks = await open_readers(session, n, f"/api/games/bingo/rooms/{room_id}/stream", ("state", "patch"))
+    rss_after = server_rss_kb()
+    sent_at = []
+    try:
+        sent_at.append(time.time() * 1000.0)
+        await post(session, "PATCH", f"/api/games/bingo/rooms/{room_id}/ready", {"userId": host, "ready": True, "cardsCount": 1})
+        sent_at.append(time.time() * 1000.0)
+        await post(session, "POST", f"/api/games/bingo/rooms/{room_id}/start", {"userId": host})
+        for _ in range(BINGO_DRAWS):
+            sent_at.append(time.time() * 1000.0)
+            await post(session, "POST", f"/api/games/bingo/rooms/{room_id}/draw", {"userId": host})
+        await asyncio.sleep(SETTLE_S)
+    finally:
+        await close_readers(tasks)
+    return summarize("bingo", n, readers, sent_at, rss_before, rss_after)
+
+
+async def get_supply(session):
+    async with session.get(f"{BASE_URL}/api/economy/supply") as resp:
+        body = await resp.json(content_type=None)
+        assert resp.status == 200 and body.get("success") is True, f"supply failed: {resp.status} {body}"
+        return body["supply"]
+
+
+async def supply_user(session):
+    """Usuario con wallet en DB para que aceptar su solicitud mueva emitted y circulante."""
+    tag = uuid.uuid4().hex[:12]
+    out = await post(session, "POST", "/api/admin/users/create", {"username": f"sb_{tag}", "password": f"Sb-{tag}!"}, HEADERS_ADMIN)
+    return f"db:{out['userId']}"
+
+
+async def bench_supply(session, n, user_ext):
+    """
+    supplyHub omite valores repetidos y agrupa notify(): un frame por tick no prueba
+    nada. Cada paso acepta una solicitud de 1 fuego (emitted y circulante +1, reserva -1)
+    y la latencia es desde el envío hasta el primer frame con exactamente ese valor.
+    """
+    rss_before = server_rss_kb()
+    readers, tasks = await open_readers(session, n, "/api/economy/supply/stream", ("supply",))
+    rss_after = server_rss_kb()
+    sent = []  # (instante de envío, clave del valor esperado)
+    try:
+        for _ in range(SUPPLY_MUTATIONS):
+            before = await get_supply(session)
+            created = await post(session, "POST", "/api/economy/fire-requests/create", {"userId": user_ext, "amount": 1, "reference": "sse-bench"})
+            expected = {
+                **before,
+                "circulating": before["circulating"] + 1,
+                "reserve": max(0, before["reserve"] - 1),
+            }
+            sent.append((time.time() * 1000.0, json.dumps(expected, sort_keys=True)))
+            await post(session, "POST", f"/api/economy/fire-requests/{created['request']['id']}/accept", {}, HEADERS_ADMIN)
+            await asyncio.sleep(SUPPLY_GAP_S)
+        await asyncio.sleep(SETTLE_S)
+    finally:
+        await close_readers(tasks)
+    latencies = []
+    dropped = 0
+    failed = sum(1 for r in readers if r.failed)
+    for r in readers:
+        arrivals = {}
+        for recv_ms, data, _ in r.events:
+            try:
+                key = json.dumps(json.loads(data).get("value"), sort_keys=True)
+            except ValueError:
+                continue
+            arrivals.setdefault(key, recv_ms)
+        for sent_ms, key in sent:
+            recv_ms = arrivals.get(key)
+            if recv_ms is None or recv_ms < sent_ms:
+                dropped += 1
+            else:
+                latencies.append(recv_ms - sent_ms)
+    per_conn = ""
+    if rss_before is not None and rss_after is not None and n:
+        per_conn = f" rss/conn={(rss_after - rss_before) / n:.1f}KB"
+    print(
+        f"{'supply':<7} N={n:<6} events={len(sent):<4} delivered={len(latencies):<8} dropped={dropped:<6} "
+        f"failed_conns={failed:<4} p50={percentile(latencies, 50):.1f}ms p95={percentile(latencies, 95):.1f}ms "
+        f"p99={percentile(latencies, 99):.1f}ms max={max(latencies) if latencies else 0:.1f}ms{per_conn}"
+    )
+    return {"label": "supply", "n": n, "dropped": dropped, "failed": failed, "latencies": latencies}
+
+
+async def run_bench():
+    results = []
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=TIMEOUT)
+    async with aiohttp.ClientSession(headers=HEADERS_QA, connector=connector, timeout=timeout) as session:
+        user_ext = await supply_user(session)
+        for n in STEPS:
+            results.append(await bench_ttt(session, n))
+            results.append(await bench_bingo(session, n))
+            results.append(await bench_supply(session, n, user_ext))
+    return results
+
+
+def test_sse_fanout_latency_benchmark():
+    """
+    Abre N lectores SSE concurrentes sobre los streams de sala de tictactoe y bingo
+    y sobre /api/economy/supply/stream, genera movimientos/extracciones/cambios de
+    supply y mide
+    latencia de entrega extremo a extremo, eventos perdidos y memoria por conexión
+    a medida que N crece de 10 a 10k.
+    """
+    results = asyncio.run(run_bench())
+    assert results, "No benchmark step was executed"
+    for r in results:
+        assert r["latencies"], f"{r['label']} N={r['n']}: no events delivered"
+
+
+if __name__ == "__main__":
+    test_sse_fanout_latency_benchmark()
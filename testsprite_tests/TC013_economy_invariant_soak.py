@@ -0,0 +1,243 @@
+import asyncio
+import os
+import random
+import time
+import uuid
+
+import aiohttp
+
+BASE_URL = os.environ.get("SOAK_BASE_URL", "http://127.0.0.1:3000")
+TIMEOUT = 30
+HEADERS_QA = {
+    "X-Test-Runner": "testsprite",
+    "User-Agent": "TestSprite",
+}
+HEADERS_ADMIN = {
+    "X-Test-Runner": "testsprite",
+    "User-Agent": "TestSprite",
+    "x-admin-username": "wilcnct",
+    "x-admin-code": os.environ.get("X_ADMIN_CODE", "default_admin_code"),
+}
+
+DURATION_S = float(os.environ.get("SOAK_DURATION_S", "300"))
+CONCURRENCY = int(os.environ.get("SOAK_CONCURRENCY", "200"))
+RECONCILE_EVERY_S = float(os.environ.get("SOAK_RECONCILE_EVERY_S", "0.5"))
+# Peso relativo de cada flujo dentro de la mezcla
+MIX = [("transfer", 50), ("grant", 25), ("ttt", 15), ("bingo", 10)]
+
+
+class Soak:
+    def __init__(self, session):
+        self.session = session
+        self.counts = {}
+        self.errors = {}
+        self.violations = []
+        self.reconciles = 0
+        self.sponsor = None
+        self.sponsor_key = None
+        # Fuegos que el soak hizo entrar (alta del sponsor, transferencias del sponsor,
+        # grants) y los que salieron del conjunto (10% del pot de bingo al sponsor del juego)
+        self.funded = 0
+        self.paid_out = 0
+        # Cuentas pot de las salas que creó este soak (otras salas del servidor no cuentan)
+        self.pots = set()
+
+    async def call(self, kind, method, path, payload=None, admin=False):
+        headers = HEADERS_ADMIN if admin else HEADERS_QA
+        try:
+            async with self.session.request(method, f"{BASE_URL}{path}", json=payload, headers=headers) as resp:
+                body = await resp.json(content_type=None)
+                ok = resp.status == 200 and isinstance(body, dict) and body.get("success") is not False
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            body, ok = None, False
+        if ok:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+        else:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+        return body if ok else None
+
+    async def grant(self, user_id, amount):
+        out = await self.call(
+            "grant", "POST", "/api/economy/grant-from-supply",
+            {"toUserId": user_id, "amount": amount, "reason": "soak"}, admin=True,
+        )
+        if out:
+            self.funded += amount
+        return out
+
+    async def setup(self):
+        self.sponsor = f"soak:sp_{uuid.uuid4().hex[:10]}"
+        self.sponsor_key = f"soak-key-{uuid.uuid4().hex[:8]}"
+        out = await self.call(
+            "setup", "POST", "/api/economy/sponsors/add",
+            {"userId": self.sponsor, "key": self.sponsor_key, "description": "soak sponsor", "initialAmount": 1000},
+            admin=True,
+        )
+        assert out is not None, "Failed to add soak sponsor"
+        self.funded += 1000
+
+    async def flow_transfer(self):
+        to = f"soak:u_{uuid.uuid4().hex[:10]}"
+        amount = random.randint(1, 5)
+        if await self.call(
+            "transfer", "POST", "/api/economy/transfer",
+            {"fromUserId": self.sponsor, "toUserId": to, "amount": amount,
+             "sponsorKey": self.sponsor_key, "reason": "soak"},
+        ):
+            self.funded += amount
+
+    async def flow_grant(self):
+        await self.grant(f"soak:g_{uuid.uuid4().hex[:10]}", random.randint(1, 5))
+
+    async def flow_ttt(self):
+        """Partida con apuesta en fuegos: débito al pot y liquidación al ganador."""
+        tag = uuid.uuid4().hex[:10]
+        x, o = f"soak:x_{tag}", f"soak:o_{tag}"
+        if not (await self.grant(x, 5) and await self.grant(o, 5)):
+            return
+        created = await self.call("ttt", "POST", "/api/games/tictactoe/rooms", {"userId": x, "costType": "fuego", "costValue": 2})
+        if not created:
+            return
+        room_id = created["state"]["id"]
+        # Pot de tictactoeStore (pot:<id>) o de ttt2 (ttt:pot:<id>) según TTT_V2
+        self.pots.update((f"pot:{room_id}", f"ttt:pot:{room_id}"))
+        if not await self.call("ttt", "POST", "/api/games/tictactoe/join-code", {"code": created["state"]["code"], "userId": o}):
+            return
+        if not await self.call("ttt", "POST", f"/api/games/tictactoe/rooms/{room_id}/ready", {"userId": o, "ready": True}):
+            return
+        if not await self.call("ttt", "POST", f"/api/games/tictactoe/rooms/{room_id}/start", {"userId": x}):
+            return
+        for uid, index in [(x, 0), (o, 3), (x, 1), (o, 4), (x, 2)]:
+            if not await self.call("ttt", "POST", f"/api/games/tictactoe/rooms/{room_id}/move", {"userId": uid, "index": index}):
+                return
+        self.counts["ttt_settled"] = self.counts.get("ttt_settled", 0) + 1
+        for uid in (x, o):
+            await self.call("ttt", "POST", f"/api/games/tictactoe/rooms/{room_id}/leave", {"userId": uid})
+
+    async def flow_bingo(self):
+        """Sala de bingo en fuegos: depósito del host, extracción hasta cantar y reparto 70/20/10 del pot."""
+        host = f"soak:b_{uuid.uuid4().hex[:10]}"
+        if not await self.grant(host, 20):
+            return
+        created = await self.call("bingo", "POST", "/api/games/bingo/rooms", {"userId": host, "costType": "fuego"})
+        if not created:
+            return
+        room_id = created["state"]["id"]
+        self.pots.add(f"pot:{room_id}")
+        if not await self.call("bingo", "PATCH", f"/api/games/bingo/rooms/{room_id}/ready", {"userId": host, "ready": True, "cardsCount": 1}):
+            return
+        if not await self.call("bingo", "POST", f"/api/games/bingo/rooms/{room_id}/start", {"userId": host}):
+            return
+        for n in range(1, 91):
+            if not await self.call("bingo", "POST", f"/api/games/bingo/rooms/{room_id}/draw", {"userId": host}):
+                return
+            if n >= 5 and n % 5 == 0:
+                try:
+                    async with self.session.post(
+                        f"{BASE_URL}/api/games/bingo/rooms/{room_id}/claim",
+                        json={"userId": host, "cardIndex": 0}, headers=HEADERS_QA,
+                    ) as resp:
+                        if resp.status == 200:
+                            body = await resp.json(content_type=None)
+                            payout = (body.get("state") or {}).get("lastPayout") or {}
+                            self.paid_out += int(payout.get("sponsorFires") or 0)
+                            self.counts["bingo_payout"] = self.counts.get("bingo_payout", 0) + 1
+                            return
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                    return
+
+    async def worker(self, deadline):
+        flows = {"transfer": self.flow_transfer, "grant": self.flow_grant, "ttt": self.flow_ttt, "bingo": self.flow_bingo}
+        names = [name for name, _ in MIX]
+        weights = [w for _, w in MIX]
+        while time.monotonic() < deadline:
+            await flows[random.choices(names, weights)[0]]()
+
+    async def reconciler(self, deadline):
+        while time.monotonic() < deadline:
+            try:
+                # full=1: recuento completo de saldos frente al contador de circulación
+                async with self.session.get(f"{BASE_URL}/api/economy/reconcile?full=1", headers=HEADERS_QA) as resp:
+                    body = await resp.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                body = None
+            if body and body.get("success"):
+                self.reconciles += 1
+                diff = float(body.get("diff", 0))
+                total = float(body.get("total", 0))
+                parts = float(body.get("circulating", 0)) + float(body.get("burned", 0)) + float(body.get("reserve", 0))
+                if diff != 0:
+                    self.violations.append(f"diff={diff} at t={time.time():.3f}")
+                if abs(total - parts) > 1e-6:
+                    self.violations.append(f"total={total} != circulating+burned+reserve={parts} at t={time.time():.3f}")
+            await asyncio.sleep(RECONCILE_EVERY_S)
+
+    async def balances(self, search, exact=False):
+        """Suma de fuegos de las cuentas que contienen `search` (listado admin paginado);
+        con exact=True solo la cuenta cuyo userId es `search`."""
+        total, cursor = 0, ""
+        while True:
+            async with self.session.get(
+                f"{BASE_URL}/api/admin/users/list",
+                params={"search": search, "limit": "200", "cursor": cursor}, headers=HEADERS_ADMIN,
+            ) as resp:
+                body = await resp.json(content_type=None)
+            assert resp.status == 200 and body.get("success"), f"users list failed for {search!r}: {body}"
+            total += sum(
+                int(u.get("fires") or 0) for u in body.get("items", []) if not exact or u.get("userId") == search
+            )
+            cursor = body.get("nextCursor")
+            if not cursor:
+                return total
+
+    async def audit(self):
+        """Conservación propia del soak, independiente del contador del servidor:
+        saldos soak:* + pots de sus salas == fuegos que entraron - fuegos pagados fuera del conjunto."""
+        pots = sorted(self.pots)
+        held = await self.balances("soak:")
+        for i in range(0, len(pots), 50):
+            held += sum(await asyncio.gather(*(self.balances(p, exact=True) for p in pots[i:i + 50])))
+        expected = self.funded - self.paid_out
+        if held != expected:
+            self.violations.append(
+                f"soak balances+pots={held} != funded={self.funded} - paid_out={self.paid_out} ({expected})"
+            )
+
+
+async def run_soak():
+    connector = aiohttp.TCPConnector(limit=CONCURRENCY + 8)
+    timeout = aiohttp.ClientTimeout(total=TIMEOUT)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        soak = Soak(session)
+        await soak.setup()
+        t0 = time.monotonic()
+        deadline = t0 + DURATION_S
+        await asyncio.gather(soak.reconciler(deadline), *(soak.worker(deadline) for _ in range(CONCURRENCY)))
+        elapsed = max(1e-6, time.monotonic() - t0)
+        await soak.audit()
+    money = sum(soak.counts.get(k, 0) for k in ("transfer", "grant", "ttt_settled", "bingo_payout"))
+    print(f"duration={elapsed:.1f}s concurrency={CONCURRENCY} reconciles={soak.reconciles}")
+    print(f"funded={soak.funded} paid_out={soak.paid_out}")
+    print(f"sustained tx/sec={money / elapsed:.1f}")
+    for kind in sorted(set(soak.counts) | set(soak.errors)):
+        print(f"{kind:<13} ok={soak.counts.get(kind, 0):<8} errors={soak.errors.get(kind, 0):<6} rate={soak.counts.get(kind, 0) / elapsed:.1f}/s")
+    for v in soak.violations[:20]:
+        print("VIOLATION", v)
+    return soak
+
+
+def test_economy_invariant_soak():
+    """
+    Soak asyncio de larga duración: miles de /api/economy/transfer, grant-from-supply,
+    pagos de pot de bingo y liquidaciones de TTT concurrentes mientras se consulta
+    /api/economy/reconcile?full=1; falla ante cualquier `diff` distinto de cero o si, al
+    terminar, los saldos soak:* más los pots de sus salas no cuadran con lo que el propio soak ingresó.
+    """
+    soak = asyncio.run(run_soak())
+    assert soak.reconciles > 0, "Reconcile endpoint never answered"
+    assert not soak.violations, f"{len(soak.violations)} conservation violations, first: {soak.violations[0]}"
+    assert soak.counts.get("transfer", 0) > 0, "No transfer succeeded"
+
+
+if __name__ == "__main__":
+    test_economy_invariant_soak()
@@ -0,0 +1,101 @@
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+PERSISTENCE = os.path.join(ROOT, "backend", "services", "memoryPersistence.js")
+STORE = os.path.join(ROOT, "backend", "services", "memoryStore.js")
+
+# Por defecto un fixture pequeño; la medición a escala se pide por entorno
+# (RECOVERY_USERS=1000000 RECOVERY_LOG_TAIL=200000)
+USERS = int(os.environ.get("RECOVERY_USERS", "20000"))
+LOG_TAIL = int(os.environ.get("RECOVERY_LOG_TAIL", "4000"))
+HISTORY_PER_USER = int(os.environ.get("RECOVERY_HISTORY_PER_USER", "3"))
+MAX_RECOVERY_S = float(os.environ.get("RECOVERY_MAX_S", "30"))
+
+# Recupera el estado, comprueba la suma de fires y mide además un snapshot completo
+NODE_SCRIPT = """
+const mem = require(%(store)s);
+const mp = require(%(persistence)s);
+(async () => {
+  const r = await mp.recover(mem);
+  let sum = 0; for (const u of mem.users.values()) sum += Math.max(0, Number(u.fires || 0));
+  const t0 = Date.now();
+  const snap = await mp.snapshot();
+  const rss = process.memoryUsage().rss;
+  console.log(JSON.stringify({ recovery: r, fires: sum, circulating: mem.firesCirculating, snapshot: snap, snapshotWallMs: Date.now() - t0, rssMb: Math.round(rss / 1048576) }));
+  process.exit(0);
+})().catch((e) => { console.error(e); process.exit(1); });
+"""
+
+
+def write_fixture(directory):
+    """Snapshot de USERS usuarios + cola de log con LOG_TAIL mutaciones."""
+    seq = 0
+    expected = {}
+    snap_path = os.path.join(directory, "snapshot-1.ndjson")
+    now = int(time.time() * 1000)
+    with open(snap_path, "w", encoding="utf8") as f:
+        f.write(json.dumps({"k": "hdr", "gen": 1, "startSeq": seq, "at": now}) + "\n")
+        f.write(json.dumps({"s": seq, "k": "sup", "id": "", "v": {"total": 1_000_000_000, "circulating": 100_000, "burned": 0}}) + "\n")
+        lines = 1
+        for i in range(USERS):
+            uid = f"tg:{100000000 + i}"
+            fires = random.randint(0, 500)
+            expected[uid] = fires
+            user = {"userId": uid, "userName": f"user{i}", "fires": fires, "coins": random.randint(0, 1000),
+                    "createdAt": now - i, "lastSeenAt": now, "firstSeenAt": now - i, "currentSessionStart": now,
+                    "lastDurationMs": 0, "devices": []}
+            f.write(json.dumps({"s": seq, "k": "u", "id": uid, "v": user}, separators=(",", ":")) + "\n")
+            hist = [{"id": f"tx_{i}_{h}", "ts": now, "type": "grant", "toUserId": uid, "amount": 1, "reason": "bench"}
+                    for h in range(HISTORY_PER_USER)]
+            f.write(json.dumps({"s": seq, "k": "ut", "id": uid, "v": hist}, separators=(",", ":")) + "\n")
+            lines += 2
+        f.write(json.dumps({"k": "end", "s": seq, "lines": lines}) + "\n")
+    with open(os.path.join(directory, "log-1.ndjson"), "w", encoding="utf8") as f:
+        for _ in range(LOG_TAIL):
+            seq += 1
+            uid = f"tg:{100000000 + random.randrange(USERS)}"
+            expected[uid] = expected[uid] + 1
+            user = {"userId": uid, "userName": uid, "fires": expected[uid], "coins": 0, "createdAt": now,
+                    "lastSeenAt": now, "devices": []}
+            f.write(json.dumps({"s": seq, "k": "u", "id": uid, "v": user}, separators=(",", ":")) + "\n")
+    return sum(expected.values())
+
+
+def test_memory_recovery_benchmark():
+    directory = tempfile.mkdtemp(prefix="memrecovery_")
+    try:
+        t0 = time.time()
+        expected_fires = write_fixture(directory)
+        size_mb = sum(os.path.getsize(os.path.join(directory, n)) for n in os.listdir(directory)) / 1048576
+        print(f"fixture: {USERS} users, {LOG_TAIL} log records, {size_mb:.1f} MiB in {time.time() - t0:.1f}s")
+
+        env = dict(os.environ, MEMORY_PERSIST="true", MEMORY_PERSIST_DIR=directory, NODE_ENV="production")
+        script = NODE_SCRIPT % {"store": json.dumps(STORE), "persistence": json.dumps(PERSISTENCE)}
+        t1 = time.time()
+        proc = subprocess.run(["node", "--max-old-space-size=8192", "-e", script], env=env, cwd=ROOT,
+                              capture_output=True, text=True, timeout=600)
+        wall = time.time() - t1
+        assert proc.returncode == 0, proc.stderr
+        out = json.loads(proc.stdout.strip().splitlines()[-1])
+        rec = out["recovery"]
+        print(f"recovery: {rec['ms']} ms (process wall {wall:.1f}s), users={rec['users']}, "
+              f"snapshotLines={rec['snapshotLines']}, logRecords={rec['logRecords']}, rss={out['rssMb']} MiB")
+        print(f"snapshot rewrite: {out['snapshot']['ms']} ms, {out['snapshot']['lines']} lines")
+
+        assert rec["users"] == USERS
+        assert rec["logRecords"] == LOG_TAIL
+        assert out["fires"] == expected_fires
+        assert out["circulating"] == expected_fires
+        assert rec["ms"] / 1000.0 <= MAX_RECOVERY_S, f"recovery took {rec['ms']} ms"
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    test_memory_recovery_benchmark()
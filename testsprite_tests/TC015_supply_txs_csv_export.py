@@ -0,0 +1,58 @@
+import csv
+import gzip
+import io
+
+import requests
+
+BASE_URL = "http://127.0.0.1:3000"
+ENDPOINT = "/api/economy/supply/txs-db/export.csv"
+HEADERS = {
+    "X-Test-Runner": "testsprite",
+    "User-Agent": "TestSprite",
+}
+TIMEOUT = 30
+CSV_HEADER = ["id", "ts", "type", "amount", "user_ext", "user_id", "event_id", "reference", "actor", "meta"]
+
+
+def read_rows(text):
+    rows = list(csv.reader(io.StringIO(text)))
+    assert rows, "Empty CSV export"
+    assert rows[0] == CSV_HEADER, f"Unexpected CSV header: {rows[0]}"
+    return rows[1:]
+
+
+def test_supply_txs_csv_export():
+    try:
+        # Sin gzip: CSV plano (no debe responder el handler de /supply/txs-db/:id)
+        plain = requests.get(
+            f"{BASE_URL}{ENDPOINT}",
+            headers={**HEADERS, "Accept-Encoding": "identity"},
+            params={"limit": 20, "order": "asc"},
+            timeout=TIMEOUT,
+        )
+        assert plain.status_code == 200, f"Unexpected status code: {plain.status_code} {plain.text[:200]}"
+        assert plain.headers.get("Content-Type", "").startswith("text/csv"), plain.headers.get("Content-Type")
+        assert "supply_txs_export.csv" in plain.headers.get("Content-Disposition", "")
+        rows = read_rows(plain.text)
+        assert len(rows) <= 20, f"limit not honoured: {len(rows)} rows"
+
+        # Con gzip: mismo contenido comprimido en streaming
+        zipped = requests.get(
+            f"{BASE_URL}{ENDPOINT}",
+            headers={**HEADERS, "Accept-Encoding": "gzip"},
+            params={"limit": 20, "order": "asc"},
+            timeout=TIMEOUT,
+            stream=True,
+        )
+        assert zipped.status_code == 200, f"Unexpected status code: {zipped.status_code}"
+        assert zipped.headers.get("Content-Encoding") == "gzip", zipped.headers.get("Content-Encoding")
+        raw = zipped.raw.read(decode_content=False)
+        assert read_rows(gzip.decompress(raw).decode("utf-8")) == rows, "gzip export differs from plain export"
+    except requests.Timeout:
+        assert False, "Request timed out"
+    except requests.RequestException as e:
+        assert False, f"Request failed: {e}"
+
+
+if __name__ == "__main__":
+    test_supply_txs_csv_export()